@@ -0,0 +1,90 @@
+import sys
+import os
+import argparse
+import tempfile
+from geoalt_benchmarks.meshes import SHAPES
+from geoalt_benchmarks.suite import SCALES, FORMATS, run_suite, compare_results, load_results, save_results
+
+def main(argv):
+    '''
+    Command line entry point of the benchmark suite. Returns the exit code: 1 if a phase regressed compared to the baseline, 0 otherwise.
+    '''
+    parser = argparse.ArgumentParser(description="Time every phase of GeoAlt on synthetic models, and compare the timings to a baseline.")
+    parser.add_argument("-s", "--scales", help="Comma separated scales to run: %s. Defaults to 1k,10k,100k." % ",".join(SCALES))
+    parser.add_argument("--shapes", help="Comma separated shapes to run: %s. Defaults to all of them." % ",".join(SHAPES))
+    parser.add_argument("--formats", help="Comma separated input formats to run: ascii, binary. Defaults to both.")
+    parser.add_argument("-r", "--repeat", type=int, help="Amount of runs per case. The fastest time of each phase is kept. Defaults to 3.")
+    parser.add_argument("-i", "--iterations", type=int, help="Max amount of correction iterations per run. Defaults to 5.")
+    parser.add_argument("--seed", type=int, help="Seed of the synthetic models. Defaults to 0.")
+    parser.add_argument("-o", "--output", help="Path of the JSON file to write the results to.")
+    parser.add_argument("-b", "--baseline", help="JSON results of an earlier run to compare the timings to.")
+    parser.add_argument("-t", "--threshold", type=float, help="Relative slowdown of a phase that counts as a regression. Defaults to 0.25.")
+    parser.add_argument("--min_difference", type=float, help="Smallest slowdown of a phase that counts as a regression, in seconds. Defaults to 0.01.")
+    parser.add_argument("--save_baseline", action="store_true", help="Write the results to the --baseline path instead of comparing to it.")
+    parser.add_argument("--workdir", help="Directory to keep the generated models in. Defaults to a directory in the system temp directory.")
+    args = parser.parse_args(argv)
+
+    scales = ["1k", "10k", "100k"]
+    shapes = list(SHAPES)
+    formats = list(FORMATS)
+    repeat = 3
+    iterations = 5
+    seed = 0
+    threshold = 0.25
+    min_difference = 0.01
+    work_dir = os.path.join(tempfile.gettempdir(), "geoalt_benchmark")
+
+    if args.scales:
+        scales = args.scales.lower().split(",")
+        if any(scale not in SCALES for scale in scales):
+            parser.error("No such scale. Can only be %s." % ", ".join(SCALES))
+    if args.shapes:
+        shapes = args.shapes.lower().split(",")
+        if any(shape not in SHAPES for shape in shapes):
+            parser.error("No such shape. Can only be %s." % ", ".join(SHAPES))
+    if args.formats:
+        formats = args.formats.lower().split(",")
+        if any(file_format not in FORMATS for file_format in formats):
+            parser.error("No such format. Can only be ascii or binary.")
+    if args.repeat:
+        repeat = args.repeat
+    if args.iterations:
+        iterations = args.iterations
+    if args.seed:
+        seed = args.seed
+    if args.threshold:
+        threshold = args.threshold
+    if args.min_difference:
+        min_difference = args.min_difference
+    if args.workdir:
+        work_dir = args.workdir
+    if args.save_baseline and not args.baseline:
+        parser.error("--save_baseline requires --baseline.")
+
+    results = run_suite(work_dir, scales=scales, shapes=shapes, formats=formats, repeat=repeat, iterations=iterations, seed=seed)
+
+    if args.output:
+        save_results(args.output, results)
+        print("\nResults written to %s" % args.output)
+
+    if args.baseline is None:
+        return 0
+
+    if args.save_baseline or os.path.exists(args.baseline) is False:
+        save_results(args.baseline, results)
+        print("\nBaseline written to %s" % args.baseline)
+        return 0
+
+    regressions = compare_results(results, load_results(args.baseline), threshold=threshold, min_difference=min_difference)
+    if len(regressions) == 0:
+        print("\nNo regressions compared to %s" % args.baseline)
+        return 0
+
+    print("\n%d regressions compared to %s:" % (len(regressions), args.baseline))
+    for regression in regressions:
+        print("\t%s, %s: %.3f -> %.3f seconds (x%.2f)" % (regression["case"], regression["phase"], regression["baseline"], regression["current"], regression["ratio"]))
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,88 +1,182 @@
 import sys
 import argparse
 from geoalt_algorithms.initiator import search_and_solve
+from geoalt_algorithms.analysis import analyze_model
+from geoalt_algorithms.batch import batch_main
+from geoalt_algorithms.orientation_cache import OrientationCache
 import geoalt_exceptions.exceptions as geoexc
 from geoalt_algorithms.zero_phi_strategy import ZeroPhiStrategy
 
-# Parse command line arguments
-parser = argparse.ArgumentParser()
-parser.add_argument("input", help="Input file path. Needs to be a .stl-file.", type=str)
-parser.add_argument("output", help="Output file path.", type=str)
-parser.add_argument("-i","--imax", type=int, help="Max amount of iterations.")
-parser.add_argument("-ig","--ignore_ground", action="store_true", help="Treat faces touching the ground as unsupported.")
-parser.add_argument("-cd","--convergence_depth", type=int, help="Tolerance of convergence. Higher is more accurate, but will also take more time.")
-parser.add_argument("-a", "--angle", "--phi_min", type=float, help="Minimum overhang angle.")
-parser.add_argument("--plot", action="store_true", help="Plot the processed model.")
-parser.add_argument("--angle_tolerance", type=float, help="Required proximity to phi_min.")
-parser.add_argument("--ground_tolerance", type=float, help="Required proximity to ground to be considered as touching it.")
-parser.add_argument("--no_convergence", action="store_true", help="If used then the algorithm will not stop if nothing changes. Not recommended.")
-parser.add_argument("-ow","--overwrite", action="store_true", help="If used then the output file will be overwritten if it already exists.")
-parser.add_argument("-zps","--zero_phi_strategy", help="Zero Phi Strategy: How to deal with zero phi overhangs. Default is to ignore (None).")
-parser.add_argument("-or", "--orientation", type=float, nargs="+", help="Provide a fixed orientation in which to print the model. Defaults to zero rotation.")
-args = parser.parse_args()
+def main():
+    # Parse command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", help="Input file path. Needs to be a .stl-file.", type=str)
+    parser.add_argument("output", nargs="?", help="Output file path. Not used with --analyze.", type=str)
+    parser.add_argument("-i","--imax", type=int, help="Max amount of iterations.")
+    parser.add_argument("-ig","--ignore_ground", action="store_true", help="Treat faces touching the ground as unsupported.")
+    parser.add_argument("-cd","--convergence_depth", type=int, help="Tolerance of convergence. Higher is more accurate, but will also take more time.")
+    parser.add_argument("-a", "--angle", "--phi_min", type=float, help="Minimum overhang angle.")
+    parser.add_argument("--plot", action="store_true", help="Plot the processed model.")
+    parser.add_argument("--angle_tolerance", type=float, help="Required proximity to phi_min.")
+    parser.add_argument("--ground_tolerance", type=float, help="Required proximity to ground to be considered as touching it.")
+    parser.add_argument("--no_convergence", action="store_true", help="If used then the algorithm will not stop if nothing changes. Not recommended.")
+    parser.add_argument("-ow","--overwrite", action="store_true", help="If used then the output file will be overwritten if it already exists.")
+    parser.add_argument("-of","--output_format", help="Format of the output file: ascii or binary. Defaults to binary for .stlb and ascii for any other extension.")
+    parser.add_argument("--output_precision", type=int, help="Amount of decimals written in ASCII output files. Defaults to 6.")
+    parser.add_argument("-zps","--zero_phi_strategy", help="Zero Phi Strategy: How to deal with zero phi overhangs. Default is to ignore (None).")
+    parser.add_argument("-or", "--orientation", type=float, nargs="+", help="Provide a fixed orientation in which to print the model. Defaults to zero rotation.")
+    parser.add_argument("-om", "--orientation_mode", help="How orientations are sampled during orientation optimization. Either grid (default), sphere or adaptive.")
+    parser.add_argument("--orientation_resolution", type=float, help="Angular step between the sampled orientations, in radians. Defaults to 5 degrees.")
+    parser.add_argument("--orientation_precision", type=float, help="Adaptive orientation mode: Refine until the step is finer than this, in radians. Defaults to 0.25 degrees.")
+    parser.add_argument("--orientation_candidates", type=int, help="Adaptive orientation mode: Amount of best orientations to refine in each step. Defaults to 5.")
+    parser.add_argument("--orientation_budget", type=int, help="Adaptive orientation mode: Maximum amount of orientations to evaluate. Unlimited by default.")
+    parser.add_argument("-w", "--workers", type=int, help="Amount of processes used to evaluate orientations. Defaults to 1.")
+    parser.add_argument("--orientation_bin_size", type=float, help="Score orientations from face normals binned into bins of this angular size, in radians. Faster for finely tessellated models, but approximate. Off by default.")
+    parser.add_argument("--no_pruning", action="store_true", help="Evaluate every orientation rather than skipping the ones that can not make it into the ten best.")
+    parser.add_argument("--no_leak_check", action="store_true", help="Skip the leak check, which runs by default. Saves building the edges of the model when nothing else needs them.")
+    parser.add_argument("--no_cache", action="store_true", help="Do not use or update the orientation cache.")
+    parser.add_argument("--clear_cache", action="store_true", help="Remove all cached orientations before running.")
+    parser.add_argument("--analyze", action="store_true", help="Only report the overhangs of the model, in the fixed orientation if one is given. The file is streamed, so memory use stays constant. No output file is written.")
+    args = parser.parse_args()
 
-# Default parameter values
-max_iterations = 0          # Max iterations of the single face algorithm that all faces pass through
-ignore_ground = False       # Treat lowest known occupied Z-coordinate as ground
-phi_min = 3.1415/4          # The minimum allowed overhang angle
-plot = False                # Plot the model using matplotlib when the process is done
-ground_tolerance = 0.01     # How close a vertex needs to be to the ground in order to be considered as touching it           
-angle_tolerance = 0.017     # How close an angle needs to be to phi_min in order to be considered non-problematic (0.017 rad ~ 1 deg)
-convergence_break = True    # If true, then the algorithm will stop once convergence has been reached (when warning count does not seem to change)
-convergence_depth = 5       # Stop meta-algorithm after the amount of problems hasn't changed for this many iterations
-overwrite = False           # Overwrite the output file.
-zero_phi_strategy = ZeroPhiStrategy.NONE    # Used to select method to deal with flat overhangs.
-fixed_orientation = None    # Used when the user needs the model in a specific orientation.
+    # Default parameter values
+    max_iterations = 0          # Max iterations of the single face algorithm that all faces pass through
+    ignore_ground = False       # Treat lowest known occupied Z-coordinate as ground
+    phi_min = 3.1415/4          # The minimum allowed overhang angle
+    plot = False                # Plot the model using matplotlib when the process is done
+    ground_tolerance = 0.01     # How close a vertex needs to be to the ground in order to be considered as touching it           
+    angle_tolerance = 0.017     # How close an angle needs to be to phi_min in order to be considered non-problematic (0.017 rad ~ 1 deg)
+    convergence_break = True    # If true, then the algorithm will stop once convergence has been reached (when warning count does not seem to change)
+    convergence_depth = 5       # Stop meta-algorithm after the amount of problems hasn't changed for this many iterations
+    overwrite = False           # Overwrite the output file.
+    output_format = None        # Format of the output file. None follows the extension of the output path.
+    output_precision = 6        # Amount of decimals written in ASCII output files.
+    zero_phi_strategy = ZeroPhiStrategy.NONE    # Used to select method to deal with flat overhangs.
+    fixed_orientation = None    # Used when the user needs the model in a specific orientation.
+    orientation_mode = "grid"   # How orientations are sampled during orientation optimization.
+    orientation_resolution = 3.1415/36  # Angular step between the sampled orientations.
+    orientation_precision = 3.1415/720  # Adaptive orientation mode: Target precision of the refinement.
+    orientation_candidates = 5  # Adaptive orientation mode: Amount of candidates refined in each step.
+    orientation_budget = None   # Adaptive orientation mode: Maximum amount of evaluated orientations.
+    workers = 1                 # Amount of processes used to evaluate orientations.
+    check_leaks = True          # Check the model for leaks before processing it.
+    use_cache = True            # Reuse orientations found in earlier runs of the same model and parameters.
+    orientation_pruning = True  # Skip orientations that can not make it into the ten best ones.
+    orientation_bin_size = None # Angular size of the normal bins used to score orientations. None scores every face.
 
-# Check which arguments were specified, and overwrite respective default paramter values
-if args.imax:
-    max_iterations = args.imax
-if args.ignore_ground:
-    ignore_ground = True
-if args.convergence_depth:
-    convergence_depth = args.convergence_depth
-if args.angle:
-    phi_min = args.angle
-if args.plot:
-    plot=True
-if args.ground_tolerance:
-    ground_tolerance = args.ground_tolerance
-if args.angle_tolerance:
-    angle_tolerance = args.angle_tolerance
-if args.no_convergence:
-    convergence_break = False
-if args.overwrite:
-    overwrite = True
-if args.zero_phi_strategy:
-    print("ZERO PHI STRAT: %s" % args.zero_phi_strategy.upper())
-    if args.zero_phi_strategy.upper() == "NONE":
-        zero_phi_strategy = ZeroPhiStrategy.NONE
-    elif args.zero_phi_strategy.upper() == "INJECT":
-        zero_phi_strategy = ZeroPhiStrategy.INJECT
-    else:
-        raise geoexc.InvalidInputArgument("No such zero phi strategy. Can only be none or inject.")
-if args.orientation:
-    if len(args.orientation) != 2:
-        raise geoexc.InvalidInputArgument("--orientation requires two arguments. For example: --orientation 3.14 1.57.")
-    else:
-        fixed_orientation = args.orientation
+    # Check which arguments were specified, and overwrite respective default paramter values
+    if args.imax:
+        max_iterations = args.imax
+    if args.ignore_ground:
+        ignore_ground = True
+    if args.convergence_depth:
+        convergence_depth = args.convergence_depth
+    if args.angle:
+        phi_min = args.angle
+    if args.plot:
+        plot=True
+    if args.ground_tolerance:
+        ground_tolerance = args.ground_tolerance
+    if args.angle_tolerance:
+        angle_tolerance = args.angle_tolerance
+    if args.no_convergence:
+        convergence_break = False
+    if args.overwrite:
+        overwrite = True
+    if args.output_format:
+        if args.output_format.lower() not in ["ascii", "binary"]:
+            raise geoexc.InvalidInputArgument("No such output format. Can only be ascii or binary.")
+        output_format = args.output_format.lower()
+    if args.output_precision is not None:
+        if args.output_precision < 0:
+            raise geoexc.InvalidInputArgument("--output_precision can not be negative.")
+        output_precision = args.output_precision
+    if args.zero_phi_strategy:
+        print("ZERO PHI STRAT: %s" % args.zero_phi_strategy.upper())
+        if args.zero_phi_strategy.upper() == "NONE":
+            zero_phi_strategy = ZeroPhiStrategy.NONE
+        elif args.zero_phi_strategy.upper() == "INJECT":
+            zero_phi_strategy = ZeroPhiStrategy.INJECT
+        else:
+            raise geoexc.InvalidInputArgument("No such zero phi strategy. Can only be none or inject.")
+    if args.orientation:
+        if len(args.orientation) != 2:
+            raise geoexc.InvalidInputArgument("--orientation requires two arguments. For example: --orientation 3.14 1.57.")
+        else:
+            fixed_orientation = args.orientation
+    if args.orientation_mode:
+        if args.orientation_mode.lower() not in ["grid", "sphere", "adaptive"]:
+            raise geoexc.InvalidInputArgument("No such orientation mode. Can only be grid, sphere or adaptive.")
+        orientation_mode = args.orientation_mode.lower()
+    if args.orientation_resolution:
+        orientation_resolution = args.orientation_resolution
+    if args.orientation_precision:
+        orientation_precision = args.orientation_precision
+    if args.orientation_candidates:
+        orientation_candidates = args.orientation_candidates
+    if args.orientation_budget:
+        orientation_budget = args.orientation_budget
+    if args.workers:
+        if args.workers < 1:
+            raise geoexc.InvalidInputArgument("--workers needs to be at least 1.")
+        workers = args.workers
+    if args.orientation_bin_size:
+        orientation_bin_size = args.orientation_bin_size
+    if args.no_pruning:
+        orientation_pruning = False
+    if args.no_leak_check:
+        check_leaks = False
+    if args.no_cache:
+        use_cache = False
+    if args.clear_cache:
+        OrientationCache().clear()
 
+    if args.output is None and args.analyze is False:
+        parser.error("the output path is required unless --analyze is used")
 
-# Run the algorithm
-try:
-    search_and_solve(args.input, args.output, 
-    max_iterations=max_iterations, 
-    ignore_ground=ignore_ground, 
-    convergence_depth=convergence_depth, 
-    phi_min=phi_min, 
-    plot=plot,
-    ground_tolerance=ground_tolerance,
-    angle_tolerance=angle_tolerance,
-    convergence_break=convergence_break,
-    overwrite_output=overwrite,
-    zero_phi_strategy=zero_phi_strategy,
-    fixed_orientation=fixed_orientation)
-except geoexc.InputFileNotFound:
-    print("Input file could not be found (%s). Please control the path provided" % args.input)
-except geoexc.OutputFileExists:
-    print("Output path (%s) is already occupied by another file. Please change the provided path." % args.output)
+
+    # Run the algorithm
+    try:
+        if args.analyze:
+            analyze_model(args.input,
+            phi_min=phi_min,
+            ignore_ground=ignore_ground,
+            ground_tolerance=ground_tolerance,
+            angle_tolerance=angle_tolerance,
+            orientation=fixed_orientation)
+        else:
+            search_and_solve(args.input, args.output, 
+            max_iterations=max_iterations, 
+            ignore_ground=ignore_ground, 
+            convergence_depth=convergence_depth, 
+            phi_min=phi_min, 
+            plot=plot,
+            ground_tolerance=ground_tolerance,
+            angle_tolerance=angle_tolerance,
+            convergence_break=convergence_break,
+            overwrite_output=overwrite,
+            output_format=output_format,
+            output_precision=output_precision,
+            zero_phi_strategy=zero_phi_strategy,
+            fixed_orientation=fixed_orientation,
+            orientation_mode=orientation_mode,
+            orientation_resolution=orientation_resolution,
+            orientation_precision=orientation_precision,
+            orientation_candidates=orientation_candidates,
+            orientation_budget=orientation_budget,
+            workers=workers,
+            check_leaks=check_leaks,
+            use_cache=use_cache,
+            orientation_bin_size=orientation_bin_size,
+            orientation_pruning=orientation_pruning)
+    except geoexc.InputFileNotFound:
+        print("Input file could not be found (%s). Please control the path provided" % args.input)
+    except geoexc.OutputFileExists:
+        print("Output path (%s) is already occupied by another file. Please change the provided path." % args.output)
+
+
+if __name__ == "__main__":
+    # "geoalt.py batch ..." processes many files at once, and has its own arguments.
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        sys.exit(batch_main(sys.argv[2:]))
+    main()
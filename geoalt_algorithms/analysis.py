@@ -0,0 +1,91 @@
+from timeit import default_timer as timer
+import os
+import numpy as np
+
+from geoalt_geometry.faces import evaluate_faces, FLAT_ANGLE
+from geoalt_stl.stl_parser import STLfile, rotation_matrix, BINARY_CHUNK_SIZE
+import geoalt_exceptions.exceptions as geoexc
+
+def rotate_corners(corners, orientation):
+    '''
+    Rotate an (F x 3 x 3) corner array around the X axis and then around the Y axis, the same way as STLfile.rotate does.
+    '''
+    points = np.asarray(corners, dtype=np.float64).reshape(-1, 3)
+    if orientation is not None:
+        points = np.dot(rotation_matrix(orientation[0], 'x'), points.T).T
+        points = np.dot(rotation_matrix(orientation[1], 'y'), points.T).T
+    return points.reshape(-1, 3, 3)
+
+def analyze_model(model_path,
+    phi_min = np.pi/4,          # Smallest allowed angle of overhang
+    ignore_ground = False,      # Treat faces touching the ground as unsupported
+    ground_tolerance = 0.01,    # How close a vertex needs to be to the ground in order to be considered to be touching it.
+    angle_tolerance = 0.017,    # How close an angle needs to be to phi_min in order to be considered to be acceptable.
+    orientation = None,         # Rotation [x, y] (radians) to analyze the model in. None analyzes it as stored.
+    chunk_size = BINARY_CHUNK_SIZE):    # Amount of facets of binary files read at a time
+    '''
+    Report the overhangs of a model without correcting it. The file is streamed twice in fixed-size chunks:
+    once to find the ground level, and once to classify the faces like FaceCollection.check_for_problems does.
+    No mesh or topology is built, so memory use does not depend on the size of the file. Since corners are not welded,
+    the totals can differ slightly from those of the loaded model when the file holds corners that are nearly, but not exactly, equal.\n
+    Returns a dict with the facet count, ground level, warning count, overhang area, total weight and grounded flag.
+    '''
+    if os.path.exists(model_path) is False:
+        raise geoexc.InputFileNotFound("Selected model does not exist")
+
+    time_start = timer()
+    stl = STLfile(model_path)
+
+    # First pass: The lowest Z-coordinate is the ground level.
+    print("Finding the ground level..")
+    ground_level = np.inf
+    facet_count = 0
+    for _, corners in stl.iter_facets(chunk_size):
+        ground_level = min(ground_level, rotate_corners(corners, orientation)[:, :, 2].min())
+        facet_count += len(corners)
+
+    if facet_count == 0:
+        raise geoexc.InvalidSTLFile("No facets could be found in the STL file.")
+
+    time_ground_level = timer()
+
+    # Second pass: Classify the faces chunk by chunk, and only keep the totals.
+    print("Analyzing %d facets.." % facet_count)
+    warning_count = 0
+    overhang_area = 0.0
+    total_weight = 0.0
+    grounded = False
+    for _, corners in stl.iter_facets(chunk_size):
+        triangles = rotate_corners(corners, orientation)
+        _, angles, face_grounded, bad, weights = evaluate_faces(triangles, phi_min=phi_min, ignore_grounded=ignore_ground, ground_level=ground_level, ground_tolerance=ground_tolerance, angle_tolerance=angle_tolerance)
+
+        warning_count += int(np.count_nonzero(bad))
+        bad_triangles = triangles[bad]
+        overhang_area += float(np.sum(np.linalg.norm(np.cross(bad_triangles[:, 1] - bad_triangles[:, 0], bad_triangles[:, 2] - bad_triangles[:, 0]), axis=1))/2)
+
+        # Continue the running sum, so that the total is the same as the one of FaceCollection.check_for_problems.
+        total_weight = float(np.cumsum(np.concatenate([[total_weight], weights]))[-1])
+        grounded = grounded or bool(np.any(face_grounded & (angles < FLAT_ANGLE)))
+
+    time_analysis = timer()
+
+    print("\nAnalysis of %s:" % os.path.basename(model_path))
+    print("\tFacet count: %d" % facet_count)
+    print("\tGround level: %f" % ground_level)
+    print("\tOverhang surfaces: %d" % warning_count)
+    print("\tOverhang area: %f" % overhang_area)
+    print("\tTotal weight: %.2f" % total_weight)
+    print("\tGrounded: %s" % ('yes' if grounded else 'no'))
+
+    print("\nPerformance:")
+    print("Found the ground level in %.2f seconds" % (time_ground_level-time_start))
+    print("Analyzed the faces in %.2f seconds" % (time_analysis-time_ground_level))
+
+    return {
+        "facets": facet_count,
+        "ground_level": float(ground_level),
+        "warnings": warning_count,
+        "overhang_area": overhang_area,
+        "total_weight": total_weight,
+        "grounded": grounded
+    }
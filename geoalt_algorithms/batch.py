@@ -0,0 +1,336 @@
+import argparse
+import collections
+import contextlib
+import glob
+import itertools
+import json
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import traceback
+from timeit import default_timer as timer
+import numpy as np
+
+from geoalt_algorithms.initiator import search_and_solve
+from geoalt_algorithms.zero_phi_strategy import ZeroPhiStrategy
+import geoalt_exceptions.exceptions as geoexc
+
+# Name of the file in the output directory that collects the results of all jobs of a batch.
+BATCH_SUMMARY_NAME = "batch_summary.json"
+
+def collect_inputs(source):
+    '''
+    Find the STL files of a batch. source is either a directory (all of its .stl files), a manifest file
+    (one path per line, relative to the manifest, with # starting a comment) or a glob pattern.
+    Returns the paths in a stable order.
+    '''
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, name) for name in os.listdir(source) if name.lower().endswith(".stl"))
+
+    if os.path.isfile(source) and source.lower().endswith(".stl") is False:
+        base = os.path.dirname(os.path.abspath(source))
+        paths = []
+        with open(source, 'r') as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line != "":
+                    paths.append(line if os.path.isabs(line) else os.path.join(base, line))
+        return paths
+
+    return sorted(glob.glob(source))
+
+def plan_jobs(inputs, output_dir):
+    '''
+    Create one job per input file, with the output model, summary and log paths in output_dir.
+    Inputs that share a file name get a numbered suffix, so that no two jobs write to the same files.
+    Raises InvalidInputArgument if a job would still write over an input file, another job's files or the batch summary.
+    '''
+    jobs = []
+    # The summary of the whole batch lives next to the job summaries, so its name is never given to a job.
+    used = {os.path.splitext(BATCH_SUMMARY_NAME)[0].lower()}
+    for path in inputs:
+        stem, extension = os.path.splitext(os.path.basename(path))
+        name = stem
+        number = 2
+        while name.lower() in used:
+            name = "%s_%d" % (stem, number)
+            number += 1
+        used.add(name.lower())
+
+        jobs.append({
+            "input": path,
+            "output": os.path.join(output_dir, name + extension),
+            "summary": os.path.join(output_dir, name + ".json"),
+            "log": os.path.join(output_dir, name + ".log")
+        })
+
+    # Extensions are kept as they are, so an input like "model.json" could still collide with the files of another job.
+    written = {}
+    input_paths = {os.path.normcase(os.path.abspath(job["input"])) for job in jobs}
+    reserved = os.path.normcase(os.path.abspath(os.path.join(output_dir, BATCH_SUMMARY_NAME)))
+    for job in jobs:
+        for key in ["output", "summary", "log"]:
+            path = os.path.normcase(os.path.abspath(job[key]))
+            if path in input_paths:
+                raise geoexc.InvalidInputArgument("%s would overwrite the input file %s. Choose another output directory." % (key.capitalize(), job[key]))
+            if path == reserved:
+                raise geoexc.InvalidInputArgument("The %s of %s would overwrite %s." % (key, job["input"], BATCH_SUMMARY_NAME))
+            if path in written:
+                raise geoexc.InvalidInputArgument("The %s of %s and the %s of %s would both be written to %s." % (written[path][1], written[path][0], key, job["input"], job[key]))
+            written[path] = (job["input"], key)
+    return jobs
+
+def run_job(job, options):
+    '''
+    Run search_and_solve on a single job. Everything it prints goes to the log file of the job.\n
+    Returns the result of the job. Errors are part of the result, and never raised.
+    '''
+    result = {"input": job["input"], "output": job["output"], "status": "ok", "error": None, "duration": 0, "summary": None}
+    time_start = timer()
+    with open(job["log"], 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            result["summary"] = search_and_solve(job["input"], job["output"], plot=False, **options)
+        except Exception as e:
+            traceback.print_exc()
+            result["status"] = "failed"
+            result["error"] = "%s: %s" % (type(e).__name__, e)
+    result["duration"] = timer() - time_start
+    return result
+
+def batch_worker(tasks, results, options):
+    '''
+    Worker process of a batch. Runs the jobs it receives on its tasks connection until it receives None,
+    and sends the result of each one on its results connection.
+    '''
+    while True:
+        task = tasks.recv()
+        if task is None:
+            return
+        index, job = task
+        results.send((index, run_job(job, options)))
+
+def run_batch(jobs, options, processes=1, timeout=None, verbose=True):
+    '''
+    Run the jobs across a pool of worker processes. options are passed on to search_and_solve.\n
+    Every worker is handed a single job at a time, so it is always known which job a worker is running.
+    Workers get their own pipes for jobs and results. Unlike a shared queue, a worker that dies can not leave
+    a lock or a half written message behind for the others.\n
+    A job that takes longer than timeout seconds is stopped, and its worker is replaced. A job whose worker dies is marked as failed.
+    A job that fails or times out does not affect the others. The result of every job is written to its summary file as soon as it is known.\n
+    Returns the results of all jobs, in job order.
+    '''
+    pending = collections.deque(range(0, len(jobs)))
+
+    workers = {}        # Worker id: (process, task connection, result connection)
+    running = {}        # Worker id: (job index, start time)
+    finished = [None]*len(jobs)
+    worker_ids = itertools.count()
+
+    def dispatch(worker_id):
+        # Hand the next job to an idle worker, or let it exit when there is nothing left to do.
+        tasks = workers[worker_id][1]
+        try:
+            if len(pending) == 0:
+                tasks.send(None)
+                return
+            index = pending[0]
+            tasks.send((index, jobs[index]))
+            running[worker_id] = (pending.popleft(), timer())
+        except OSError:
+            pass    # The worker is gone. The job stays pending, and the worker is replaced when it is reaped.
+
+    def start_worker():
+        worker_id = next(worker_ids)
+        task_receiver, task_sender = multiprocessing.Pipe(duplex=False)
+        result_receiver, result_sender = multiprocessing.Pipe(duplex=False)
+        worker = multiprocessing.Process(target=batch_worker, args=(task_receiver, result_sender, options))
+        worker.start()
+        # Only the worker keeps its own ends of the pipes.
+        task_receiver.close()
+        result_sender.close()
+        workers[worker_id] = (worker, task_sender, result_receiver)
+        dispatch(worker_id)
+
+    def receive(worker_id, next_job=True):
+        # Read the result of a worker if there is one, and hand it the next job. Results of jobs that already timed out are ignored.
+        try:
+            index, result = workers[worker_id][2].recv()
+        except (EOFError, OSError):
+            return
+        if running.get(worker_id, (None, None))[0] == index:
+            del running[worker_id]
+            finish(index, result)
+            if next_job is True:
+                dispatch(worker_id)
+
+    def finish(index, result):
+        finished[index] = result
+        write_json(jobs[index]["summary"], result)
+        if verbose is True:
+            print_job_result(len(jobs) - finished.count(None), len(jobs), result)
+
+    def failure(index, status, error, started):
+        return {"input": jobs[index]["input"], "output": jobs[index]["output"], "status": status, "error": error, "duration": timer() - started, "summary": None}
+
+    try:
+        for _ in range(0, min(processes, len(jobs))):
+            start_worker()
+
+        while None in finished:
+            connections = {connection: worker_id for worker_id, (_, _, connection) in workers.items()}
+            for connection in wait(list(connections), timeout=0.1):
+                receive(connections[connection])
+
+            # Stop jobs that ran out of time, and replace workers that are gone.
+            for worker_id, (worker, tasks, results) in list(workers.items()):
+                index, started = running.get(worker_id, (None, None))
+                timed_out = index is not None and timeout is not None and timer() - started > timeout
+                if timed_out is False and worker.is_alive():
+                    continue
+
+                # A worker may have sent its result right before it exited.
+                if timed_out is False and results.poll():
+                    receive(worker_id, next_job=False)
+                    index, started = running.get(worker_id, (None, None))
+
+                worker.terminate()
+                worker.join()
+                tasks.close()
+                results.close()
+                del workers[worker_id]
+                running.pop(worker_id, None)
+                if index is not None:
+                    if timed_out is True:
+                        finish(index, failure(index, "timeout", "Stopped after %g seconds." % timeout, started))
+                    else:
+                        finish(index, failure(index, "failed", "The worker process exited with code %s." % worker.exitcode, started))
+                if len(pending) > 0:
+                    start_worker()
+
+        for worker, _, _ in workers.values():
+            worker.join()
+    finally:
+        for worker, _, _ in workers.values():
+            if worker.is_alive():
+                worker.terminate()
+
+    return finished
+
+def print_job_result(done, total, result):
+    name = os.path.basename(result["input"])
+    if result["status"] == "ok":
+        summary = result["summary"]
+        print("[%d/%d] %s: ok in %.2f seconds. Warnings: %d -> %d" % (done, total, name, result["duration"], summary["warnings_before"], summary["warnings_after"]))
+    else:
+        print("[%d/%d] %s: %s. %s" % (done, total, name, result["status"], result["error"]))
+
+def write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, default=to_json)
+
+def to_json(value):
+    '''
+    Convert the numpy values of a summary into plain Python values.
+    '''
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError("%s is not JSON serializable" % type(value).__name__)
+
+def batch_main(argv):
+    '''
+    Command line entry point of "geoalt.py batch". Returns the exit code: 0 if every job succeeded, 1 otherwise.
+    '''
+    parser = argparse.ArgumentParser(prog="geoalt.py batch", description="Process many STL files across a pool of worker processes.")
+    parser.add_argument("source", help="A directory of .stl-files, a manifest file listing one path per line, or a glob pattern.", type=str)
+    parser.add_argument("output_dir", help="Directory for the altered models, and the summary and log of every file.", type=str)
+    parser.add_argument("-j", "--jobs", type=int, help="Amount of files processed at the same time. Defaults to 1.")
+    parser.add_argument("-t", "--timeout", type=float, help="Stop a file after this many seconds. No limit by default.")
+    parser.add_argument("-i","--imax", type=int, help="Max amount of iterations.")
+    parser.add_argument("-ig","--ignore_ground", action="store_true", help="Treat faces touching the ground as unsupported.")
+    parser.add_argument("-cd","--convergence_depth", type=int, help="Tolerance of convergence. Higher is more accurate, but will also take more time.")
+    parser.add_argument("-a", "--angle", "--phi_min", type=float, help="Minimum overhang angle.")
+    parser.add_argument("--angle_tolerance", type=float, help="Required proximity to phi_min.")
+    parser.add_argument("--ground_tolerance", type=float, help="Required proximity to ground to be considered as touching it.")
+    parser.add_argument("-ow","--overwrite", action="store_true", help="Overwrite altered models that already exist in the output directory.")
+    parser.add_argument("-of","--output_format", help="Format of the output files: ascii or binary. Defaults to binary for .stlb and ascii for any other extension.")
+    parser.add_argument("-zps","--zero_phi_strategy", help="Zero Phi Strategy: How to deal with zero phi overhangs. Default is to ignore (None).")
+    parser.add_argument("-or", "--orientation", type=float, nargs="+", help="Provide a fixed orientation in which to print the models.")
+    parser.add_argument("-om", "--orientation_mode", help="How orientations are sampled during orientation optimization. Either grid (default), sphere or adaptive.")
+    parser.add_argument("--orientation_resolution", type=float, help="Angular step between the sampled orientations, in radians. Defaults to 5 degrees.")
+    parser.add_argument("-w", "--workers", type=int, help="Amount of processes used to evaluate the orientations of each file. Defaults to 1.")
+    parser.add_argument("--no_leak_check", action="store_true", help="Skip the leak check, which runs on every model by default.")
+    parser.add_argument("--no_cache", action="store_true", help="Do not use or update the orientation cache.")
+    args = parser.parse_args(argv)
+
+    # Options passed on to search_and_solve. Anything not given keeps its default.
+    options = {"max_iterations": 0}
+    if args.imax:
+        options["max_iterations"] = args.imax
+    if args.ignore_ground:
+        options["ignore_ground"] = True
+    if args.convergence_depth:
+        options["convergence_depth"] = args.convergence_depth
+    if args.angle:
+        options["phi_min"] = args.angle
+    if args.angle_tolerance:
+        options["angle_tolerance"] = args.angle_tolerance
+    if args.ground_tolerance:
+        options["ground_tolerance"] = args.ground_tolerance
+    if args.overwrite:
+        options["overwrite_output"] = True
+    if args.output_format:
+        if args.output_format.lower() not in ["ascii", "binary"]:
+            raise geoexc.InvalidInputArgument("No such output format. Can only be ascii or binary.")
+        options["output_format"] = args.output_format.lower()
+    if args.zero_phi_strategy:
+        if args.zero_phi_strategy.upper() == "NONE":
+            options["zero_phi_strategy"] = ZeroPhiStrategy.NONE
+        elif args.zero_phi_strategy.upper() == "INJECT":
+            options["zero_phi_strategy"] = ZeroPhiStrategy.INJECT
+        else:
+            raise geoexc.InvalidInputArgument("No such zero phi strategy. Can only be none or inject.")
+    if args.orientation:
+        if len(args.orientation) != 2:
+            raise geoexc.InvalidInputArgument("--orientation requires two arguments. For example: --orientation 3.14 1.57.")
+        options["fixed_orientation"] = args.orientation
+    if args.orientation_mode:
+        if args.orientation_mode.lower() not in ["grid", "sphere", "adaptive"]:
+            raise geoexc.InvalidInputArgument("No such orientation mode. Can only be grid, sphere or adaptive.")
+        options["orientation_mode"] = args.orientation_mode.lower()
+    if args.orientation_resolution:
+        options["orientation_resolution"] = args.orientation_resolution
+    if args.workers:
+        if args.workers < 1:
+            raise geoexc.InvalidInputArgument("--workers needs to be at least 1.")
+        options["workers"] = args.workers
+    if args.no_leak_check:
+        options["check_leaks"] = False
+    if args.no_cache:
+        options["use_cache"] = False
+
+    processes = 1
+    if args.jobs:
+        if args.jobs < 1:
+            raise geoexc.InvalidInputArgument("--jobs needs to be at least 1.")
+        processes = args.jobs
+
+    inputs = collect_inputs(args.source)
+    if len(inputs) == 0:
+        print("No STL files found in %s." % args.source)
+        return 1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    jobs = plan_jobs(inputs, args.output_dir)
+
+    print("Processing %d files with %d processes.." % (len(jobs), processes))
+    time_start = timer()
+    results = run_batch(jobs, options, processes=processes, timeout=args.timeout)
+    duration = timer() - time_start
+
+    failures = sum(r["status"] != "ok" for r in results)
+    write_json(os.path.join(args.output_dir, BATCH_SUMMARY_NAME), {"duration": duration, "files": len(results), "failures": failures, "results": results})
+
+    print("\nProcessed %d files in %.2f seconds. %d succeeded, %d failed." % (len(results), duration, len(results) - failures, failures))
+    return 0 if failures == 0 else 1
@@ -8,8 +8,11 @@ from mpl_toolkits.mplot3d import Axes3D
 import ntpath
 import os
 
-from geoalt_geometry.faces import FaceCollection
-from geoalt_algorithms.problemsolver import single_face_algorithm
+from geoalt_geometry.faces import FaceCollection, FLAT_ANGLE
+from geoalt_geometry.edges import check_manifold
+from geoalt_algorithms.problemsolver import single_face_algorithm, batch_single_face_algorithm
+from geoalt_algorithms.orientation import OrientationEvaluator, BinnedOrientationEvaluator, rotation_matrices, grid_orientations, sphere_orientations, adaptive_search, pruned_search, direction_to_rotation
+from geoalt_algorithms.orientation_cache import OrientationCache
 from geoalt_algorithms.zero_phi_strategy import ZeroPhiStrategy
 from geoalt_stl.stl_creator import STLCreator
 from geoalt_stl.stl_parser import STLfile
@@ -23,6 +26,19 @@ def print_stl_information(stl):
     print("\tPoint count: %d" % len(stl.vertices))
     print("\tGround level: %d" % stl.ground_level)
 
+def print_manifold_report(report):
+    if report["boundary"] == 0 and report["non_manifold"] == 0:
+        print("No leaks detected. All %d edges are shared by exactly two faces." % report["edges"])
+        return
+
+    print("POTENTIAL LEAK DETECTED! %d of %d edges are not shared by exactly two faces:" % (report["boundary"] + report["non_manifold"], report["edges"]))
+    print("\tBoundary edges (one face): %d" % report["boundary"])
+    for x, y, z in report["boundary_samples"]:
+        print("\t\tat (%.3f, %.3f, %.3f)" % (x, y, z))
+    print("\tNon-manifold edges (more than two faces): %d" % report["non_manifold"])
+    for x, y, z in report["non_manifold_samples"]:
+        print("\t\tat (%.3f, %.3f, %.3f)" % (x, y, z))
+
 def plot_model(face_collection):
     # Create new empty plot
     fig = plt.figure()
@@ -72,61 +88,72 @@ def display_best_orientations(res, wei):
         else:
             break
 
-def orientation_optimization(stl, facecol, ignore_grounded, ground_level, ground_tolerance, phi_min, angle_tolerance, grounded_only):
+def orientation_optimization(stl, facecol, ignore_grounded, ground_level, ground_tolerance, phi_min, angle_tolerance, grounded_only, mode="grid", resolution=np.pi/36,
+    precision=np.pi/720, candidates=5, max_evaluations=None, workers=1, bin_size=None, prune=True):
     '''
     This method is used to rotate the model into different orientations .
-    This is done to aid in finding the orientation most suitable for printing
+    This is done to aid in finding the orientation most suitable for printing.
+    All orientations are scored without rotating the model. Only the best one is applied.\n
+    mode: "grid" sweeps the X and Y rotations from 0 to 180 degrees. "sphere" spreads the build directions evenly over the hemisphere that the grid covers, with about a third fewer evaluations.
+    "adaptive" starts out like "sphere" and then repeatedly refines the search around the best candidates.\n
+    resolution: Angular step between the orientations, in radians.\n
+    precision, candidates, max_evaluations: Only used by the adaptive mode. Refinement stops once the step is finer than precision (radians)
+    or once max_evaluations orientations have been evaluated. The surroundings of the best candidates are refined in each step.\n
+    workers: Amount of processes that the orientations are evaluated in.\n
+    bin_size: If set, orientations are scored from the face normals binned into bins of this angular size (radians) rather than from every face.
+    Much faster for finely tessellated models, but approximate. Always evaluated in a single process.\n
+    prune: Skip the grid or sphere orientations that can not make it into the ten best ones (branch and bound).
+    The ten best orientations are the same as without pruning. Not used together with bin_size.\n
+    Returns the row (Xrot, Yrot, Weight, Grounded) of the chosen orientation.
     '''
     print("Performing orientation optimization..")
-    # Find optimal orientation
-    iterations_per_axis = 37
-    optimization_results = np.zeros([iterations_per_axis**2,4])
-
-    for i in range(0, iterations_per_axis):
-        degx = np.pi/180*5*i
-        
-        # Rotate around X Axis
-        stl.rotate(degx, axis='x')
-        angular_step_size = np.pi/180*5
-        degy = 0
-
-        for j in range(0, iterations_per_axis):
-
-            # Rotate around y axis
-            stl.rotate(degy, axis='y')
-            ground_level = stl.ground_level
-            facecol.check_for_problems(ignore_grounded=ignore_grounded, ground_level=ground_level, ground_tolerance=ground_tolerance, phi_min=phi_min, angle_tolerance=angle_tolerance)
-            optimization_results[(i*iterations_per_axis)+j] = [degx, angular_step_size*j, facecol.total_weight, int(stl.grounded)]
-            degy = angular_step_size
-        
-        # Reset y
-        stl.rotate(-1*angular_step_size*(iterations_per_axis-1), axis='y')
+    if bin_size is None:
+        evaluator = OrientationEvaluator(facecol.mesh, phi_min=phi_min, ground_tolerance=ground_tolerance, workers=workers)
+    else:
+        evaluator = BinnedOrientationEvaluator(facecol.mesh, phi_min=phi_min, ground_tolerance=ground_tolerance, bin_size=bin_size)
+        print("Binned %d faces into %d normal bins.." % (len(facecol.mesh.faces), len(evaluator.bin_cross)))
 
-        # Reset rotation
-        stl.rotate(-degx, axis='x')
+    # Find optimal orientation
+    if mode == "grid" or mode == "sphere":
+        if mode == "grid":
+            x_angles, y_angles = grid_orientations(resolution)
+        else:
+            x_angles, y_angles = sphere_orientations(resolution)
 
-        percentage_done = ((i+1)/iterations_per_axis) * 100
-        print("%.2f%%" % percentage_done, end='\r', flush=True)
+        if prune is True and bin_size is None and phi_min <= np.pi/2 - FLAT_ANGLE:
+            print("Searching %d orientations.." % len(x_angles))
+            evaluated, weights, grounded = pruned_search(evaluator, rotation_matrices(x_angles, y_angles)[:, 2, :], grounded_only=grounded_only, verbose=True)
+            x_angles, y_angles = x_angles[evaluated], y_angles[evaluated]
+            print("Evaluated %d orientations.." % len(x_angles))
+        else:
+            print("Evaluating %d orientations.." % len(x_angles))
+            weights, grounded = evaluator.evaluate(rotation_matrices(x_angles, y_angles), verbose=True)
+    elif mode == "adaptive":
+        directions, weights, grounded = adaptive_search(evaluator, resolution=resolution, precision=precision, candidates=candidates,
+            max_evaluations=max_evaluations, grounded_only=grounded_only, verbose=True)
+        x_angles, y_angles = direction_to_rotation(directions)
+        print("Evaluated %d orientations.." % len(x_angles))
+    else:
+        raise geoexc.InvalidInputArgument("No such orientation mode. Can only be grid, sphere or adaptive.")
+    optimization_results = np.column_stack([x_angles, y_angles, weights, grounded.astype(int)])
 
     print("Done!", flush=True, end="\r")
 
     if grounded_only is True:
-        count = np.count_nonzero(optimization_results[:,3])
-        grounded_results = np.zeros([count,4])
-        j = 0
-        for i in range(0, len(optimization_results)):
-            if optimization_results[i,3] == 1:
-                grounded_results[j,:] = optimization_results[i,:]
-                j += 1
-        optimization_results = grounded_results
+        if np.any(grounded):
+            optimization_results = optimization_results[grounded]
+        else:
+            print("No grounded orientation was found. Considering all orientations.")
                 
     weights = optimization_results[:,2]
-    weights_ordered_indices = np.argsort(weights)
+    weights_ordered_indices = np.argsort(weights, kind='stable')
     display_best_orientations(optimization_results, weights_ordered_indices)
 
     stl.rotate(optimization_results[weights_ordered_indices[0],0], axis='x')
     stl.rotate(optimization_results[weights_ordered_indices[0],1], axis='y')
 
+    return optimization_results[weights_ordered_indices[0]]
+
 def search_and_solve(model_path, altered_model_path, 
     phi_min = np.pi/4,          # Smallest allowed angle of overhang
     ignore_ground = False,      # Setting this to False results in rendering issues when using matplotlib 3d plotting.
@@ -137,10 +164,29 @@ def search_and_solve(model_path, altered_model_path,
     max_iterations = 2000,      # The maximum amount of iterations before the problem correction algorithm stops.
     plot = True,                # Plot using matplotlib after the process is finished
     overwrite_output = False,   # Overwrite target output file if it already exists
+    output_format = None,       # Format of the output file: "ascii" or "binary". None follows the extension of the output path.
+    output_precision = 6,       # Amount of decimals of the coordinates in ASCII output files
     zero_phi_strategy = ZeroPhiStrategy.NONE,   # Strategy for dealing with flat overhangs
     fixed_orientation = None,   # Pre-specified orientation
-    ignore_rot_opt = False,
-    grounded_only = False):    # Skip orientation optimization (rotation optimization) step
+    ignore_rot_opt = False,     # Skip orientation optimization (rotation optimization) step
+    grounded_only = False,      # Only consider orientations in which the model touches the ground
+    orientation_mode = "grid",  # How orientations are sampled: "grid", "sphere" or "adaptive"
+    orientation_resolution = np.pi/36,  # Angular step between the sampled orientations, in radians
+    orientation_precision = np.pi/720,  # Adaptive mode: Stop refining once the step is finer than this, in radians
+    orientation_candidates = 5,         # Adaptive mode: How many of the best orientations are refined in each step
+    orientation_budget = None,          # Adaptive mode: Maximum amount of orientations to evaluate. None means no limit.
+    workers = 1,                # Amount of processes used to evaluate orientations
+    orientation_bin_size = None,    # Score orientations from face normals binned into bins of this size (radians). None scores every face.
+    orientation_pruning = True, # Skip orientations that can not make it into the ten best ones
+    check_leaks = True,         # Look for edges that are not shared by exactly two faces. Builds the edge table of the model.
+    use_cache = True,           # Reuse the result of an earlier orientation optimization of the same model and parameters
+    cache_dir = None):          # Location of the orientation cache. None means the default location.
+    '''
+    Load a model, orient it, correct its overhangs and save the result to altered_model_path.\n
+    Returns a summary of the run: warning counts before and after the correction, the amount of iterations,
+    the chosen orientation, the leak check report, the time spent in each phase and in each correction iteration (in seconds).
+    Loading is split into parsing the file, welding the mesh and building its edges for the leak check.
+    '''
 
     # Check if model exists
     check_paths(model_path, altered_model_path, overwrite_output)
@@ -149,50 +195,92 @@ def search_and_solve(model_path, altered_model_path,
     # Load the model into memory
     print("Loading the model..")
     stl = STLfile(model_path)
-    faces = stl.load()
+    normals, corners = stl.read_facets()
+    time_parsed = timer()
+    faces = stl.build_face_collection(normals, corners)
+    time_welded = timer()
 
     # Extract lowest Z to use as ground level (if ignore_ground is set to False).
     ground_level=stl.ground_level
     print_stl_information(stl)
 
-    # Check for leaks
-    for e in faces.edge_collection:
-        if len(e.faces) != 2:
-            print("POTENTIAL LEAK DETECTED! Bad Edge hash function, or leaking model")
+    # Check for leaks. This builds the edge table of the model.
+    manifold_report = None
+    if check_leaks is True:
+        manifold_report = check_manifold(faces.mesh)
+        print_manifold_report(manifold_report)
 
     time_model_loaded = timer()
 
+    # Look for the result of an earlier orientation optimization. A hit is applied as a fixed orientation.
+    cache = None
+    if fixed_orientation is None and ignore_rot_opt is False and use_cache is True:
+        cache = OrientationCache(cache_dir)
+        cache_key = cache.key(faces.mesh,
+            phi_min=phi_min,
+            ground_tolerance=ground_tolerance,
+            grounded_only=grounded_only,
+            mode=orientation_mode,
+            resolution=orientation_resolution,
+            precision=orientation_precision if orientation_mode == "adaptive" else None,
+            candidates=orientation_candidates if orientation_mode == "adaptive" else None,
+            budget=orientation_budget if orientation_mode == "adaptive" else None,
+            bin_size=orientation_bin_size)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print("Using cached orientation:\t Xrot = %.2f,\t Yrot = %.2f,\t Weight = %.2f. Grounded: %s" % (cached["x"]*180/np.pi, cached["y"]*180/np.pi, cached["weight"], 'yes' if cached["grounded"] else 'no'))
+            fixed_orientation = [cached["x"], cached["y"]]
+            cache = None
+
     # Optimize the model for the best possible orientation
     if fixed_orientation is not None:
         ignore_rot_opt = True
 
     if ignore_rot_opt is False:
-        orientation_optimization(stl, faces, 
+        best = orientation_optimization(stl, faces, 
             ignore_grounded=ignore_ground, 
             ground_level=ground_level, 
             ground_tolerance=ground_tolerance, 
             phi_min=phi_min, 
             angle_tolerance=angle_tolerance,
-            grounded_only=grounded_only)
+            grounded_only=grounded_only,
+            mode=orientation_mode,
+            resolution=orientation_resolution,
+            precision=orientation_precision,
+            candidates=orientation_candidates,
+            max_evaluations=orientation_budget,
+            workers=workers,
+            bin_size=orientation_bin_size,
+            prune=orientation_pruning)
         ground_level = stl.ground_level
+
+        if cache is not None:
+            cache.put(cache_key, {"x": float(best[0]), "y": float(best[1]), "weight": float(best[2]), "grounded": bool(best[3])})
+        orientation = [float(best[0]), float(best[1])]
     elif fixed_orientation is not None:
         stl.rotate(fixed_orientation[0], axis='x')
         stl.rotate(fixed_orientation[1], axis='y')
         ground_level = stl.ground_level
+        orientation = [float(fixed_orientation[0]), float(fixed_orientation[1])]
+    else:
+        orientation = [0.0, 0.0]
 
     time_orientation = timer()
 
     # Do initial problem check
     faces.check_for_problems(ignore_grounded=ignore_ground, ground_level=ground_level, ground_tolerance=ground_tolerance, phi_min=phi_min, angle_tolerance=angle_tolerance)
     print("%d overhang surfaces detected" % faces.get_warning_count())
+    initial_warning_count = faces.get_warning_count()
 
     time_problem_detection = timer()
 
     print("\nProblem correction process initiated. phi_min = %f \nMax iterations: %d. \nConvergence detection activated: %s. Convergence depth: %d" % (phi_min, max_iterations, convergence_break, convergence_depth))
     iterations = 0
+    iteration_timings = []
     previous_warning_count = []
     for i in range(0, max_iterations):
         iterations = i + 1
+        time_iteration = timer()
 
         # Display progression
         print("Iteration (%d/%d):\t Approximate warnings detected: %d" % (i+1, max_iterations, faces.get_warning_count()))
@@ -202,17 +290,18 @@ def search_and_solve(model_path, altered_model_path,
             print("No more problems encountered")
             break
 
-        # Go through each problematic face and run the SFA
-        for face in faces.problem_faces:
-            if face.has_bad_angle is True:
-                single_face_algorithm(face, atype="additive", phi_min=phi_min, zero_phi_strategy=zero_phi_strategy)
+        # Poles follow the z-coordinates, which the previous iteration may have changed
+        faces.mesh.detect_poles()
+
+        # Run the SFA on all problematic faces at once
+        batch_single_face_algorithm(faces, np.flatnonzero(faces.mesh.bad), phi_min=phi_min, zero_phi_strategy=zero_phi_strategy)
 
         # For each vertex, apply the changes proposed by the SFA
-        for vertex in faces.get_vertex_collection():
-            net_vector = vertex.perform_change()
+        faces.mesh.apply_displacements()
 
-        # Re-run the problem detection algorithm
-        faces.check_for_problems(ignore_grounded=ignore_ground, ground_level=ground_level, ground_tolerance=ground_tolerance, phi_min=phi_min, angle_tolerance=angle_tolerance)
+        # Re-run the problem detection algorithm on the faces of the vertices that moved
+        faces.check_for_problems(ignore_grounded=ignore_ground, ground_level=ground_level, ground_tolerance=ground_tolerance, phi_min=phi_min, angle_tolerance=angle_tolerance, only_moved=True)
+        iteration_timings.append(timer() - time_iteration)
 
         # Check if the amount of warnings has converged towards a value. If so, then break.
         if convergence_break is True:
@@ -227,7 +316,7 @@ def search_and_solve(model_path, altered_model_path,
 
     # Save changes to a new STL file
     print("Saving changes to a new STL-file..")
-    stl_creator = STLCreator(altered_model_path, faces)
+    stl_creator = STLCreator(altered_model_path, faces, file_format=output_format, precision=output_precision)
     stl_creator.build_file()
     time_stl_creation = timer()
 
@@ -241,4 +330,29 @@ def search_and_solve(model_path, altered_model_path,
     print("\nDone!")
         
     if plot is True:
-        plot_model(faces)
\ No newline at end of file
+        plot_model(faces)
+
+    return {
+        "input": model_path,
+        "output": altered_model_path,
+        "facets": len(faces.mesh.faces),
+        "vertices": len(faces.mesh.vertices),
+        "warnings_before": initial_warning_count,
+        "warnings_after": faces.get_warning_count(),
+        "iterations": iterations,
+        "orientation": orientation,
+        "grounded": bool(stl.grounded),
+        "total_weight": float(faces.total_weight),
+        "leaks": manifold_report,
+        "timings": {
+            "loading": time_model_loaded-time_start,
+            "parsing": time_parsed-time_start,
+            "welding": time_welded-time_parsed,
+            "edges": time_model_loaded-time_welded,
+            "orientation": time_orientation-time_model_loaded,
+            "problem_detection": time_problem_detection-time_orientation,
+            "problem_correction": time_problem_correction-time_problem_detection,
+            "writing": time_stl_creation-time_problem_correction
+        },
+        "iteration_timings": iteration_timings
+    }
\ No newline at end of file
@@ -0,0 +1,677 @@
+from multiprocessing import Pool, shared_memory
+import numpy as np
+
+from geoalt_geometry.faces import FLAT_ANGLE, overhang_weights, sequential_sum
+
+# Upper limit on the amount of (face, orientation) pairs that are evaluated at once. Keeps the memory use of a batch bounded.
+BATCH_ELEMENTS = 2**22
+
+# The grounding pre-check of pruned_search is only run for models with at most this many distinct face normals per face.
+# Models with flat sides have few of them, and can only be grounded in a few directions. Finely tessellated models have
+# about one per face, so checking them would cost as much as evaluating the orientations, and would rule out nothing.
+GROUND_CHECK_NORMAL_SHARE = 1/8
+
+# The binned evaluator keeps up to this many planes of every bin as separate support groups. Any further support faces of the bin
+# are scored together. CAD models have a few large planes per bin, while curved models could otherwise get a group per face.
+SUPPORT_PLANES_PER_BIN = 4
+
+# The evaluator of a worker process, set up by init_worker.
+worker_evaluator = None
+
+def rotation_matrices(x_angles, y_angles):
+    '''
+    Create the (B x 3 x 3) rotation matrices of rotating a model around the X axis and then around the Y axis,
+    the same way as STLfile.rotate does.
+    '''
+    x_angles = np.asarray(x_angles, dtype=np.float64).reshape(-1)
+    y_angles = np.asarray(y_angles, dtype=np.float64).reshape(-1)
+    cx, sx = np.cos(x_angles), np.sin(x_angles)
+    cy, sy = np.cos(y_angles), np.sin(y_angles)
+    zeros = np.zeros_like(cx)
+    ones = np.ones_like(cx)
+
+    rx = np.stack([ones, zeros, zeros, zeros, cx, -sx, zeros, sx, cx], axis=1).reshape(-1, 3, 3)
+    ry = np.stack([cy, zeros, sy, zeros, ones, zeros, -sy, zeros, cy], axis=1).reshape(-1, 3, 3)
+    return np.matmul(ry, rx)
+
+def grid_orientations(resolution=np.pi/36):
+    '''
+    Create X and Y rotation angles that sweep both axes from 0 to 180 degrees in steps of resolution.
+    '''
+    iterations_per_axis = int(round(np.pi/resolution)) + 1
+    steps = np.arange(0, iterations_per_axis)*(np.pi/(iterations_per_axis - 1))
+    return np.repeat(steps, iterations_per_axis), np.tile(steps, iterations_per_axis)
+
+def sphere_orientations(resolution=np.pi/36):
+    '''
+    Create X and Y rotation angles for build directions spread evenly over the hemisphere that the grid covers.
+
+    The grid packs its rows closer and closer together towards its poles. Spreading the directions evenly leaves gaps about as wide
+    as those of the grid at the same resolution (3.5 degrees at 5 degrees), with about a third fewer evaluations (899 instead of 1369).
+    Like the grid, no direction with a positive X is turned into the build direction.
+    '''
+    return direction_to_rotation(sphere_directions(resolution))
+
+def sphere_directions(resolution=np.pi/36):
+    '''
+    Create the (B x 3) build directions of sphere_orientations: -X, a ring along the rim of the hemisphere in steps of resolution,
+    and a Fibonacci lattice in which each direction covers roughly resolution x resolution steradians.
+    The lattice thins out towards the rim, which the ring makes up for. The ring holds +Z, -Z, +Y and -Y,
+    since a model is often best printed lying on one of its sides.
+    '''
+    ring_count, lattice_count = __sphere_counts__(resolution)
+    angles = np.arange(0, ring_count)*(2*np.pi/ring_count)
+    ring = np.column_stack([np.zeros(ring_count), np.cos(angles), np.sin(angles)])
+    return np.concatenate([[[-1, 0, 0]], ring, fibonacci_directions(lattice_count)])
+
+def sphere_direction_count(resolution=np.pi/36):
+    '''
+    Returns the amount of directions of sphere_orientations for the given resolution, without creating them.
+    '''
+    return 1 + sum(__sphere_counts__(resolution))
+
+def __sphere_counts__(resolution):
+    ring_count = 4*int(np.ceil(np.pi/(2*resolution)))     # A multiple of four, so that the ring holds the axes
+    return ring_count, int(np.ceil(2*np.pi/resolution**2))
+
+def fibonacci_directions(count):
+    '''
+    Create count unit vectors spread evenly over the hemisphere of directions pointing towards -X, which is the one the grid covers.
+    '''
+    i = np.arange(0, count)
+    t = 1 - (i + 0.5)/count
+    r = np.sqrt(1 - t**2)
+    phi = i*np.pi*(3 - np.sqrt(5))     # Golden angle
+    return np.column_stack([-t, r*np.cos(phi), r*np.sin(phi)])
+
+def direction_to_rotation(directions):
+    '''
+    Find the X and Y rotation angles that turn each of the (B x 3) directions of the model into the build direction (+Z).\n
+    Rotating around X by a and then around Y by b turns the direction (-sin(b), cos(b)sin(a), cos(b)cos(a)) into +Z.
+    '''
+    directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+    y_angles = np.arcsin(np.clip(-directions[:, 0], -1.0, 1.0)) + 0.0     # Adding 0.0 turns -0.0 into 0.0
+    x_angles = np.arctan2(directions[:, 1], directions[:, 2]) % (2*np.pi)
+    return x_angles, y_angles
+
+def tangent_offsets(directions, step):
+    '''
+    Create the eight directions surrounding each of the (B x 3) directions, step radians away along two perpendicular tangents
+    (and diagonally in between). Returns a (B*8 x 3) array of unit vectors.
+    '''
+    directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+    # Pick the axis that is least parallel to each direction to build the tangent plane from.
+    helper = np.zeros_like(directions)
+    helper[np.arange(len(directions)), np.argmin(np.abs(directions), axis=1)] = 1
+    u = np.cross(directions, helper)
+    u /= np.linalg.norm(u, axis=1)[:, None]
+    v = np.cross(directions, u)
+
+    a, b = np.meshgrid([-1, 0, 1], [-1, 0, 1], indexing='ij')
+    a, b = a.reshape(-1), b.reshape(-1)
+    keep = (a != 0) | (b != 0)
+    a, b = a[keep]*np.tan(step), b[keep]*np.tan(step)
+
+    neighbours = directions[:, None] + a[None, :, None]*u[:, None] + b[None, :, None]*v[:, None]
+    neighbours /= np.linalg.norm(neighbours, axis=2)[:, :, None]
+    return neighbours.reshape(-1, 3)
+
+def rank_orientations(weights, grounded, grounded_only=False):
+    '''
+    Returns the indices of the orientations ordered from best to worst.
+    If grounded_only is True and any orientation is grounded, the grounded orientations are placed first.
+    '''
+    key = np.asarray(weights, dtype=np.float64)
+    if grounded_only is True and np.any(grounded):
+        key = np.where(grounded, key, np.inf)
+    return np.argsort(key, kind='stable')
+
+def adaptive_search(evaluator, resolution=np.pi/36, precision=np.pi/720, candidates=5, max_evaluations=None, grounded_only=False, verbose=False):
+    '''
+    Coarse to fine search for the best build direction.\n
+    A coarse pass evaluates directions spread evenly over the hemisphere of sphere_orientations with the given resolution.
+    After that, the surroundings of the best candidates are evaluated with half the step of the previous pass,
+    until the step is finer than precision or max_evaluations directions have been evaluated.\n
+    Returns all evaluated (B x 3) directions along with their weights and whether they are grounded.
+    '''
+    if max_evaluations is not None:
+        # Coarsen the first pass until it fits within the budget. It still covers the whole hemisphere, with wider gaps.
+        while sphere_direction_count(resolution) > max_evaluations and resolution < np.pi:
+            resolution *= 1.05
+    if max_evaluations is not None and sphere_direction_count(resolution) > max_evaluations:
+        directions = fibonacci_directions(max_evaluations)     # Too small a budget for even the axes
+    else:
+        directions = sphere_directions(resolution)
+    weights, grounded = evaluator.evaluate_directions(directions, verbose=verbose)
+
+    step = resolution/2
+    while step >= precision:
+        remaining = None if max_evaluations is None else max_evaluations - len(directions)
+        if remaining is not None and remaining <= 0:
+            break
+
+        best = rank_orientations(weights, grounded, grounded_only)[:candidates]
+        new_directions = tangent_offsets(directions[best], step)[:remaining]
+        new_weights, new_grounded = evaluator.evaluate_directions(new_directions)
+
+        directions = np.concatenate([directions, new_directions])
+        weights = np.concatenate([weights, new_weights])
+        grounded = np.concatenate([grounded, new_grounded])
+        step /= 2
+
+    return directions, weights, grounded
+
+def pruned_search(evaluator, directions, keep=10, grounded_only=False, verbose=False):
+    '''
+    Branch and bound search for the best keep build directions among the (B x 3) directions.\n
+    The directions are grouped into small regions, and a lower bound of the weight is found for every region.
+    Regions are evaluated from the most promising one and onwards, and a region is skipped once its lower bound
+    is higher than the weight of the keep best directions found so far. The keep best directions are therefore the same
+    as those of evaluating every direction.\n
+    If grounded_only is True, only grounded directions count towards the keep best. For models with few distinct face normals,
+    directions in which no face can be flat on the ground are left out up front. If none of the directions turn out to be grounded,
+    all of them are searched instead.\n
+    Returns the indices of the evaluated directions, in increasing order, along with their weights and whether they are grounded.
+    '''
+    directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+    candidates = np.arange(len(directions))
+    if grounded_only is True:
+        possible = evaluator.may_be_grounded(directions)
+        if possible is not None and np.any(possible):
+            candidates = np.flatnonzero(possible)
+
+    indices, weights, grounded = __branch_and_bound__(evaluator, directions, candidates, keep, grounded_only, verbose)
+
+    # Without any grounded direction every candidate has been evaluated. Only the directions that were left out need another search.
+    if grounded_only is True and not np.any(grounded) and len(candidates) < len(directions):
+        return __branch_and_bound__(evaluator, directions, np.arange(len(directions)), keep, False, verbose)
+    return indices, weights, grounded
+
+def __branch_and_bound__(evaluator, directions, candidates, keep, grounded_only, verbose):
+    count = len(candidates)
+    cells = max(1, int(round(np.sqrt(count/(6*8)))))    # Roughly 8 directions per region
+    regions, region_index = np.unique(cube_map_bins(directions[candidates], cells), return_inverse=True)
+    region_index = region_index.reshape(-1)
+
+    centres = np.column_stack([np.bincount(region_index, weights=directions[candidates, i], minlength=len(regions)) for i in range(3)])
+    centres /= np.linalg.norm(centres, axis=1)[:, None]
+    radii = np.zeros(len(regions))
+    np.maximum.at(radii, region_index, np.arccos(np.clip(np.sum(directions[candidates]*centres[region_index], axis=1), -1.0, 1.0)))
+    bounds = evaluator.lower_bounds(centres, radii + 1e-9)
+
+    order = np.argsort(bounds, kind='stable')
+    members = np.split(np.argsort(region_index, kind='stable'), np.cumsum(np.bincount(region_index, minlength=len(regions)))[:-1])
+    group_size = max(keep, int(np.ceil(count/32)))
+
+    evaluated = []
+    weights = []
+    grounded = []
+    scores = np.zeros(0)    # Weights that count towards the keep best
+    position = 0
+    while position < len(order):
+        threshold = np.inf if len(scores) < keep else np.partition(scores, keep - 1)[keep - 1]
+        if bounds[order[position]] > threshold:
+            break   # The regions are ordered by their bound, so none of the remaining regions can do better.
+
+        group = []
+        while position < len(order) and bounds[order[position]] <= threshold and len(group) < group_size:
+            group.extend(members[order[position]])
+            position += 1
+
+        group = candidates[np.sort(group)]
+        group_weights, group_grounded = evaluator.evaluate_directions(directions[group])
+        evaluated.append(group)
+        weights.append(group_weights)
+        grounded.append(group_grounded)
+        scores = np.concatenate([scores, group_weights[group_grounded] if grounded_only is True else group_weights])
+
+        if verbose is True:
+            print("%.2f%%" % (position/len(order)*100), end='\r', flush=True)
+
+    evaluated = np.concatenate(evaluated)
+    ordered = np.argsort(evaluated, kind='stable')
+    return evaluated[ordered], np.concatenate(weights)[ordered], np.concatenate(grounded)[ordered]
+
+class OrientationEvaluator:
+    '''
+    Scores candidate orientations of a mesh without rotating it.\n
+    The overhang weight of a face only depends on its normal vector, its projected area and on whether it touches the ground.
+    All of those can be found from the face normals and vertex heights along the build direction,
+    which is the third row of the rotation matrix.
+    '''
+    def __init__(self, mesh, phi_min=np.pi/4, ground_tolerance=0.01, workers=1):
+        triangles = mesh.triangles()
+        cross = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])   # (F x 3) unnormalized normals
+        self.__set_arrays__(cross, np.linalg.norm(cross, axis=1), mesh.vertices.copy(), mesh.faces.copy())
+        self.phi_min = phi_min
+        self.ground_tolerance = ground_tolerance
+        self.workers = workers      # Amount of processes used to evaluate the orientations
+
+    @classmethod
+    def from_arrays(cls, cross, cross_norm, vertices, faces, phi_min=np.pi/4, ground_tolerance=0.01):
+        '''
+        Create an evaluator directly from its arrays, without copying them. Used by the worker processes.
+        '''
+        evaluator = cls.__new__(cls)
+        evaluator.__set_arrays__(cross, cross_norm, vertices, faces)
+        evaluator.phi_min = phi_min
+        evaluator.ground_tolerance = ground_tolerance
+        evaluator.workers = 1
+        return evaluator
+
+    def __set_arrays__(self, cross, cross_norm, vertices, faces):
+        self.cross = cross
+        self.cross_norm = cross_norm
+        self.vertices = vertices
+        self.faces = faces
+        self._distinct_normals = None   # Filled in by distinct_normals()
+        self.batch_size = max(1, BATCH_ELEMENTS // max(len(self.faces), len(self.vertices), 1))
+
+    def evaluate(self, rotations, verbose=False):
+        '''
+        Score a batch of (B x 3 x 3) rotation matrices.\n
+        Returns the total weight, and whether the model would be grounded, for each rotation.
+        '''
+        rotations = np.asarray(rotations, dtype=np.float64).reshape(-1, 3, 3)
+        return self.evaluate_directions(rotations[:, 2, :], verbose=verbose)
+
+    def evaluate_directions(self, directions, verbose=False):
+        '''
+        Score a batch of (B x 3) build directions, given as unit vectors in the coordinate system of the model.\n
+        Returns the total weight, and whether the model would be grounded, for each direction.
+        '''
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        count = len(directions)
+        if self.workers > 1 and count > self.batch_size:
+            return self.__evaluate_parallel__(directions, verbose)
+
+        weights = np.zeros(count)
+        grounded = np.zeros(count, dtype=bool)
+
+        for start in range(0, count, self.batch_size):
+            end = min(start + self.batch_size, count)
+            weights[start:end], grounded[start:end] = self.__evaluate_batch__(directions[start:end])
+
+            if verbose is True:
+                print("%.2f%%" % (end/count*100), end='\r', flush=True)
+
+        return weights, grounded
+
+    def lower_bounds(self, centres, radii):
+        '''
+        Returns, for each region of build directions within radii radians of the (K x 3) unit centres,
+        a value that the total weight of no direction in the region can be below.\n
+        Within a region the angle of a face can only be between its angle at the centre minus and plus the radius.
+        The weight of a face (weight per area times projected area) never increases with the angle,
+        except for dropping to zero exactly at phi_min, so the weight at the largest angle is the lowest one.
+        Faces that may be flat enough to touch the ground, and whose vertices can all reach it, are assumed to get the full ground discount.
+        '''
+        centres = np.asarray(centres, dtype=np.float64).reshape(-1, 3)
+        radii = np.asarray(radii, dtype=np.float64).reshape(-1)
+        valid = self.cross_norm > 0
+        n_hat = self.cross[valid] / self.cross_norm[valid, None]
+        half_norm = self.cross_norm[valid]/2
+        ground_angle = min(FLAT_ANGLE, self.phi_min)
+
+        # Only faces whose vertices can all come within ground_tolerance of the ground can get the ground discount.
+        near_ground = np.zeros(len(self.vertices), dtype=bool)
+        near_ground[ground_candidates(self.vertices, tolerance=self.ground_tolerance)] = True
+        groundable = np.all(near_ground[self.faces[valid]], axis=1)
+
+        bounds = np.zeros(len(centres))
+        step = max(1, BATCH_ELEMENTS // max(len(n_hat), 1))
+        for start in range(0, len(centres), step):
+            end = min(start + step, len(centres))
+            angles = np.arccos(np.clip(-(n_hat @ centres[start:end].T), -1.0, 1.0))
+            low = np.maximum(angles - radii[start:end], 0)
+            high = np.minimum(angles + radii[start:end], np.pi)
+
+            per_area = np.select([
+                groundable[:, None] & (low < ground_angle),
+                (FLAT_ANGLE <= self.phi_min) & (low <= self.phi_min) & (self.phi_min <= high)
+            ], [
+                -80*np.cos(low),
+                0
+            ], default=overhang_weights(high, np.zeros(high.shape, dtype=bool), np.abs(np.cos(high)), phi_min=self.phi_min))
+            bounds[start:end] = np.sum(per_area*half_norm[:, None], axis=0)
+
+        # Leave room for rounding errors, so that a region is never skipped because of them.
+        return bounds - 1e-9*(100*np.sum(half_norm) + 1)
+
+    def may_be_grounded(self, directions):
+        '''
+        Cheap test of whether the model may touch the ground when printed along each of the (B x 3) build directions.
+        A model can only be grounded if at least one face is flat enough to be checked for contact with the ground.
+        Only the distinct face normals are tested, so the test is only cheap when there are few of them.\n
+        Returns None, rather than testing anything, when the model has more than GROUND_CHECK_NORMAL_SHARE distinct normals per face.
+        '''
+        normals = self.distinct_normals()
+        if len(normals) > GROUND_CHECK_NORMAL_SHARE*len(self.faces):
+            return None
+
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        limit = np.cos(min(FLAT_ANGLE, self.phi_min)) - 1e-9
+        possible = np.zeros(len(directions), dtype=bool)
+        step = max(1, BATCH_ELEMENTS // max(len(normals), 1))
+        for start in range(0, len(directions), step):
+            possible[start:start + step] = np.any(-(normals @ directions[start:start + step].T) > limit, axis=0)
+        return possible
+
+    def distinct_normals(self):
+        '''
+        Returns the distinct unit normals of the non-degenerate faces. Found once, and kept for later calls.
+        '''
+        if self._distinct_normals is None:
+            valid = self.cross_norm > 0
+            self._distinct_normals = np.unique(np.round(self.cross[valid] / self.cross_norm[valid, None], 9), axis=0)
+        return self._distinct_normals
+
+    def __evaluate_parallel__(self, directions, verbose=False):
+        '''
+        Split the directions into batches and evaluate them in a pool of worker processes.
+        The mesh arrays are placed in shared memory once, rather than being sent to every worker.
+        The batches only depend on the size of the mesh, and every direction is scored independently,
+        so the results are the same regardless of the amount of workers.
+        '''
+        count = len(directions)
+        weights = np.zeros(count)
+        grounded = np.zeros(count, dtype=bool)
+        starts = range(0, count, self.batch_size)
+        batches = [directions[start:start + self.batch_size] for start in starts]
+
+        blocks = []
+        try:
+            specs = []
+            for array in [self.cross, self.cross_norm, self.vertices, self.faces]:
+                block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                blocks.append(block)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+                specs.append((block.name, array.shape, array.dtype.str))
+
+            with Pool(processes=self.workers, initializer=init_worker, initargs=(specs, self.phi_min, self.ground_tolerance)) as pool:
+                for i, (start, result) in enumerate(zip(starts, pool.imap(evaluate_batch, batches))):
+                    end = start + len(batches[i])
+                    weights[start:end], grounded[start:end] = result
+
+                    if verbose is True:
+                        print("%.2f%%" % (end/count*100), end='\r', flush=True)
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+        return weights, grounded
+
+    def __evaluate_batch__(self, up):
+        # Element-wise products rather than a matrix product, so that the result for a direction does not depend on the rest of the batch.
+        cz = self.cross[:, 0, None]*up[:, 0] + self.cross[:, 1, None]*up[:, 1] + self.cross[:, 2, None]*up[:, 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            angles = np.arccos(np.clip(-cz / self.cross_norm[:, None], -1.0, 1.0))
+        areas = np.abs(cz)/2
+
+        # Only faces that are flat enough to be discounted need to be checked for contact with the ground.
+        heights = self.vertices[:, 0, None]*up[:, 0] + self.vertices[:, 1, None]*up[:, 1] + self.vertices[:, 2, None]*up[:, 2]
+        ground_level = heights.min(axis=0)
+        face_index, batch_index = np.nonzero(angles < min(FLAT_ANGLE, self.phi_min))
+        face_heights = heights[self.faces[face_index], batch_index[:, None]]
+
+        grounded = np.zeros(angles.shape, dtype=bool)
+        grounded[face_index, batch_index] = np.all(np.abs(face_heights - ground_level[batch_index, None]) <= self.ground_tolerance, axis=1)
+
+        weights = overhang_weights(angles, grounded, areas, phi_min=self.phi_min)
+        return sequential_sum(weights, axis=0), np.any(grounded, axis=0)
+
+
+def init_worker(specs, phi_min, ground_tolerance):
+    '''
+    Attach a worker process to the shared mesh arrays created by OrientationEvaluator.
+    '''
+    global worker_evaluator
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    arrays = [np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf) for block, (_, shape, dtype) in zip(blocks, specs)]
+    worker_evaluator = OrientationEvaluator.from_arrays(*arrays, phi_min=phi_min, ground_tolerance=ground_tolerance)
+    worker_evaluator.blocks = blocks    # Keep the shared memory attached for as long as the worker lives.
+
+def evaluate_batch(directions):
+    '''
+    Score a batch of build directions in a worker process.
+    '''
+    return worker_evaluator.__evaluate_batch__(directions)
+
+def cube_map_bins(normals, cells):
+    '''
+    Returns the index of the cube map bin that each of the (F x 3) unit normals falls into.
+    Every side of the cube is divided into cells x cells bins of equal angular size.
+    '''
+    normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3)
+    axis = np.argmax(np.abs(normals), axis=1)
+    major = normals[np.arange(len(normals)), axis]
+    side = axis*2 + (major < 0)
+    u = np.arctan(normals[np.arange(len(normals)), (axis + 1) % 3] / np.abs(major))
+    v = np.arctan(normals[np.arange(len(normals)), (axis + 2) % 3] / np.abs(major))
+    iu = np.clip(np.floor((u + np.pi/4) / (np.pi/2) * cells).astype(np.int64), 0, cells - 1)
+    iv = np.clip(np.floor((v + np.pi/4) / (np.pi/2) * cells).astype(np.int64), 0, cells - 1)
+    return (side*cells + iu)*cells + iv
+
+def cube_map_centres(cells):
+    '''
+    Returns the (6*cells*cells x 3) unit directions at the centre of every cube map bin, in bin index order.
+    Every direction on the sphere lies within sqrt(2)*pi/(2*cells) radians of one of them.
+    '''
+    angles = np.tan((np.arange(cells) + 0.5) / cells * np.pi/2 - np.pi/4)
+    u, v = np.meshgrid(angles, angles, indexing='ij')
+    u, v = u.reshape(-1), v.reshape(-1)
+    centres = []
+    for axis in range(3):
+        for sign in [1, -1]:
+            d = np.zeros([len(u), 3])
+            d[:, axis] = sign
+            d[:, (axis + 1) % 3] = u
+            d[:, (axis + 2) % 3] = v
+            centres.append(d)
+    centres = np.concatenate(centres)
+    return centres / np.linalg.norm(centres, axis=1)[:, None]
+
+def flat_interior_vertices(vertices, faces):
+    '''
+    Returns a mask of the vertices that lie inside a flat region of the mesh: all faces around the vertex share the same normal,
+    and together they go all the way around it. Such a vertex lies within its neighbours, so it is never the single lowest point of the model.
+    '''
+    triangles = vertices[faces]
+    cross = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normals = cross / np.linalg.norm(cross, axis=1)[:, None]
+
+    # Angle of every face at each of its corners.
+    corner_angles = np.zeros(faces.shape)
+    for corner in range(3):
+        a = triangles[:, (corner + 1) % 3] - triangles[:, corner]
+        b = triangles[:, (corner + 2) % 3] - triangles[:, corner]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cos = np.sum(a*b, axis=1) / (np.linalg.norm(a, axis=1)*np.linalg.norm(b, axis=1))
+        corner_angles[:, corner] = np.arccos(np.clip(cos, -1.0, 1.0))
+
+    corner_vertex = faces.reshape(-1)
+    corner_normal = np.repeat(normals, 3, axis=0)
+    total_angle = np.bincount(corner_vertex, weights=corner_angles.reshape(-1), minlength=len(vertices))
+
+    # Compare the normal of every face around a vertex with the normal of one of them.
+    reference = np.zeros([len(vertices), 3])
+    reference[corner_vertex] = corner_normal
+    agreement = np.ones(len(vertices))
+    np.minimum.at(agreement, corner_vertex, np.sum(corner_normal*reference[corner_vertex], axis=1))
+
+    with np.errstate(invalid='ignore'):
+        return (agreement > 1 - 1e-9) & (np.abs(total_angle - 2*np.pi) < 1e-6)
+
+def ground_candidates(vertices, faces=None, cells=16, tolerance=0):
+    '''
+    Returns the indices of the vertices that can be the lowest vertex of the model (or within tolerance of it) in some orientation.\n
+    If faces are given, vertices inside flat regions are left out. The heights of the rest are compared along the centre of every cube map bin.
+    A vertex that lies further above the lowest one than the bin can tilt the model by can never be the lowest one,
+    for any direction within that bin.
+    '''
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    candidates = np.arange(len(vertices))
+    if faces is not None and len(faces) > 0:
+        candidates = np.flatnonzero(~flat_interior_vertices(vertices, faces))
+    if len(candidates) == 0:
+        return candidates
+
+    centred = vertices[candidates] - vertices[candidates].mean(axis=0)
+    radius = np.linalg.norm(centred, axis=1).max()
+    tilt = np.sqrt(2)*np.pi/(2*cells)
+    margin = tolerance + 2*radius*2*np.sin(tilt/2) + 1e-9*max(radius, 1)
+
+    centres = cube_map_centres(cells)
+    keep = np.zeros(len(candidates), dtype=bool)
+    step = max(1, BATCH_ELEMENTS // len(candidates))
+    for start in range(0, len(centres), step):
+        heights = centred @ centres[start:start + step].T
+        keep |= np.any(heights <= heights.min(axis=0) + margin, axis=1)
+    return candidates[keep]
+
+
+def outside_faces(triangles, normals, face_bin, bin_normal, points, tolerance):
+    '''
+    Returns a mask of the faces that lie on the outside of the model along their own unit normal (within tolerance): no point lies
+    further out along the normal than the innermost corner of the face. Only such a face can lie flat on the ground.
+    points needs to hold every vertex that can be the outermost one in some direction (see ground_candidates).\n
+    A unit normal n of a face differs by |n - m| from the normal m of its bin, which changes the height of a point along it by at most
+    radius*|n - m|. Faces and points that lie too far inside along the bin normal are ruled out with that before they are compared exactly.
+    '''
+    outside = np.zeros(len(normals), dtype=bool)
+    if len(points) == 0 or len(normals) == 0:
+        return outside
+
+    centre = points.mean(axis=0)
+    points = points - centre
+    triangles = triangles - centre
+    radius = np.linalg.norm(points, axis=1).max()
+    margin = 1e-9*max(radius, 1)
+    shift = radius*np.linalg.norm(normals - bin_normal[face_bin], axis=1)
+
+    step = max(1, BATCH_ELEMENTS // len(points))
+    extreme = np.concatenate([np.max(points @ bin_normal[start:start + step].T, axis=0) for start in range(0, len(bin_normal), step)])
+    innermost = np.min(np.einsum('fij,fj->fi', triangles, bin_normal[face_bin]), axis=1)
+    candidates = np.flatnonzero(innermost >= extreme[face_bin] - 2*shift - tolerance - margin)
+
+    # Compare the remaining faces bin by bin, with the points that can be the outermost one along any of their normals.
+    order = candidates[np.argsort(face_bin[candidates], kind='stable')]
+    bins, starts = np.unique(face_bin[order], return_index=True)
+    for b, members in zip(bins, np.split(order, starts[1:])):
+        near = points[points @ bin_normal[b] >= extreme[b] - 2*shift[members].max() - margin]
+        step = max(1, BATCH_ELEMENTS // len(near))
+        for start in range(0, len(members), step):
+            batch = members[start:start + step]
+            face_extreme = np.max(near @ normals[batch].T, axis=0)
+            face_innermost = np.min(np.einsum('fij,fj->fi', triangles[batch], normals[batch]), axis=1)
+            outside[batch] = face_innermost >= face_extreme - tolerance
+    return outside
+
+def support_groups(normals, face_bin, areas, planes=SUPPORT_PLANES_PER_BIN):
+    '''
+    Group the faces that lie on the outside of the model (see outside_faces) by plane. Such faces lie at the outside of the model along
+    their own normal, so faces with the same normal lie in the same plane. The largest planes of every bin by area, up to planes of them,
+    get a group of their own. The remaining faces of the bin share one group.\n
+    Returns the group of every face. Groups are numbered from 0, ordered by bin.
+    '''
+    if len(normals) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    keys = np.column_stack([face_bin, np.round(normals, 6)])
+    plane_keys, plane = np.unique(keys, axis=0, return_inverse=True)
+    plane = plane.reshape(-1)
+    plane_bin = plane_keys[:, 0].astype(np.int64)
+    plane_area = np.bincount(plane, weights=areas, minlength=len(plane_keys))
+
+    # Rank the planes of every bin by area, and send all planes past the limit to a shared group per bin.
+    order = np.lexsort([-plane_area, plane_bin])
+    bin_start = np.searchsorted(plane_bin[order], plane_bin[order], side='left')
+    rank = np.zeros(len(plane_keys), dtype=np.int64)
+    rank[order] = np.arange(len(order)) - bin_start
+    slot = np.minimum(rank, planes)
+
+    _, plane_group = np.unique(np.column_stack([plane_bin, slot]), axis=0, return_inverse=True)
+    return plane_group.reshape(-1)[plane]
+
+
+class BinnedOrientationEvaluator(OrientationEvaluator):
+    '''
+    Scores candidate orientations of a mesh from its face normals binned on the sphere, rather than from every face.\n
+    Faces are binned by normal direction on a cube map with bins of roughly bin_size radians.
+    Each bin is scored as a single face from the sum of the (unnormalized) normals of its faces,
+    which is exact for coplanar faces and approximate otherwise.\n
+    Faces that lie on the outside of the model along their own normal (within ground_tolerance) can touch the ground. They are split off
+    from the rest of their bin into support groups of coplanar faces (see support_groups), so that a flat base keeps its own normal
+    even if its bin also holds tilted faces. A group is grounded in an orientation if it is flat enough and all of its vertices lie
+    within ground_tolerance of the ground. Only the vertices on the outline of the group are stored for this. The ground level is found
+    from the vertices that can be the lowest one in some orientation.
+    The amount of work per orientation therefore mostly depends on the bin size rather than on the amount of faces.
+    '''
+    def __init__(self, mesh, phi_min=np.pi/4, ground_tolerance=0.01, bin_size=np.pi/36):
+        vertices = mesh.vertices
+        triangles = mesh.triangles()
+        cross = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        cross_norm = np.linalg.norm(cross, axis=1)
+        valid = np.flatnonzero(cross_norm > 0)  # Degenerate faces have no area, and therefore no weight.
+        cross, cross_norm = cross[valid], cross_norm[valid]
+        faces = mesh.faces[valid]
+        normals = cross / cross_norm[:, None]
+
+        self.phi_min = phi_min
+        self.ground_tolerance = ground_tolerance
+        self.bin_size = bin_size
+        self.workers = 1
+
+        # Bin the faces and find the mean normal of every bin.
+        cells = max(1, int(np.ceil((np.pi/2) / bin_size)))
+        bins, face_bin = np.unique(cube_map_bins(normals, cells), return_inverse=True)
+        face_bin = face_bin.reshape(-1)
+        bin_sum = np.column_stack([np.bincount(face_bin, weights=cross[:, i], minlength=len(bins)) for i in range(3)])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bin_normal = np.nan_to_num(bin_sum / np.linalg.norm(bin_sum, axis=1)[:, None])
+
+        # The vertices that can be the lowest vertex in some orientation. Enough to find the ground level.
+        self.ground_vertices = vertices[ground_candidates(vertices, faces)]
+
+        # Split the faces that can touch the ground off from the rest of their bin.
+        support = outside_faces(vertices[faces], normals, face_bin, bin_normal, self.ground_vertices, ground_tolerance)
+        group = support_groups(normals[support], face_bin[support], cross_norm[support]/2)
+        group_count = group.max() + 1 if len(group) > 0 else 0
+
+        rest_cross = np.column_stack([np.bincount(face_bin[~support], weights=cross[~support, i], minlength=len(bins)) for i in range(3)])
+        support_cross = np.column_stack([np.bincount(group, weights=cross[support, i], minlength=group_count) for i in range(3)]).reshape(-1, 3)
+        self.bin_cross = np.concatenate([rest_cross, support_cross])
+        self.bin_cross_norm = np.linalg.norm(self.bin_cross, axis=1)
+        self.bin_support = np.concatenate([np.zeros(len(bins), dtype=bool), np.ones(group_count, dtype=bool)])
+        used = self.bin_cross_norm > 0
+        self.bin_cross, self.bin_cross_norm, self.bin_support = self.bin_cross[used], self.bin_cross_norm[used], self.bin_support[used]
+
+        # Outline vertices of every support group, grouped in the same order as the support rows of bin_cross.
+        support_faces = faces[support]
+        interior = flat_interior_vertices(vertices, support_faces) if len(support_faces) > 0 else np.zeros(len(vertices), dtype=bool)
+        group_vertex = np.unique(np.column_stack([np.repeat(group, 3), support_faces.reshape(-1)]), axis=0).reshape(-1, 2)
+        group_vertex = group_vertex[~interior[group_vertex[:, 1]] & used[len(bins) + group_vertex[:, 0]]]
+        self.support_points = vertices[group_vertex[:, 1]]
+        self.support_starts = np.searchsorted(group_vertex[:, 0], np.flatnonzero(used[len(bins):]))
+
+        self.batch_size = max(1, BATCH_ELEMENTS // max(len(self.bin_cross), len(self.support_points), len(self.ground_vertices), 1))
+
+    def __evaluate_batch__(self, up):
+        cz = self.bin_cross[:, 0, None]*up[:, 0] + self.bin_cross[:, 1, None]*up[:, 1] + self.bin_cross[:, 2, None]*up[:, 2]
+        angles = np.arccos(np.clip(-cz / self.bin_cross_norm[:, None], -1.0, 1.0))
+
+        heights = self.ground_vertices[:, 0, None]*up[:, 0] + self.ground_vertices[:, 1, None]*up[:, 1] + self.ground_vertices[:, 2, None]*up[:, 2]
+        ground_level = heights.min(axis=0)
+
+        # A support group is grounded if it is flat enough and its highest outline vertex is within ground_tolerance of the ground.
+        grounded = np.zeros(angles.shape, dtype=bool)
+        if len(self.support_points) > 0:
+            points = self.support_points
+            support_heights = points[:, 0, None]*up[:, 0] + points[:, 1, None]*up[:, 1] + points[:, 2, None]*up[:, 2]
+            highest = np.maximum.reduceat(support_heights, self.support_starts, axis=0)
+            grounded[self.bin_support] = (angles[self.bin_support] < min(FLAT_ANGLE, self.phi_min)) & (highest - ground_level <= self.ground_tolerance)
+
+        weights = overhang_weights(angles, grounded, np.abs(cz)/2, phi_min=self.phi_min)
+        return sequential_sum(weights, axis=0), np.any(grounded, axis=0)
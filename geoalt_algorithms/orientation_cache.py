@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+# Bump this whenever the scoring of orientations changes, so that old results are no longer used.
+CACHE_VERSION = 1
+
+# Default location and size limit (in bytes) of the cache.
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".geoalt", "orientation_cache")
+DEFAULT_CACHE_SIZE = 16*2**20
+
+class OrientationCache:
+    '''
+    On-disk cache of orientation optimization results.\n
+    Every entry is a small JSON file named after a hash of the mesh geometry and of the parameters that affect the scoring.
+    The modification time of a file is updated whenever it is used. Once the cache grows beyond max_size bytes,
+    the least recently used entries are removed.
+    '''
+    def __init__(self, directory=None, max_size=DEFAULT_CACHE_SIZE):
+        self.directory = directory if directory is not None else DEFAULT_CACHE_DIR
+        self.max_size = max_size
+
+    def key(self, mesh, **parameters):
+        '''
+        Create the key of a mesh (its vertex coordinates and faces) and the given scoring parameters.
+        '''
+        h = hashlib.sha256()
+        h.update(b"%d" % CACHE_VERSION)
+        for array in [mesh.vertices, mesh.faces]:
+            array = np.ascontiguousarray(array)
+            h.update(array.dtype.str.encode('utf-8'))
+            h.update(repr(array.shape).encode('utf-8'))
+            h.update(array.tobytes())
+        for name in sorted(parameters):
+            h.update(("%s=%r;" % (name, parameters[name])).encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, key):
+        '''
+        Returns the cached result of key, or None if there is none.
+        '''
+        path = self.__path__(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+            os.utime(path)  # Mark as recently used
+            return entry
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            # Unreadable or corrupt entries are treated as missing.
+            self.__remove__(path)
+            return None
+
+    def put(self, key, entry):
+        '''
+        Store the (JSON serializable) entry under key, and evict old entries if the cache has become too large.
+        '''
+        path = self.__path__(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = "%s.%d.tmp" % (path, os.getpid())
+            with open(temp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(temp_path, path)    # Never leave a partially written entry behind
+        except OSError as e:
+            print("Could not write to the orientation cache: %s" % e)
+            return
+        self.evict()
+
+    def evict(self):
+        '''
+        Remove the least recently used entries until the cache is no larger than max_size bytes.
+        '''
+        entries = []
+        for path in self.__entries__():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self.__remove__(path)
+            total_size -= size
+
+    def clear(self):
+        '''
+        Remove every entry of the cache.
+        '''
+        for path in self.__entries__():
+            self.__remove__(path)
+
+    def __path__(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def __entries__(self):
+        if os.path.isdir(self.directory) is False:
+            return []
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".json")]
+
+    def __remove__(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
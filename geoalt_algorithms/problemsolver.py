@@ -93,10 +93,10 @@ def check_and_correct_poles(face):
     '''
     Checks if a face contains a pole vertex, and then seeks to equalize all Z-indicies if such a pole is found.
     '''
-    for vertex in face.vertices:
-        if vertex.is_pole:
-            equalize_z_index(face.vertices[0], face.vertices[1], face.vertices[2])
-            return True
+    mesh = face.face_collection.mesh
+    if np.any(mesh.is_pole[mesh.faces[face.index]]):
+        equalize_z_index(face.vertices[0], face.vertices[1], face.vertices[2])
+        return True
 
     return False
         
@@ -107,3 +107,190 @@ def equalize_z_index(target_vertex, vertex1, vertex2):
     vertex1.set_array([vertex1.x(), vertex1.y(), target_vertex.z()])
     vertex2.set_array([vertex2.x(), vertex2.y(), target_vertex.z()])
     return
+
+def batch_single_face_algorithm(face_collection, face_indices, phi_min=np.pi/4, zero_phi_strategy=ZeroPhiStrategy.NONE):
+    '''
+    Run the additive single face algorithm on all of the given faces at once.\n
+    The faces are treated as if single_face_algorithm was called on each of them in the given order:
+    Faces with a pole vertex have their vertices equalized right away, one face at a time. Every other face reads
+    the z-coordinates as they were at its turn, and proposes the same moves as single_face_algorithm would.\n
+    The proposed moves are staged in the displacement accumulator of the mesh, in the same order as single_face_algorithm would stage them.
+    They are applied with mesh.apply_displacements().
+    '''
+    mesh = face_collection.mesh
+    face_indices = np.asarray(face_indices, dtype=np.int64).reshape(-1)
+    count = len(face_indices)
+    if count == 0:
+        return
+
+    corners = mesh.faces[face_indices].astype(np.int64)
+    z_start = mesh.vertices[:, 2].copy()
+
+    # Faces with a pole get their vertices equalized immediately, which later faces will see. Every write is logged.
+    has_pole = np.any(mesh.is_pole[corners], axis=1)
+    log_position, log_vertex, log_z = [], [], []
+    for position in np.flatnonzero(has_pole):
+        target, vertex1, vertex2 = corners[position]
+        z = mesh.vertices[target, 2]
+        for vertex in [vertex1, vertex2]:
+            mesh.move_vertex(vertex, [mesh.vertices[vertex, 0], mesh.vertices[vertex, 1], z])
+            log_position.append(position)
+            log_vertex.append(vertex)
+            log_z.append(z)
+    z_log = (np.array(log_position, dtype=np.int64), np.array(log_vertex, dtype=np.int64), np.array(log_z, dtype=np.float64))
+
+    # Coordinates of every face as they were at its turn. Only the z-coordinates are changed by the pole equalization.
+    positions = np.flatnonzero(~has_pole)
+    triangles = mesh.vertices[corners[positions]]
+    triangles[:, :, 2] = z_at(z_start, z_log, np.repeat(positions, 3), corners[positions].reshape(-1)).reshape(-1, 3)
+    z_cords = triangles[:, :, 2]
+
+    flat = (z_cords[:, 0] == z_cords[:, 1]) & (z_cords[:, 1] == z_cords[:, 2])
+    fix_positions = positions[~flat]
+    fix_triangles = triangles[~flat]
+    fix_corners = corners[fix_positions]
+
+    # Decide wether or not to use the original normal vector.
+    normal_vector = mesh.normals_original[face_indices[fix_positions]].copy()
+    recalculate = (normal_vector[:, 0] == 0) & (normal_vector[:, 1] == 0)
+    if np.any(recalculate):
+        t = fix_triangles[recalculate]
+        n = np.cross(t[:, 1] - t[:, 0], t[:, 2] - t[:, 1])
+        normal_vector[recalculate] = n / np.sqrt(row_dot(n, n))[:, None]
+
+    # The highest vertex is the anchor, the two others are pushed away from it.
+    index_lowest_first = np.argsort(fix_triangles[:, :, 2], axis=1, kind='stable')
+    rows = np.arange(len(fix_positions))
+    anchor = fix_triangles[rows, index_lowest_first[:, 2]]
+
+    tan_phi = math.tan(phi_min)
+    n_xy = np.column_stack([normal_vector[:, 0], normal_vector[:, 1], np.zeros(len(rows))])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n_xy_hat = n_xy / np.sqrt(row_dot(n_xy, n_xy))[:, None]
+
+    move_position, move_order, move_vertex, move_vector = [], [], [], []
+    for order, roaming_index in enumerate([index_lowest_first[:, 0], index_lowest_first[:, 1]]):
+        roaming = fix_triangles[rows, roaming_index]
+        delta_z = anchor[:, 2] - roaming[:, 2]
+        moves = ~((delta_z <= 0) | (delta_z < 0.01))
+
+        t_xy = delta_z[moves]/tan_phi
+        vector_xy = row_dot(anchor[moves] - roaming[moves], n_xy_hat[moves])
+        abs_diff = vector_xy - t_xy
+
+        move_position.append(fix_positions[moves])
+        move_order.append(np.full(np.count_nonzero(moves), order))
+        move_vertex.append(fix_corners[rows[moves], roaming_index[moves]])
+        move_vector.append(n_xy_hat[moves]*abs_diff[:, None])
+
+    # Flat overhangs are injected after the other moves, since whether a face is left alone depends on the moves proposed before it.
+    if zero_phi_strategy is ZeroPhiStrategy.INJECT and np.any(flat):
+        first_move = np.where(mesh.displacement_count > 0, -1, count)     # Changes staged before this batch count as earlier ones
+        for position, vertex in zip(move_position, move_vertex):
+            np.minimum.at(first_move, vertex, position)
+
+        inject_positions, inject_vertices, dz = inject_faces(face_collection, face_indices, positions[flat], first_move, z_start, z_log)
+        move_position.append(np.repeat(inject_positions, 2))
+        move_order.append(np.tile([0, 1], len(inject_positions)))
+        move_vertex.append(inject_vertices.reshape(-1))
+        move_vector.append(np.column_stack([np.zeros([2*len(dz), 2]), np.repeat(dz, 2)]))
+
+    move_position = np.concatenate(move_position)
+    order = np.lexsort((np.concatenate(move_order), move_position))
+    mesh.stage_displacements(np.concatenate(move_vertex)[order], np.concatenate(move_vector)[order])
+
+def inject_faces(face_collection, face_indices, positions, first_move, z_start, z_log):
+    '''
+    The array version of inject for the flat overhang faces at the given positions of face_indices (in increasing order).\n
+    first_move holds the position of the first face that proposed a move for each vertex. It is updated with the moves proposed here.\n
+    Returns the positions, the (M x 2) edge vertices and the z-displacements of the proposed injections, in position order.
+    '''
+    mesh = face_collection.mesh
+    if mesh.face_neighbours is None:
+        mesh.build_face_adjacency()
+    faces = face_indices[positions]
+    corners = mesh.faces[faces].astype(np.int64)
+
+    # Every pair of a flat face and one of its neighbours, in the order that inject visits them.
+    starts = mesh.face_neighbour_pointers[faces]
+    counts = mesh.face_neighbour_pointers[faces + 1] - starts
+    offsets = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+    pair_face = np.repeat(np.arange(len(faces)), counts)
+    entries = np.repeat(starts, counts) + offsets
+    neighbours = mesh.face_neighbours[entries]
+    pair_position = positions[pair_face]
+
+    # Top and bottom z of the faces and their neighbours, as they were at the turn of each flat face.
+    top_z = z_at(z_start, z_log, np.repeat(positions, 3), corners.reshape(-1)).reshape(-1, 3).max(axis=1)
+    neighbour_z = z_at(z_start, z_log, np.repeat(pair_position, 3), mesh.faces[neighbours].reshape(-1).astype(np.int64)).reshape(-1, 3)
+    neighbour_top_z = neighbour_z.max(axis=1)
+    neighbour_bottom_z = neighbour_z.min(axis=1)
+
+    # The first adjacent face that has an angle, and is underneath the flat face, decides its injection.
+    below = np.flatnonzero((mesh.angles[neighbours] > 0.017) & (top_z[pair_face] >= neighbour_top_z))
+    candidates, first = np.unique(pair_face[below], return_index=True)
+    chosen = below[first]
+
+    # Faces of vertices with changes staged before them are left alone.
+    staged = np.any(first_move[corners[candidates]] < positions[candidates][:, None], axis=1)
+    candidates = candidates[~staged]
+    chosen = chosen[~staged]
+    candidate_positions = positions[candidates]
+    candidate_vertices = mesh.edge_vertices[mesh.face_neighbour_edges[entries[chosen]]].astype(np.int64)
+    dz = (neighbour_bottom_z[chosen] - neighbour_top_z[chosen])/2
+
+    # An injection also leaves every later candidate with one of its two vertices alone. Find every such pair.
+    candidate_corners = corners[candidates].reshape(-1)
+    corner_order = np.argsort(candidate_corners, kind='stable')
+    sorted_corners = candidate_corners[corner_order]
+    injected = candidate_vertices.reshape(-1)
+    lo = np.searchsorted(sorted_corners, injected, side='left')
+    hi = np.searchsorted(sorted_corners, injected, side='right')
+    pair_counts = hi - lo
+    pair_offsets = np.arange(np.sum(pair_counts)) - np.repeat(np.cumsum(pair_counts) - pair_counts, pair_counts)
+    blocker = np.repeat(np.arange(len(injected)) // 2, pair_counts)
+    blocked = corner_order[np.repeat(lo, pair_counts) + pair_offsets] // 3
+    later = blocked > blocker
+    blocker, blocked = blocker[later], blocked[later]
+
+    # Settle the candidates in rounds. A candidate is injected once none of its blockers can be injected any more,
+    # and left alone as soon as one of them is. The first unsettled candidate is always settled, so this ends.
+    UNSETTLED, INJECTED, LEFT_ALONE = 0, 1, 2
+    state = np.zeros(len(candidates), dtype=np.int8)
+    while np.any(state == UNSETTLED):
+        blocker_state = state[blocker]
+        injected_blocker = np.bincount(blocked[blocker_state == INJECTED], minlength=len(candidates)) > 0
+        unsettled_blocker = np.bincount(blocked[blocker_state == UNSETTLED], minlength=len(candidates)) > 0
+        unsettled = state == UNSETTLED
+        state[unsettled & injected_blocker] = LEFT_ALONE
+        state[unsettled & ~injected_blocker & ~unsettled_blocker] = INJECTED
+
+    inject = state == INJECTED
+    np.minimum.at(first_move, candidate_vertices[inject].reshape(-1), np.repeat(candidate_positions[inject], 2))
+    return candidate_positions[inject], candidate_vertices[inject], dz[inject]
+
+def z_at(z_start, z_log, positions, vertices):
+    '''
+    Returns the z-coordinate of each vertex as it was when the face at the matching position was processed.
+    z_log holds the positions, vertices and new z-coordinates of all writes, in the order they were made.
+    '''
+    log_position, log_vertex, log_z = z_log
+    z = z_start[vertices]
+    if len(log_position) == 0:
+        return z
+
+    order = np.lexsort((log_position, log_vertex))
+    span = int(max(np.max(positions), np.max(log_position))) + 1 if len(positions) > 0 else 1
+    keys = log_vertex[order]*span + log_position[order]
+
+    # The last write to the vertex made before the position, if any.
+    last = np.searchsorted(keys, vertices*span + positions, side='left') - 1
+    written = (last >= 0) & (log_vertex[order][np.maximum(last, 0)] == vertices)
+    z[written] = log_z[order][last[written]]
+    return z
+
+def row_dot(a, b):
+    '''
+    Dot product of each row of a with the matching row of b, rounded exactly like np.dot on a single pair of vectors.
+    '''
+    return np.matmul(a[:, None, :], b[:, :, None])[:, 0, 0]
@@ -7,31 +7,28 @@ class ZeroPhiStrategy(Enum):
 def inject(face):
     '''
     This method is used to introduce an angle to an otherwise 0 angle plane
-    '''    
-    for edge in face.get_edges():
-        for f in edge.faces:
-            if (f is face):
-                continue
-
-            else:
-                # Check if changes are already staged
-                # This prevents a flat surface from being treated more than once.
-                for vertex in face.get_vertices():
-                    if len(vertex.change_set) != 0:
-                        # Changes has already been staged for this face. Leave it alone this iteration.
-                        return
+    '''
+    mesh = face.face_collection.mesh
+    neighbours, edges = mesh.adjacent_faces(face.index)
+    if len(neighbours) == 0:
+        return
 
-                # Check if adjacent face has an angle, and that it is underneath this face.
-                if f.angle > 0.017 and face.get_top_z() >= f.get_top_z():
+    # Check if changes are already staged
+    # This prevents a flat surface from being treated more than once.
+    if np.any(mesh.displacement_count[mesh.faces[face.index]] > 0):
+        # Changes has already been staged for this face. Leave it alone this iteration.
+        return
 
-                    z_array = f.get_vertices_as_arrays()[:,2]
-                    # Sort the indexes in order of highest to lowest z value
-                    z_array_sorted_indexes = np.argsort(z_array)
-                    # Set z diff to halfway to the bottom of the face
-                    dz = (z_array[z_array_sorted_indexes[0]] - z_array[z_array_sorted_indexes[2]])/2
+    # Check if an adjacent face has an angle, and that it is underneath this face.
+    below = np.flatnonzero((mesh.angles[neighbours] > 0.017) & (mesh.top_z([face.index])[0] >= mesh.top_z(neighbours)))
+    if len(below) == 0:
+        return
 
-                    # Introduce angle.
-                    edge.vertex1.add_change_partial(np.array([0,0,dz]))
-                    edge.vertex2.add_change_partial(np.array([0,0,dz]))
-                    return
+    # Set z diff to halfway to the bottom of the face
+    f = neighbours[below[0]]
+    dz = (mesh.bottom_z([f])[0] - mesh.top_z([f])[0])/2
 
+    # Introduce angle.
+    vertex1, vertex2 = mesh.edge_vertices[edges[below[0]]]
+    face.face_collection.get_vertex(int(vertex1)).add_change_partial(np.array([0,0,dz]))
+    face.face_collection.get_vertex(int(vertex2)).add_change_partial(np.array([0,0,dz]))
@@ -0,0 +1,159 @@
+import os
+import numpy as np
+
+from geoalt_stl.stl_creator import BINARY_FACET_DTYPE, BINARY_HEADER, ASCII_FACET_TEMPLATE, ASCII_WRITE_CHUNK_SIZE
+
+# Synthetic models of the benchmark. Every generator takes an approximate facet count and a random generator,
+# and returns an (F x 3 x 3) array of triangle corners. The same seed always gives the same model.
+
+def ellipsoid(facets, rng, radii=(10, 8, 6), centre=(0, 0, 0), roughness=0.03):
+    '''
+    A closed UV-ellipsoid with a slightly rough surface. Its whole lower half is overhang.
+    '''
+    rings = max(3, int(round(0.5 + np.sqrt(0.25 + facets/4))))
+    segments = 2*rings
+    theta = np.pi*np.arange(rings + 1)/rings
+    phi = 2*np.pi*np.arange(segments)/segments
+
+    # The radius varies per grid point. Each pole row has a single radius, so that its points stay equal.
+    scale = 1 + roughness*rng.standard_normal((rings + 1, segments))
+    scale[0, :] = scale[0, 0]
+    scale[-1, :] = scale[-1, 0]
+
+    points = np.stack([
+        np.sin(theta)[:, None]*np.cos(phi)[None, :],
+        np.sin(theta)[:, None]*np.sin(phi)[None, :],
+        np.repeat(np.cos(theta)[:, None], segments, axis=1)
+    ], axis=2)*scale[:, :, None]*np.array(radii, dtype=np.float64) + np.array(centre, dtype=np.float64)
+
+    i, j = np.meshgrid(np.arange(rings), np.arange(segments), indexing='ij')
+    a = points[i, j]
+    b = points[i + 1, j]
+    c = points[i + 1, (j + 1) % segments]
+    d = points[i, (j + 1) % segments]
+    upper = np.stack([a, b, d], axis=2)[1:]         # The first ring only has the lower triangles
+    lower = np.stack([b, c, d], axis=2)[:-1]        # The last ring only has the upper triangles
+    return np.concatenate([upper.reshape(-1, 3, 3), lower.reshape(-1, 3, 3)])
+
+def slab(top, bottom, size=20, origin=(0, 0)):
+    '''
+    A closed solid between two height fields given on the same (n x n) grid, spanning size in X and Y.
+    '''
+    n = len(top)
+    x, y = np.meshgrid(np.linspace(0, size, n) + origin[0], np.linspace(0, size, n) + origin[1], indexing='ij')
+    top_points = np.stack([x, y, top], axis=2)
+    bottom_points = np.stack([x, y, bottom], axis=2)
+
+    def grid_triangles(points, flip):
+        p00, p10, p11, p01 = points[:-1, :-1], points[1:, :-1], points[1:, 1:], points[:-1, 1:]
+        if flip is True:
+            first, second = np.stack([p00, p11, p10], axis=2), np.stack([p00, p01, p11], axis=2)
+        else:
+            first, second = np.stack([p00, p10, p11], axis=2), np.stack([p00, p11, p01], axis=2)
+        return np.concatenate([first.reshape(-1, 3, 3), second.reshape(-1, 3, 3)])
+
+    # The outline of the grid, counterclockwise seen from above, so that the walls face outwards.
+    k = np.arange(n - 1)
+    outline_i = np.concatenate([k, np.full(n - 1, n - 1), n - 1 - k, np.zeros(n - 1, dtype=int)])
+    outline_j = np.concatenate([np.zeros(n - 1, dtype=int), k, np.full(n - 1, n - 1), n - 1 - k])
+    t = top_points[outline_i, outline_j]
+    b = bottom_points[outline_i, outline_j]
+    t_next, b_next = np.roll(t, -1, axis=0), np.roll(b, -1, axis=0)
+    walls = np.concatenate([np.stack([b, b_next, t_next], axis=1), np.stack([b, t_next, t], axis=1)])
+
+    return np.concatenate([grid_triangles(top_points, False), grid_triangles(bottom_points, True), walls])
+
+def slab_grid_size(facets):
+    '''
+    Grid size of a slab with about the given amount of facets.
+    '''
+    return max(3, int(round(np.sqrt(1 + facets/4)))) + 1
+
+def wavy_top(n, height=4):
+    x, y = np.meshgrid(np.linspace(0, 2*np.pi, n), np.linspace(0, 2*np.pi, n), indexing='ij')
+    return height + 0.5*np.sin(2*x)*np.cos(3*y)
+
+def flat_bottom(facets, rng, size=20, origin=(0, 0)):
+    '''
+    A plate standing on a central foot. The ring around the foot is a flat overhang, surrounded by steep steps.
+    '''
+    n = slab_grid_size(facets)
+    x, y = np.meshgrid(np.linspace(-1, 1, n), np.linspace(-1, 1, n), indexing='ij')
+    bottom = np.where((np.abs(x) < 0.4) & (np.abs(y) < 0.4), 0, 1.5)
+    return slab(wavy_top(n), bottom, size=size, origin=origin)
+
+def poles(facets, rng, size=20, origin=(0, 0), share=0.02):
+    '''
+    A floating plate with single vertices dipping out of its flat bottom. Every dip is a pole.
+    '''
+    n = slab_grid_size(facets)
+    bottom = np.ones([n, n])
+    dips = rng.random((n - 2, n - 2)) < share
+    bottom[1:-1, 1:-1][dips] -= 0.5
+    return slab(wavy_top(n), bottom, size=size, origin=origin)
+
+def multi_body(facets, rng):
+    '''
+    Four separate bodies in one file: two ellipsoids and two plates.
+    '''
+    return np.concatenate([
+        ellipsoid(facets/4, rng, centre=(-15, -15, 8)),
+        ellipsoid(facets/4, rng, radii=(6, 6, 9), centre=(15, -15, 10)),
+        flat_bottom(facets/4, rng, origin=(-25, 5)),
+        poles(facets/4, rng, origin=(5, 5))
+    ])
+
+SHAPES = {
+    "overhang": ellipsoid,
+    "flat_bottom": flat_bottom,
+    "poles": poles,
+    "multi_body": multi_body
+}
+
+def generate(shape, facets, seed=0):
+    '''
+    Create the (F x 3 x 3) triangles of a synthetic model of the given shape, with about the given amount of facets.
+    '''
+    if shape not in SHAPES:
+        raise ValueError("No such benchmark shape. Can only be %s." % ", ".join(SHAPES))
+    return SHAPES[shape](facets, np.random.default_rng(seed))
+
+def unit_normals(triangles):
+    n = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(n, axis=1)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(lengths > 0, n/lengths, 0)
+
+def write_binary(path, triangles):
+    records = np.zeros(len(triangles), dtype=BINARY_FACET_DTYPE)
+    records['normal'] = unit_normals(triangles)
+    records['vertices'] = triangles
+    with open(path, 'wb') as f:
+        f.write(BINARY_HEADER + np.uint32(len(records)).tobytes() + records.tobytes())
+
+def write_ascii(path, triangles, precision=6):
+    template = ASCII_FACET_TEMPLATE.format("%%.%df" % precision)
+    with open(path, 'w', encoding="utf-8") as f:
+        f.write("solid GeoAltBenchmark\n")
+        for start in range(0, len(triangles), ASCII_WRITE_CHUNK_SIZE):
+            chunk = triangles[start:start + ASCII_WRITE_CHUNK_SIZE]
+            values = np.concatenate([unit_normals(chunk), chunk.reshape(-1, 9)], axis=1)
+            f.write((template*len(values)) % tuple(values.ravel().tolist()))
+        f.write("endsolid GeoAltBenchmark\n")
+
+def mesh_file(directory, shape, facets, file_format, seed=0):
+    '''
+    Returns the path of the benchmark model file of the given shape, size and format ("ascii" or "binary"),
+    and writes it first if it does not exist yet.
+    '''
+    path = os.path.join(directory, "%s_%d_%d.%s.stl" % (shape, facets, seed, file_format))
+    if os.path.exists(path) is False:
+        os.makedirs(directory, exist_ok=True)
+        triangles = generate(shape, facets, seed)
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        if file_format == "binary":
+            write_binary(temp_path, triangles)
+        else:
+            write_ascii(temp_path, triangles)
+        os.replace(temp_path, path)
+    return path
@@ -0,0 +1,119 @@
+import contextlib
+import datetime
+import json
+import os
+import platform
+import numpy as np
+
+from geoalt_algorithms.initiator import search_and_solve
+from geoalt_algorithms.zero_phi_strategy import ZeroPhiStrategy
+from geoalt_benchmarks.meshes import SHAPES, mesh_file
+
+# Bump this whenever the phases or the generated models change, so that results of different versions are not compared.
+# Version 2 times search_and_solve itself. Its edges phase is the whole leak check, and parsing reads the file in one go.
+BENCHMARK_VERSION = 2
+
+# Facet counts of the benchmark scales.
+SCALES = {"1k": 1000, "10k": 10000, "100k": 100000, "1m": 1000000}
+FORMATS = ["ascii", "binary"]
+
+# Phases that every case is timed in, in the order they are run. These are keys of the timings returned by search_and_solve.
+PHASES = ["parsing", "welding", "edges", "orientation", "problem_detection", "problem_correction", "writing"]
+
+def run_case(path, file_format, output_dir, iterations=5, phi_min=np.pi/4, orientation_resolution=np.pi/12, zero_phi_strategy=ZeroPhiStrategy.INJECT):
+    '''
+    Process a model with search_and_solve, and return the time it spent in every phase (in seconds).
+    The correction always runs the given amount of iterations, unless no warnings are left.\n
+    Returns the phase timings, the time of every correction iteration and the warning counts before and after the correction.
+    '''
+    output_path = os.path.join(output_dir, "output." + os.path.basename(path))
+
+    # Everything the pipeline prints would only disturb the measurements.
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        summary = search_and_solve(path, output_path,
+            phi_min=phi_min,
+            max_iterations=iterations,
+            convergence_break=False,
+            plot=False,
+            overwrite_output=True,
+            output_format=file_format,
+            zero_phi_strategy=zero_phi_strategy,
+            orientation_resolution=orientation_resolution,
+            check_leaks=True,
+            use_cache=False)
+
+    os.remove(output_path)
+    return {
+        "facets": summary["facets"],
+        "vertices": summary["vertices"],
+        "timings": {phase: summary["timings"][phase] for phase in PHASES},
+        "iterations": summary["iteration_timings"],
+        "warnings_before": summary["warnings_before"],
+        "warnings_after": summary["warnings_after"]
+    }
+
+def run_suite(work_dir, scales=("1k", "10k", "100k"), shapes=tuple(SHAPES), formats=tuple(FORMATS), repeat=3, iterations=5, seed=0, verbose=True):
+    '''
+    Run every combination of scale, shape and format. Models are generated in work_dir the first time they are needed.
+    Each case is run repeat times, and the fastest time of each phase is kept.\n
+    Returns the results as a JSON serializable dict.
+    '''
+    cases = []
+    for scale in scales:
+        for shape in shapes:
+            for file_format in formats:
+                name = "%s-%s-%s" % (shape, scale, file_format)
+                path = mesh_file(work_dir, shape, SCALES[scale], file_format, seed=seed)
+
+                runs = [run_case(path, file_format, work_dir, iterations=iterations) for _ in range(0, repeat)]
+                case = runs[-1]
+                case["timings"] = {phase: min(run["timings"][phase] for run in runs) for phase in PHASES}
+                case.update({"name": name, "shape": shape, "scale": scale, "format": file_format, "repeat": repeat})
+                cases.append(case)
+
+                if verbose is True:
+                    print("%-28s %8d facets  %s" % (name, case["facets"], "  ".join("%s %.3f" % (phase, case["timings"][phase]) for phase in PHASES)), flush=True)
+
+    return {
+        "version": BENCHMARK_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.platform(),
+        "seed": seed,
+        "cases": cases
+    }
+
+def compare_results(results, baseline, threshold=0.25, min_difference=0.01):
+    '''
+    Compare the phase timings of results to those of a baseline. A phase has regressed if it became more than threshold
+    (relative) and more than min_difference seconds slower. Cases or phases that are missing from either side are skipped.\n
+    Returns a list of the regressions.
+    '''
+    if baseline.get("version") != results.get("version"):
+        raise ValueError("The baseline was made by benchmark version %s, and can not be compared to version %s." % (baseline.get("version"), results.get("version")))
+
+    baseline_cases = {case["name"]: case for case in baseline["cases"]}
+    regressions = []
+    for case in results["cases"]:
+        reference = baseline_cases.get(case["name"])
+        if reference is None:
+            continue
+        for phase in PHASES:
+            if phase not in case["timings"] or phase not in reference["timings"]:
+                continue
+            current, previous = case["timings"][phase], reference["timings"][phase]
+            if current > previous*(1 + threshold) and current - previous > min_difference:
+                regressions.append({"case": case["name"], "phase": phase, "baseline": previous, "current": current, "ratio": current/previous if previous > 0 else float('inf')})
+    return regressions
+
+def load_results(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_results(path, results):
+    directory = os.path.dirname(path)
+    if directory != "":
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
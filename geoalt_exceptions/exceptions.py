@@ -5,4 +5,7 @@ class OutputFileExists(Exception):
     pass
 
 class InvalidInputArgument(Exception):
+    pass
+
+class InvalidSTLFile(Exception):
     pass
\ No newline at end of file
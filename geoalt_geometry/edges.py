@@ -1,41 +1,137 @@
-class EdgeCollection(set):
+import numpy as np
+
+class EdgeCollection:
     '''
-    Collection of Edge objects
+    Collection of Edge objects. The edges are views of the edge table of the IndexedMesh behind a FaceCollection.
     '''
-    def __init__(self):
-        self.edges = []
-        self.faces = []
-    
+    def __init__(self, face_collection):
+        self.face_collection = face_collection
+        self.edge_views = {}
+
+    def __len__(self):
+        return len(self.face_collection.mesh.edge_vertices)
+
+    def __iter__(self):
+        for i in range(0, len(self)):
+            yield self.get_edge(i)
+
+    def get_edge(self, index):
+        '''
+        Returns the Edge view of the edge with the given index. There is only ever one view per edge.
+        '''
+        edge = self.edge_views.get(index)
+        if edge is None:
+            edge = Edge(self.face_collection, index)
+            self.edge_views[index] = edge
+        return edge
+
     def add(self, edge):
+        '''
+        Returns the edge of the collection between the same two vertices as edge. Edges are derived from the faces of the mesh,
+        so an edge can only be added by adding a face that holds it (see FaceCollection.append). Raises ValueError for any other edge.
+        '''
         if (isinstance(edge, Edge) is False):
             raise TypeError('Edge argument needs to be of type Edge.')
-        else:
-            contains_res = self.contains(edge)
-            if contains_res is not None:
-                return contains_res
 
-            super().add(edge)
-            return edge
-    
+        contains_res = self.contains(edge)
+        if contains_res is None:
+            raise ValueError("No face of the model holds this edge. Add the face instead.")
+        return contains_res
+
     def contains(self, edge):
         '''
-        Check if edge exists in set.
+        Check if an edge between the same two vertices exists in the collection.
+        O(log n), since the edge table is sorted by vertex pair.
         '''
+        edge_vertices = self.face_collection.mesh.edge_vertices
+        key = edge.key()
+        lo = np.searchsorted(edge_vertices[:, 0], key[0], side='left')
+        hi = np.searchsorted(edge_vertices[:, 0], key[0], side='right')
+        pos = lo + np.searchsorted(edge_vertices[lo:hi, 1], key[1])
+        if pos < hi and edge_vertices[pos, 1] == key[1]:
+            return self.get_edge(int(pos))
+        return None
+
+
+def build_edge_table(face_vertices):
+    '''
+    Identify every edge of a triangle mesh by the sorted pair of its vertex indices, using a single sort/unique.\n
+    face_vertices: (F x 3) array with the vertex indices of each face.\n
+    Returns:\n
+        edge_vertices: (E x 2) array of sorted vertex index pairs.\n
+        face_edges: (F x 3) array with the edge index of (v0, v1), (v1, v2) and (v2, v0) of each face.\n
+        edge_face_pointers, edge_faces: The faces of each edge in CSR form. The faces of edge e are edge_faces[edge_face_pointers[e]:edge_face_pointers[e+1]].
+    '''
+    face_vertices = np.asarray(face_vertices, dtype=np.int64).reshape(-1, 3)
+    face_count = len(face_vertices)
+
+    # One row per face edge, ordered as edge1, edge2 and edge3 of each face
+    pairs = face_vertices[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+    pairs.sort(axis=1)
+    vertex_count = int(face_vertices.max()) + 1 if face_count > 0 else 0
+    keys = pairs[:, 0]*vertex_count + pairs[:, 1]
+
+    edge_keys, first, face_edges = np.unique(keys, return_index=True, return_inverse=True)
+    edge_vertices = pairs[first]
+    face_edges = face_edges.reshape(face_count, 3)
+
+    # Group the faces by edge. A face is only listed once per edge, even if it is degenerate.
+    incidence = np.unique(face_edges.reshape(-1)*face_count + np.repeat(np.arange(face_count), 3))
+    edge_faces = incidence % face_count if face_count > 0 else incidence
+    counts = np.bincount(incidence // max(face_count, 1), minlength=len(edge_keys))
+    edge_face_pointers = np.concatenate([[0], np.cumsum(counts)])
+
+    return edge_vertices, face_edges, edge_face_pointers, edge_faces
+
+def check_manifold(mesh, sample_count=5):
+    '''
+    Classify every edge of an IndexedMesh by the amount of faces that share it: boundary edges have one face,
+    manifold edges two, and non-manifold edges more than two. A closed, watertight model only has manifold edges.\n
+    Returns a dict with the amount of edges of each kind, and the midpoints of up to sample_count
+    boundary and non-manifold edges as lists of [x, y, z].
+    '''
+    counts = np.diff(mesh.edge_face_pointers)
+    boundary = np.flatnonzero(counts == 1)
+    non_manifold = np.flatnonzero(counts > 2)
+
+    def midpoints(edge_indices):
+        vertices = mesh.vertices[mesh.edge_vertices[edge_indices[:sample_count]]]
+        return (vertices.sum(axis=1)/2).tolist()
+
+    return {
+        "edges": len(counts),
+        "boundary": len(boundary),
+        "manifold": int(np.count_nonzero(counts == 2)),
+        "non_manifold": len(non_manifold),
+        "boundary_samples": midpoints(boundary),
+        "non_manifold_samples": midpoints(non_manifold)
+    }
+
 
-        if edge in self:
-            for e in self:
-                if e.__eq__(edge):
-                    return e
-        else:
-            return None
-        raise IndexError("Something went terribly wrong when using contains method in edge collection.")
-    
-    
 class Edge:
-    def __init__(self, vertex1, vertex2):
-        self.vertex1 = vertex1
-        self.vertex2 = vertex2
-        self.faces = []
+    '''
+    View of a single edge of the IndexedMesh behind a FaceCollection.
+    '''
+    def __init__(self, face_collection, index):
+        self.face_collection = face_collection
+        self.index = index
+
+    @property
+    def vertex1(self):
+        return self.face_collection.get_vertex(int(self.face_collection.mesh.edge_vertices[self.index, 0]))
+
+    @property
+    def vertex2(self):
+        return self.face_collection.get_vertex(int(self.face_collection.mesh.edge_vertices[self.index, 1]))
+
+    @property
+    def faces(self):
+        '''
+        All faces that share this edge, in face order.
+        '''
+        mesh = self.face_collection.mesh
+        face_indices = mesh.edge_faces[mesh.edge_face_pointers[self.index]:mesh.edge_face_pointers[self.index + 1]]
+        return [self.face_collection.get_face(int(i)) for i in face_indices]
     
     def __eq__(self, other):
 
@@ -47,12 +143,12 @@ class Edge:
         return False
 
     def __hash__(self):
-        # TODO: Optimize.
-        h = hash(self.vertex1.z() + self.vertex2.z()) # Z coordinates don't change.
-        return h
-
-    def associate_with_face(self, face):
-        if face not in self.faces:
-            self.faces.append(face)
-        else:
-            print("The model is broken beyond repair.")
\ No newline at end of file
+        return hash(self.key())
+
+    def key(self):
+        '''
+        Returns the sorted pair of vertex indices that identifies this edge.
+        '''
+        if self.vertex1.index < self.vertex2.index:
+            return (self.vertex1.index, self.vertex2.index)
+        return (self.vertex2.index, self.vertex1.index)
@@ -1,54 +1,89 @@
 import numpy as np
 
-from geoalt_geometry.vertices import Vertex, VertexCollection
-from geoalt_geometry.edges import Edge, EdgeCollection
-from timeit import default_timer as timer
+from geoalt_geometry.vertices import Vertex
+from geoalt_geometry.edges import EdgeCollection
+
+FLAT_ANGLE = 0.087      # Faces with an overhang angle smaller than this (5 degrees) are considered to be flat.
 
 class FaceCollection:
     '''
-    Collection of Face objects
+    Collection of Face objects.\n
+    The geometry is stored in the IndexedMesh of the STL file. Face, Vertex and Edge objects are thin views of it,
+    and are only created when they are asked for.
     '''
     def __init__(self, stlfile):
         self.stlfile = stlfile
-        self.faces = []
-        self.problem_faces = []
-        self.good_faces = []
+        self.mesh = stlfile.mesh
 
-        self.vertex_collection = VertexCollection()
-        self.edge_collection = EdgeCollection()
+        self.face_views = {}
+        self.vertex_views = {}
+        self.edge_collection = EdgeCollection(self)
 
         self.iterator_pointer = 0
         self.total_weight = 0
-    
-    def append(self, face, ignore_edges=False):
+
+    @property
+    def faces(self):
         '''
-        Add face to face collection
+        All faces, in the order of the STL file.
         '''
+        return [self.get_face(i) for i in range(0, len(self.mesh.faces))]
 
-        if (isinstance(face, Face) is False):
-            raise TypeError('face argument needs to be of type Face()')
-        if face.has_bad_angle is True:
-            self.problem_faces.append(face)
-        else:
-            self.good_faces.append(face)
+    @property
+    def problem_faces(self):
+        '''
+        All faces that were marked as problematic by the latest problem check, in the order of the STL file.
+        '''
+        return [self.get_face(int(i)) for i in np.flatnonzero(self.mesh.bad)]
 
+    @property
+    def good_faces(self):
+        '''
+        All faces that were not marked as problematic by the latest problem check, in the order of the STL file.
+        '''
+        return [self.get_face(int(i)) for i in np.flatnonzero(~self.mesh.bad)]
+
+    def get_face(self, index):
+        '''
+        Returns the Face view of the face with the given index. There is only ever one view per face.
+        '''
+        face = self.face_views.get(index)
+        if face is None:
+            face = Face(self, index)
+            self.face_views[index] = face
+        return face
 
-        # This is where it is ensured using OOP that there only exists one instance of each unique vertex
-        face.vertices[0] = self.vertex_collection.add(face.vertices[0])
-        face.vertices[1] = self.vertex_collection.add(face.vertices[1])
-        face.vertices[2] = self.vertex_collection.add(face.vertices[2])
+    def append(self, face, ignore_edges=False):
+        '''
+        Add a copy of a face to the face collection. The face is usually a Face of another collection. Its corners are welded
+        to the vertices of this model, and its classification is copied along.\n
+        ignore_edges is only kept for compatibility: the edge table always covers every face, and is built again the next time it is needed.
+        Appending faces one at a time rebuilds the mesh arrays every time. IndexedMesh.add_faces adds many faces at once.\n
+        Returns the view of the new face.
+        '''
+        if (isinstance(face, Face) is False):
+            raise TypeError('face argument needs to be of type Face()')
 
-        # Each unique vertex is marked as adjacent to the other vertices in the face.
-        face.vertices[0].set_adjacency(face.vertices[1])
-        face.vertices[0].set_adjacency(face.vertices[2])
-        face.vertices[1].set_adjacency(face.vertices[2])
+        source = face.face_collection.mesh
+        index = int(self.mesh.add_faces(face.get_vertices_as_arrays(), source.file_normals[face.index])[0])
+        self.mesh.angles[index], self.mesh.weights[index] = face.angle, face.weight
+        self.mesh.grounded[index], self.mesh.bad[index] = face.grounded, face.has_bad_angle
 
-        self.faces.append(face)
-        
-        if ignore_edges is not True:
-            face.set_edges(self.edge_collection)
+        # The mesh arrays were replaced by larger ones, and edge indices may have changed.
+        self.stlfile.vertices = self.mesh.vertices
+        self.stlfile.normals = self.mesh.file_normals
+        self.edge_collection.edge_views = {}
+        return self.get_face(index)
 
-        return
+    def get_vertex(self, index):
+        '''
+        Returns the Vertex view of the vertex with the given index. There is only ever one view per vertex.
+        '''
+        vertex = self.vertex_views.get(index)
+        if vertex is None:
+            vertex = Vertex(self, index)
+            self.vertex_views[index] = vertex
+        return vertex
     
     def __iter__(self):
         '''
@@ -60,107 +95,215 @@ class FaceCollection:
         '''
         Contributes to making this class iterable by providing a pointer.
         '''
-        if self.iterator_pointer > (len(self.faces) - 1):
+        if self.iterator_pointer > (len(self.mesh.faces) - 1):
             self.iterator_pointer = 0
             raise StopIteration
         else: 
             self.iterator_pointer += 1
-            return self.faces[self.iterator_pointer - 1]
+            return self.get_face(self.iterator_pointer - 1)
     
     def get_warning_count(self):
         '''
         Returns the amount of potentially problematic faces
         '''
-        return len(self.problem_faces)
+        return int(np.count_nonzero(self.mesh.bad))
 
     def get_vertices(self, vtype="all"):
-        return_array = []
         if vtype=="all":
-            for f in self.faces:
-                return_array.append(f.get_vertices_as_arrays())
+            return list(self.mesh.triangles())
         elif vtype=="bad":
-            for f in self.problem_faces:
-                return_array.append(f.get_vertices_as_arrays())
+            return list(self.mesh.triangles(self.mesh.bad))
         elif vtype=="good":
-            for f in self.good_faces:
-                return_array.append(f.get_vertices_as_arrays())
-        return return_array
+            return list(self.mesh.triangles(~self.mesh.bad))
+        return []
 
     def get_vertex_collection(self):
-        return self.vertex_collection
+        '''
+        Returns views of all vertices of the model.
+        '''
+        return [self.get_vertex(i) for i in range(0, len(self.mesh.vertices))]
 
-    def check_for_problems(self, phi_min=np.pi/4, ignore_grounded=False, ground_level=0, ground_tolerance=0.01, angle_tolerance=0.017):
-        self.total_weight = 0
-        self.good_faces = []
-        self.problem_faces = []
-        for f in self.faces:
-            f.refresh_normal_vector()
-            has_bad_angle = f.check_for_problems(phi_min=phi_min, ignore_grounded=ignore_grounded, ground_level=ground_level, ground_tolerance=ground_tolerance, angle_tolerance=angle_tolerance, no_weight_update=False)
-            if has_bad_angle is True:
-                self.problem_faces.append(f)
-            else: 
-                self.good_faces.append(f)
+    def check_for_problems(self, phi_min=np.pi/4, ignore_grounded=False, ground_level=0, ground_tolerance=0.01, angle_tolerance=0.017, only_moved=False):
+        '''
+        Classify all faces at once, and update the normals, angles, grounded flags, bad angle flags and weights of the mesh.\n
+        only_moved: Only re-classify the faces of the vertices that have moved since the previous check, and update the total weight
+        by the difference. The other faces keep their classification, so the previous check needs to have used the same parameters.
+        '''
+        mesh = self.mesh
+        moved = mesh.take_moved_vertices()
+
+        if only_moved is False:
+            mesh.normals[:], mesh.angles[:], mesh.grounded[:], mesh.bad[:], mesh.weights[:] = evaluate_faces(mesh.triangles(), phi_min=phi_min, ignore_grounded=ignore_grounded, ground_level=ground_level, ground_tolerance=ground_tolerance, angle_tolerance=angle_tolerance)
+            self.total_weight = sequential_sum(mesh.weights)
+            flat_grounded = mesh.grounded & (mesh.angles < FLAT_ANGLE)
+        else:
+            face_indices = mesh.incident_faces(moved)
+            if len(face_indices) == 0:
+                return
+            previous_weights = mesh.weights[face_indices]
+            n_hat, angles, grounded, bad, weights = evaluate_faces(mesh.triangles(face_indices), phi_min=phi_min, ignore_grounded=ignore_grounded, ground_level=ground_level, ground_tolerance=ground_tolerance, angle_tolerance=angle_tolerance)
+            mesh.normals[face_indices], mesh.angles[face_indices], mesh.grounded[face_indices], mesh.bad[face_indices], mesh.weights[face_indices] = n_hat, angles, grounded, bad, weights
+            self.total_weight += sequential_sum(weights) - sequential_sum(previous_weights)
+            flat_grounded = grounded & (angles < FLAT_ANGLE)
+
+        if np.any(flat_grounded):
+            self.stlfile.grounded = True    # Mark this orientation as grounded.
+
+
+def evaluate_faces(triangles, phi_min=np.pi/4, ignore_grounded=False, ground_level=0, ground_tolerance=0.01, angle_tolerance=0.017):
+    '''
+    Check a batch of faces for problems. This is the array version of Face.check_for_problems.\n
+    triangles: (F x 3 x 3) array with the corner coordinates of each face.\n
+    Returns the normalized normal vectors, angles, grounded flags, bad angle flags and weights of the faces.
+    '''
+    triangles = np.asarray(triangles, dtype=np.float64)
+    vector1 = triangles[:, 1] - triangles[:, 0]
+    vector2 = triangles[:, 2] - triangles[:, 0]
+    n = np.cross(vector1, vector2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n_hat = n / np.linalg.norm(n, axis=1)[:, None]
+
+    # Check the angle of the normal factor, and compare it to that of the inverted z-unit vector
+    angles = np.arccos(np.clip(-n_hat[:, 2], -1.0, 1.0))
+
+    # Only faces within the problem threshold are checked for contact with the ground
+    in_threshold = (angles >= 0) & (angles < phi_min)
+    grounded = in_threshold & np.all(np.abs(triangles[:, :, 2] - ground_level) <= ground_tolerance, axis=1)
+
+    # A face has a bad angle if it is within the problem threshold, is not on the ground and is outside of the tolerance.
+    bad = in_threshold & ~(grounded & (ignore_grounded is False)) & ~((angles - phi_min)**2 < angle_tolerance**2)
+
+    weights = overhang_weights(angles, grounded, projected_areas(triangles), phi_min=phi_min)
+    return n_hat, angles, grounded, bad, weights
+
+def projected_areas(triangles):
+    '''
+    Calculate the area of the projection of each face onto the XY plane.
+    '''
+    vector1 = triangles[:, 1] - triangles[:, 0]
+    vector2 = triangles[:, 2] - triangles[:, 0]
+    return np.abs(vector1[:, 0]*vector2[:, 1] - vector1[:, 1]*vector2[:, 0])/2
+
+def overhang_weights(angles, grounded, areas, phi_min=np.pi/4):
+    '''
+    Calculate the overhang weight of each face from its angle, grounded flag and projected area.
+    '''
+    with np.errstate(invalid='ignore'):
+        weight_per_area = np.select([
+            (angles < FLAT_ANGLE) & ~grounded,      # 5 degrees or less: Considered as flat overhang.
+            (angles < FLAT_ANGLE) & grounded,       # Discount for flat surfaces touching the ground. Easier to remove from substrate.
+            angles < phi_min,
+            (phi_min < angles) & (angles < (np.pi/2 - FLAT_ANGLE))
+        ], [
+            100,
+            -80,
+            63.74 - angles * 42.96,     # Linear proportion. 1 deg overhang = 60 weight per area, 30 deg overhang = 30 weight per area
+            21.23 - angles * 14.3       # Linear proportion. 45 deg overhang = 10 wpa, 89 deg overhang = 0 wpa
+        ], default=0)
+    return weight_per_area * areas
+
+def sequential_sum(values, axis=0):
+    '''
+    Sum values one by one in order, like a Python loop would. Unlike np.sum the result does not depend on how numpy splits up the work.
+    '''
+    if np.shape(values)[axis] == 0:
+        return np.sum(values, axis=axis)
+    return np.take(np.cumsum(values, axis=axis), -1, axis=axis)
 
 
 class Face:
     '''
-    STL polygon face
+    View of a single STL polygon face of the IndexedMesh behind a FaceCollection.
     '''
-    def __init__(self, face_collection, normal_index, vertex_index):
+    def __init__(self, face_collection, index):
         '''
-        vert1, vert2, vert3: vertices of a polygon\n
-        n: normal vector\n
-        phi_min: minimum angular difference between normal vector and -z_hat before marked as a problematic surface
+        face_collection: The FaceCollection that this face belongs to\n
+        index: The index of the face in the mesh
         '''
         self.face_collection = face_collection
-        self.normal_index = None
-        self.vertex_index = None
-
-        self.vertices = []
-
-        self.weight = 0
-
-        self.edge1 = None
-        self.edge2 = None
-        self.edge3 = None
+        self.index = index
 
         self.n = None                   # The normal vector
-        self.n_hat = None               # Normalized normal vector (unit vector)
-        self.n_hat_original = None      # The original normalized normal vector from when the model was loaded the first time
-        self.has_bad_angle = None       # True if this face has a problematic angle
-        self.angle = None               # The angle compared to the xy-plane
-        self.grounded = False
         self.vector1 = None
         self.vector2 = None
 
-    def set_edges(self, edge_collection):
-        # SLOW:
-        self.edge1 = edge_collection.add(Edge(self.vertices[0], self.vertices[1]))
-        self.edge2 = edge_collection.add(Edge(self.vertices[1], self.vertices[2]))
-        self.edge3 = edge_collection.add(Edge(self.vertices[2], self.vertices[0]))
-        
-        # FAST:
-        self.edge1.associate_with_face(self)
-        self.edge2.associate_with_face(self)
-        self.edge3.associate_with_face(self)
+    @property
+    def vertices(self):
+        mesh_face = self.face_collection.mesh.faces[self.index]
+        return [self.face_collection.get_vertex(int(mesh_face[0])), self.face_collection.get_vertex(int(mesh_face[1])), self.face_collection.get_vertex(int(mesh_face[2]))]
+
+    @property
+    def edge1(self):
+        return self.face_collection.edge_collection.get_edge(int(self.face_collection.mesh.face_edges[self.index, 0]))
+
+    @property
+    def edge2(self):
+        return self.face_collection.edge_collection.get_edge(int(self.face_collection.mesh.face_edges[self.index, 1]))
+
+    @property
+    def edge3(self):
+        return self.face_collection.edge_collection.get_edge(int(self.face_collection.mesh.face_edges[self.index, 2]))
+
+    @property
+    def n_hat(self):
+        '''
+        Normalized normal vector (unit vector)
+        '''
+        return self.face_collection.mesh.normals[self.index]
+
+    @property
+    def n_hat_original(self):
+        '''
+        The original normalized normal vector from when the model was loaded the first time
+        '''
+        return self.face_collection.mesh.normals_original[self.index]
+
+    @property
+    def has_bad_angle(self):
+        '''
+        True if this face has a problematic angle
+        '''
+        return bool(self.face_collection.mesh.bad[self.index])
+
+    @has_bad_angle.setter
+    def has_bad_angle(self, value):
+        self.face_collection.mesh.bad[self.index] = value
 
-    def __connect_vertices__(self):
+    @property
+    def angle(self):
         '''
-        Connect all vertices to each other
+        The angle compared to the xy-plane
         '''
-        self.vertices[0].set_adjacency(self.vertices[1])
-        self.vertices[0].set_adjacency(self.vertices[2])
-        self.vertices[1].set_adjacency(self.vertices[2])
+        return self.face_collection.mesh.angles[self.index]
+
+    @angle.setter
+    def angle(self, value):
+        self.face_collection.mesh.angles[self.index] = value
+
+    @property
+    def grounded(self):
+        return bool(self.face_collection.mesh.grounded[self.index])
+
+    @grounded.setter
+    def grounded(self, value):
+        self.face_collection.mesh.grounded[self.index] = value
+
+    @property
+    def weight(self):
+        return self.face_collection.mesh.weights[self.index]
+
+    @weight.setter
+    def weight(self, value):
+        self.face_collection.mesh.weights[self.index] = value
 
     def get_top_z(self):
-        z_array = np.array(self.get_vertices_as_arrays())[:,2]
-        return z_array[np.argsort(z_array)[2]]
+        return self.face_collection.mesh.top_z([self.index])[0]
 
     def refresh_normal_vector(self):
         self.vector1 = self.vertices[1].get_array() - self.vertices[0].get_array()
         self.vector2 = self.vertices[2].get_array() - self.vertices[0].get_array()
         self.n = np.cross(self.vector1, self.vector2)
-        self.n_hat = self.n/np.linalg.norm(self.n)
+        self.face_collection.mesh.normals[self.index] = self.n/np.linalg.norm(self.n)
         return self.n_hat
     
     def check_for_problems(self, phi_min=np.pi/4, ignore_grounded=False, ground_level=0, ground_tolerance = 0.01, angle_tolerance = 0.017, no_weight_update=True):
@@ -176,66 +319,21 @@ class Face:
         angle_tolerance: How close to the phi_min an angle needs to be in order to be considered as acceptable. 
         Setting this to 0 causes the problem correction process to take much more time.\n
         '''
-        # Check the angle of the normal factor, and compare it to that of the inverted z-unit vector
-        neg_z_hat = [0,0,-1]
-        angle = np.arccos(np.clip(np.dot(self.n_hat, neg_z_hat), -1.0, 1.0))
-        self.angle = angle
-        self.grounded = False
-        return_value = None
-        
-        # Check if angle is within problem threshold
-        if angle >= 0 and angle < phi_min:
-
-            self.grounded = self.check_grounded(ground_level, ground_tolerance)
-            if self.grounded is True and ignore_grounded is False:  # Check if grounded
-                self.has_bad_angle = False
-                return_value = False
-                
-            elif (angle - phi_min)**2 < angle_tolerance**2:         # Check if inside tolerence
-                self.has_bad_angle = False
-                return_value = False
-
-            else:
-                # If the angle is bad, and it is not on the ground, and is outside of tolerances, then mark it as a bad angle.
-                self.has_bad_angle = True
-                return_value = True
-
-        else:
-            # The angle is outside of the problem threshold and should thus be marked as an accepted angle.
-            self.has_bad_angle = False
-            return_value = False
+        n_hat, angles, grounded, bad, weights = evaluate_faces(self.get_vertices_as_arrays()[None], phi_min=phi_min, ignore_grounded=ignore_grounded, ground_level=ground_level, ground_tolerance=ground_tolerance, angle_tolerance=angle_tolerance)
+        self.angle = angles[0]
+        self.grounded = grounded[0]
+        self.has_bad_angle = bad[0]
 
         # Calculate weight
         self.calculate_weight(phi_min=phi_min, no_update=no_weight_update)
-        return return_value
+        return bool(bad[0])
 
     def calculate_weight(self, phi_min = np.pi/4, no_update=True):
+        tri = self.get_vertices_as_arrays()
+        weight = overhang_weights(np.array([self.angle]), np.array([self.grounded]), projected_areas(tri[None]), phi_min=phi_min)[0]
 
-        # Calculate area of projection onto XY plane
-        cross = np.cross([self.vector1[0], self.vector1[1], 0], [self.vector2[0], self.vector2[1], 0])
-        area = np.linalg.norm(cross)/2
-
-        # Calculate constants:
-        m_heavy = 63.74
-        k_heavy = 42.96
-
-        m_light = 21.23
-        k_light = 14.3
-
-        weightPerArea = 0
-        if self.angle < 0.087:
-            # 5 degrees or less: Considered as flat overhang. 
-            if self.grounded is False:
-                weightPerArea = 100
-            else:
-                weightPerArea = -80 # Discount for flat surfaces touching the ground. Easier to remove from substrate.
-                self.face_collection.stlfile.grounded = True    # Mark this orientation as grounded.
-        elif self.angle < phi_min:
-            weightPerArea = 63.74 - self.angle * 42.96      # Linear proportion. 1 deg overhang = 60 weight per area, 30 deg overhang = 30 weight per area
-        elif phi_min < self.angle and self.angle < (np.pi/2 - 0.087): 
-            weightPerArea = 21.23 - self.angle * 14.3       # Linear proportion. 45 deg overhang = 10 wpa, 89 deg overhang = 0 wpa
-        
-        weight = weightPerArea * area
+        if self.angle < FLAT_ANGLE and self.grounded is True:
+            self.face_collection.stlfile.grounded = True    # Mark this orientation as grounded.
         
         if no_update is False:
             self.weight = weight
@@ -244,7 +342,7 @@ class Face:
         return weight
 
     def get_vertices_as_arrays(self):
-        return np.array([self.vertices[0].get_array(), self.vertices[1].get_array(), self.vertices[2].get_array()])
+        return self.face_collection.mesh.triangles(self.index)
 
     def get_vertices(self):
         return [self.vertices[0], self.vertices[1], self.vertices[2]]
@@ -0,0 +1,350 @@
+import numpy as np
+
+from geoalt_geometry.edges import build_edge_table
+from geoalt_geometry.vertices import weld_vertices
+
+class IndexedMesh:
+    '''
+    Indexed triangle mesh stored as a struct of arrays.\n
+    Vertex coordinates are kept in one contiguous (N x 3) float64 array, and each face refers to its three vertices
+    through an (F x 3) int32 index array. Every per-face property is stored in its own array, indexed by face.
+    '''
+    def __init__(self, vertices, faces, file_normals=None):
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float64).reshape(-1, 3)   # (N x 3) vertex coordinates
+        self.faces = np.ascontiguousarray(faces, dtype=np.int32).reshape(-1, 3)          # (F x 3) vertex indices of each face
+
+        face_count = len(self.faces)
+        if file_normals is None:
+            file_normals = np.zeros([face_count, 3])
+        self.file_normals = np.asarray(file_normals, dtype=np.float64).reshape(-1, 3)   # Normals as stored in the STL file
+
+        # Per face attributes
+        self.normals = np.zeros([face_count, 3])            # Normalized normal vectors (n_hat)
+        self.normals_original = np.zeros([face_count, 3])   # Normalized normal vectors from when the model was loaded
+        self.angles = np.zeros(face_count)                  # Angle between the normal vector and -z
+        self.weights = np.zeros(face_count)                 # Overhang weight
+        self.grounded = np.zeros(face_count, dtype=bool)    # True if the face is touching the ground
+        self.bad = np.zeros(face_count, dtype=bool)         # True if the face has a problematic angle
+
+        # Displacements proposed by the problem solver that have not been applied yet. Filled in by stage_displacements().
+        self.displacement_sum = np.zeros([len(self.vertices), 3])                  # Sum of the proposed displacements of each vertex
+        self.displacement_count = np.zeros(len(self.vertices), dtype=np.int64)     # Amount of proposed displacements of each vertex
+
+        # Vertices that have been moved since the last problem check. Filled in by move_vertex().
+        self.moved_vertices = set()
+
+        # Faces of every vertex. Filled in by build_vertex_faces().
+        self.vertex_face_pointers = None    # (N + 1) CSR pointers into vertex_faces
+        self.vertex_faces = None            # Indices of the faces of each vertex, in face order
+
+        # Adjacent vertices of every vertex. Filled in by build_vertex_adjacency().
+        self.vertex_neighbour_pointers = None   # (N + 1) CSR pointers into vertex_neighbours
+        self.vertex_neighbours = None           # Indices of the adjacent vertices of each vertex, in increasing order
+
+        # Faces that share an edge with every face (the dual graph of the mesh). Filled in by build_face_adjacency().
+        self.face_neighbour_pointers = None     # (F + 1) CSR pointers into face_neighbours
+        self.face_neighbours = None             # Indices of the adjacent faces of each face, by edge and then in face order
+        self.face_neighbour_edges = None        # The shared edge of each entry of face_neighbours
+
+        # Topology that is only built once something asks for it. See the edge table and is_pole properties.
+        self._edge_table = None     # (edge_vertices, face_edges, edge_face_pointers, edge_faces), filled in by build_edges()
+        self._is_pole = None        # Per vertex pole flags, filled in by detect_poles()
+
+        self.refresh_normals()
+        self.normals_original[:] = self.normals
+
+    @property
+    def edge_vertices(self):
+        '''
+        (E x 2) sorted vertex index pairs of the edges.
+        '''
+        return self.__edge_table__()[0]
+
+    @property
+    def face_edges(self):
+        '''
+        (F x 3) edge index of (v0, v1), (v1, v2) and (v2, v0) of each face.
+        '''
+        return self.__edge_table__()[1]
+
+    @property
+    def edge_face_pointers(self):
+        '''
+        (E + 1) CSR pointers into edge_faces.
+        '''
+        return self.__edge_table__()[2]
+
+    @property
+    def edge_faces(self):
+        '''
+        Indices of the faces of each edge, in face order.
+        '''
+        return self.__edge_table__()[3]
+
+    @property
+    def is_pole(self):
+        '''
+        True for every vertex whose adjacent vertices are all above it. Detected the first time it is asked for.
+        '''
+        if self._is_pole is None:
+            self.detect_poles()
+        return self._is_pole
+
+    def triangles(self, face_indices=None):
+        '''
+        Returns the corner coordinates of the faces as an (F x 3 x 3) array.
+        '''
+        if face_indices is None:
+            return self.vertices[self.faces]
+        return self.vertices[self.faces[face_indices]]
+
+    def top_z(self, face_indices=None):
+        '''
+        Returns the highest z-coordinate of each face.
+        '''
+        return self.triangles(face_indices)[:, :, 2].max(axis=1)
+
+    def bottom_z(self, face_indices=None):
+        '''
+        Returns the lowest z-coordinate of each face.
+        '''
+        return self.triangles(face_indices)[:, :, 2].min(axis=1)
+
+    def cross_products(self, face_indices=None):
+        '''
+        Returns the (unnormalized) normal vectors (v1 - v0) x (v2 - v0) of the faces.
+        '''
+        tri = self.triangles(face_indices)
+        return np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+
+    def refresh_normals(self, face_indices=None):
+        '''
+        Recalculate the normalized normal vectors of the faces from their current vertex coordinates.
+        '''
+        n = self.cross_products(face_indices)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            n_hat = n / np.linalg.norm(n, axis=1)[:, None]
+
+        if face_indices is None:
+            self.normals[:] = n_hat
+        else:
+            self.normals[face_indices] = n_hat
+        return n_hat
+
+    def move_vertex(self, index, coordinates):
+        '''
+        Set the coordinates of a vertex, and remember that it has moved if they changed.
+        '''
+        coordinates = np.asarray(coordinates, dtype=np.float64)
+        if np.array_equal(self.vertices[index], coordinates) is False:
+            self.vertices[index] = coordinates
+            self.moved_vertices.add(int(index))
+
+    def move_vertices(self, indices, coordinates):
+        '''
+        Set the coordinates of several (distinct) vertices at once, and remember the ones that changed as moved.
+        '''
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 3)
+        changed = np.any(self.vertices[indices] != coordinates, axis=1)
+        self.vertices[indices[changed]] = coordinates[changed]
+        self.moved_vertices.update(indices[changed].tolist())
+
+    def stage_displacements(self, indices, vectors):
+        '''
+        Propose displacements of vertices. The displacements are summed in the given order, and applied by apply_displacements().
+        '''
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        np.add.at(self.displacement_sum, indices, np.asarray(vectors, dtype=np.float64).reshape(-1, 3))
+        np.add.at(self.displacement_count, indices, 1)
+
+    def apply_displacements(self, indices=None):
+        '''
+        Move every vertex with proposed displacements by their mean, and forget the proposals.
+        If indices is given, only those vertices are moved.\n
+        Returns the indices of the vertices with proposed displacements, and the mean displacement of each of them.
+        '''
+        if indices is None:
+            indices = np.flatnonzero(self.displacement_count)
+        else:
+            indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+            indices = indices[self.displacement_count[indices] > 0]
+
+        mean = self.displacement_sum[indices] / self.displacement_count[indices, None]
+        self.move_vertices(indices, self.vertices[indices] + mean)
+        self.displacement_sum[indices] = 0
+        self.displacement_count[indices] = 0
+        return indices, mean
+
+    def add_faces(self, corners, normals=None):
+        '''
+        Append faces given as an (F x 3 x 3) corner array. Corners are welded to the existing vertices and to each other,
+        and new vertices are appended after the existing ones, so the indices of existing faces and vertices do not change.
+        The new faces are not classified. All topology is dropped, and built again the next time it is needed.\n
+        Returns the indices of the new faces.
+        '''
+        corners = np.asarray(corners, dtype=np.float64).reshape(-1, 3)
+        vertex_count, face_count = len(self.vertices), len(self.faces)
+        if normals is None:
+            normals = np.zeros([len(corners)//3, 3])
+
+        # Weld the corners together with the existing vertices. A corner joins the first point of its group,
+        # which is an existing vertex whenever the group holds one.
+        points = np.concatenate([self.vertices, corners])
+        group, _ = weld_vertices(points)
+        group_first = np.full(group.max() + 1, len(points))
+        np.minimum.at(group_first, group, np.arange(len(points)))
+        corner_first = group_first[group[vertex_count:]]
+
+        new_points, corner_new = np.unique(corner_first[corner_first >= vertex_count], return_inverse=True)
+        corner_index = corner_first.copy()
+        corner_index[corner_first >= vertex_count] = vertex_count + corner_new.reshape(-1)
+
+        self.vertices = np.concatenate([self.vertices, points[new_points]])
+        self.faces = np.concatenate([self.faces, corner_index.reshape(-1, 3).astype(np.int32)])
+        self.displacement_sum = np.concatenate([self.displacement_sum, np.zeros([len(new_points), 3])])
+        self.displacement_count = np.concatenate([self.displacement_count, np.zeros(len(new_points), dtype=np.int64)])
+
+        added = len(self.faces) - face_count
+        self.file_normals = np.concatenate([self.file_normals, np.asarray(normals, dtype=np.float64).reshape(-1, 3)])
+        self.normals = np.concatenate([self.normals, np.zeros([added, 3])])
+        self.normals_original = np.concatenate([self.normals_original, np.zeros([added, 3])])
+        self.angles = np.concatenate([self.angles, np.zeros(added)])
+        self.weights = np.concatenate([self.weights, np.zeros(added)])
+        self.grounded = np.concatenate([self.grounded, np.zeros(added, dtype=bool)])
+        self.bad = np.concatenate([self.bad, np.zeros(added, dtype=bool)])
+
+        face_indices = np.arange(face_count, len(self.faces))
+        self.normals_original[face_indices] = self.refresh_normals(face_indices)
+
+        self.vertex_face_pointers, self.vertex_faces = None, None
+        self.vertex_neighbour_pointers, self.vertex_neighbours = None, None
+        self.face_neighbour_pointers, self.face_neighbours, self.face_neighbour_edges = None, None, None
+        self._edge_table = None
+        self._is_pole = None
+        return face_indices
+
+    def take_moved_vertices(self):
+        '''
+        Returns the indices of the vertices that have moved since the last call, in increasing order, and forgets them.
+        '''
+        moved = np.array(sorted(self.moved_vertices), dtype=np.int64)
+        self.moved_vertices = set()
+        return moved
+
+    def build_vertex_faces(self):
+        '''
+        Build the CSR table of the faces of every vertex.
+        '''
+        corner_vertex = self.faces.reshape(-1)
+        order = np.argsort(corner_vertex, kind='stable')
+        self.vertex_faces = (order // 3).astype(np.int32)
+        self.vertex_face_pointers = np.zeros(len(self.vertices) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(corner_vertex, minlength=len(self.vertices)), out=self.vertex_face_pointers[1:])
+
+    def build_vertex_adjacency(self):
+        '''
+        Build the CSR table of the adjacent vertices of every vertex, in one pass over the face array.
+        '''
+        a = self.faces[:, [0, 0, 1, 1, 2, 2]].reshape(-1).astype(np.int64)
+        b = self.faces[:, [1, 2, 0, 2, 0, 1]].reshape(-1).astype(np.int64)
+        distinct = a != b
+        keys = np.unique(a[distinct]*len(self.vertices) + b[distinct])
+        self.vertex_neighbours = (keys % len(self.vertices)).astype(np.int32)
+        self.vertex_neighbour_pointers = np.zeros(len(self.vertices) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // len(self.vertices), minlength=len(self.vertices)), out=self.vertex_neighbour_pointers[1:])
+
+    def neighbours(self, vertex_index):
+        '''
+        Returns the indices of the vertices adjacent to the given vertex, in increasing order.
+        '''
+        if self.vertex_neighbours is None:
+            self.build_vertex_adjacency()
+        return self.vertex_neighbours[self.vertex_neighbour_pointers[vertex_index]:self.vertex_neighbour_pointers[vertex_index + 1]]
+
+    def build_face_adjacency(self):
+        '''
+        Build the CSR table of the faces that share an edge with every face. The neighbours of a face are listed
+        edge by edge, in the order of face_edges, and in face order for each edge. A face is not its own neighbour.
+        '''
+        face_count = len(self.faces)
+        sides = self.face_edges.reshape(-1)
+        starts = self.edge_face_pointers[sides]
+        counts = self.edge_face_pointers[sides + 1] - starts
+        offsets = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        owner = np.repeat(np.arange(len(sides)) // 3, counts)
+        side_edge = np.repeat(sides, counts)
+        other = self.edge_faces[np.repeat(starts, counts) + offsets]
+        distinct = other != owner
+
+        self.face_neighbours = other[distinct].astype(np.int32)
+        self.face_neighbour_edges = side_edge[distinct]
+        self.face_neighbour_pointers = np.zeros(face_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(owner[distinct], minlength=face_count), out=self.face_neighbour_pointers[1:])
+
+    def adjacent_faces(self, face_index):
+        '''
+        Returns the faces that share an edge with the given face, and the shared edge of each of them.
+        '''
+        if self.face_neighbours is None:
+            self.build_face_adjacency()
+        start, end = self.face_neighbour_pointers[face_index], self.face_neighbour_pointers[face_index + 1]
+        return self.face_neighbours[start:end], self.face_neighbour_edges[start:end]
+
+    def incident_faces(self, vertex_indices):
+        '''
+        Returns the indices of all faces that contain at least one of the given vertices, in increasing order.
+        '''
+        if self.vertex_faces is None:
+            self.build_vertex_faces()
+        vertex_indices = np.asarray(vertex_indices, dtype=np.int64).reshape(-1)
+        starts = self.vertex_face_pointers[vertex_indices]
+        counts = self.vertex_face_pointers[vertex_indices + 1] - starts
+        offsets = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.unique(self.vertex_faces[np.repeat(starts, counts) + offsets])
+
+    def build_edges(self):
+        '''
+        Build the edge table of the mesh.
+        '''
+        self._edge_table = build_edge_table(self.faces)
+
+    def __edge_table__(self):
+        if self._edge_table is None:
+            self.build_edges()
+        return self._edge_table
+
+    def detect_poles(self, threshold=0.01):
+        '''
+        Mark all vertices whose adjacent vertices are all located at least threshold above them as poles.
+        The flags follow the current z-coordinates, so this is called again whenever vertices have moved.
+        '''
+        rise = self.__neighbour_rise__()
+        self._is_pole = rise >= threshold
+        return self._is_pole
+
+    def __neighbour_rise__(self):
+        '''
+        Returns the smallest z-difference between each vertex and its adjacent vertices. Vertices without neighbours get inf.
+        '''
+        if self.vertex_neighbours is None:
+            self.build_vertex_adjacency()
+        z = self.vertices[:, 2]
+        rise = np.full(len(self.vertices), np.inf)
+        counts = np.diff(self.vertex_neighbour_pointers)
+        connected = np.flatnonzero(counts > 0)
+        if len(connected) > 0:
+            lowest = np.minimum.reduceat(z[self.vertex_neighbours], self.vertex_neighbour_pointers[connected])
+            rise[connected] = lowest - z[connected]
+        return rise
+
+
+def mesh_from_triangles(corners, normals=None):
+    '''
+    Create an IndexedMesh from an (F x 3 x 3) array of triangle corners by welding equal corners into shared vertices.
+    Edges and poles are not built until they are needed.
+    '''
+    corners = np.asarray(corners, dtype=np.float64).reshape(-1, 3, 3)
+    corner_index, vertices = weld_vertices(corners.reshape(-1, 3))
+    return IndexedMesh(vertices, corner_index.reshape(-1, 3), file_normals=normals)
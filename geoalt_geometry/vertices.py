@@ -1,58 +1,149 @@
+import math
 import numpy as np
 
-class VertexCollection(set):
-
-    def add(self, vertex):
-        '''
-        Add vertex to collection. 
-        O(1), constant time
-        '''
-        contains_res = self.contains(vertex)
-        if contains_res is not None:
-            return contains_res
-        
-        super().add(vertex)
-
-        return vertex
-    
-    def contains(self, vertex):
-        '''
-        Check if vertex exists in set
-        O(n), linear time
-        '''
-        if vertex in self:
-            for v in self:
-                if v.__eq__(vertex):
-                    return v
-        else:
-            return None
-        raise IndexError("Something went terribly wrong when using contains method in VertexCollection.")
+def weld_vertices(points, tolerance=None):
+    '''
+    Weld all points of an (M x 3) array at once.\n
+    Returns an (M,) array holding the index of the unique vertex of every point, and an (N x 3) array of the unique vertices.
+    Unique vertices are ordered by first occurrence, and use the coordinates of that occurrence.\n
+    Two points are considered equal in the same way as Vertex.__eq__, by comparing them to the first point of each group.
+    Groups with equal representatives are merged.
+    '''
+    if tolerance is None:
+        tolerance = Vertex.tolerance
+
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if len(points) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros([0, 3])
+
+    # Quantize all points into grid cells, and encode each cell as a single integer.
+    # Cell coordinates start at 1 so that the neighbours of every cell can be encoded as well.
+    cells = np.floor(points / tolerance).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    dims = cells.max(axis=0) + 2
+    if np.prod(dims.astype(np.float64)) > 2**62:
+        # The model is too large to be encoded at this tolerance. Fall back on the incremental index.
+        return weld_vertices_incrementally(points, tolerance)
+
+    keys = (cells[:, 0]*dims[1] + cells[:, 1])*dims[2] + cells[:, 2]
+
+    # Points in the same cell are always within the tolerance of each other.
+    cell_keys, cell_first, cell_of_point = np.unique(keys, return_index=True, return_inverse=True)
+    cell_of_point = cell_of_point.reshape(-1)
+    cell_count = len(cell_keys)
+    representatives = points[cell_first]
+
+    # Find equal representatives in neighbouring cells. Checking half of the neighbours is enough, since pairs are symmetric.
+    pairs_a = []
+    pairs_b = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                if (dx, dy, dz) <= (0, 0, 0):
+                    continue
+                neighbour_keys = cell_keys + (dx*dims[1] + dy)*dims[2] + dz
+                pos = np.minimum(np.searchsorted(cell_keys, neighbour_keys), cell_count - 1)
+                found = np.flatnonzero(cell_keys[pos] == neighbour_keys)
+                close = np.all(np.abs(representatives[found] - representatives[pos[found]]) <= tolerance, axis=1)
+                pairs_a.append(found[close])
+                pairs_b.append(pos[found[close]])
+    pairs_a = np.concatenate(pairs_a)
+    pairs_b = np.concatenate(pairs_b)
+
+    # Merge connected cells by propagating the smallest label until nothing changes.
+    labels = np.arange(cell_count)
+    while len(pairs_a) > 0:
+        lowest = np.minimum(labels[pairs_a], labels[pairs_b])
+        previous = labels.copy()
+        np.minimum.at(labels, pairs_a, lowest)
+        np.minimum.at(labels, pairs_b, lowest)
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            break
+
+    # Order the unique vertices by the first point that belongs to them.
+    group_first = np.full(cell_count, len(points))
+    np.minimum.at(group_first, labels, cell_first)
+    groups = np.unique(labels)
+    order = np.argsort(group_first[groups])
+    group_index = np.zeros(cell_count, dtype=np.int64)
+    group_index[groups[order]] = np.arange(len(groups))
+
+    index = group_index[labels][cell_of_point]
+    return index, points[group_first[groups[order]]]
+
+def weld_vertices_incrementally(points, tolerance=None):
+    '''
+    Same as weld_vertices, but adds the points one by one to a grid index. Slower, but without any limit on model size.
+    '''
+    if tolerance is None:
+        tolerance = Vertex.tolerance
+
+    grid = {}
+    unique = []
+    index = np.zeros(len(points), dtype=np.int64)
+    for i, p in enumerate(np.asarray(points, dtype=np.float64).reshape(-1, 3)):
+        cx, cy, cz = (math.floor(c / tolerance) for c in p)
+        match = None
+        for dx in (0, -1, 1):
+            for dy in (0, -1, 1):
+                for dz in (0, -1, 1):
+                    for j in grid.get((cx + dx, cy + dy, cz + dz), ()):
+                        if np.all(np.abs(unique[j] - p) <= tolerance):
+                            match = j
+                            break
+                    if match is not None:
+                        break
+                if match is not None:
+                    break
+            if match is not None:
+                break
+
+        if match is None:
+            match = len(unique)
+            unique.append(p)
+            grid.setdefault((cx, cy, cz), []).append(match)
+        index[i] = match
+
+    return index, np.array(unique).reshape(-1, 3)
 
 
 class Vertex:
     '''
+    View of a single vertex of the IndexedMesh behind a FaceCollection.\n
     Class variables:\n
         eq_method: "exact" or "proximity". Exact is quick, but imprecise. Proximity is slow, but better.\n
+        tolerance: How close two vertices need to be in each axis in order to be considered equal when using proximity.\n
     '''
     eq_method = "proximity"
+    tolerance = 0.001
 
     def __init__(self, facecol, index):
         self.facecol = facecol
         self.index = index
-        self.change_set = []        # An array of changes proposed by the problem solver
-        
-        # These variables are responsible for a vertex "knowledge" of its surrounding vertices
-        self.adjacencies = set()    # A set of all adjacent vertices
-        self.is_pole = True         # True if all adjacent vertices are above this vertex.
+
+    @property
+    def is_pole(self):
+        '''
+        True if all adjacent vertices are above this vertex.
+        '''
+        return bool(self.facecol.mesh.is_pole[self.index])
+
+    @property
+    def adjacencies(self):
+        '''
+        A set of all adjacent vertices
+        '''
+        return set(self.facecol.get_vertex(int(i)) for i in self.facecol.mesh.neighbours(self.index))
 
     def x(self):
-        return self.facecol.stlfile.vertices[self.index][0]
+        return self.facecol.mesh.vertices[self.index, 0]
 
     def y(self):
-        return self.facecol.stlfile.vertices[self.index][1]
+        return self.facecol.mesh.vertices[self.index, 1]
 
     def z(self):
-        return self.facecol.stlfile.vertices[self.index][2]
+        return self.facecol.mesh.vertices[self.index, 2]
 
     def __str__(self):
         return "VX({}, {}, {})".format(self.x(), self.y(), self.z())
@@ -60,11 +151,11 @@ class Vertex:
     def __eq__(self, other):
         if Vertex.eq_method == "proximity":
             # Slow, but more certain
-            if abs(self.x() - other.x()) > 0.001:
+            if abs(self.x() - other.x()) > Vertex.tolerance:
                 return False
-            if abs(self.y() - other.y()) > 0.001:
+            if abs(self.y() - other.y()) > Vertex.tolerance:
                 return False
-            if abs(self.z() - other.z()) > 0.001:
+            if abs(self.z() - other.z()) > Vertex.tolerance:
                 return False
             return True
         elif Vertex.eq_method == "exact":
@@ -76,48 +167,38 @@ class Vertex:
             raise TypeError("Unknown eq method for Vertex class")
 
     def __hash__(self):
-        h = hash(self.x()+self.y()+self.z())
-        return h
+        # The index never changes, unlike the coordinates, so views can be kept in sets and dicts while the vertex moves.
+        return hash(self.index)
 
     def get_array(self):
         '''
         Returns the vertex as a coordinate vector in the form of a numpy array
         '''
-        return np.array(self.facecol.stlfile.vertices[self.index])
+        return self.facecol.mesh.vertices[self.index].copy()
 
     def set_array(self, array):
         '''
-        Set the coordinate value of the vertex using a R^3 array
+        Set the coordinate value of the vertex using a R^3 array. The vertex is marked as moved if its coordinates change.
         '''
-        self.facecol.stlfile.vertices[self.index] = array
+        self.facecol.mesh.move_vertex(self.index, array)
 
-    def set_adjacency(self, vertex):
-        self.adjacencies.add(vertex)
-        vertex.adjacencies.add(self)
-        if vertex.z() < self.z():
-            self.is_pole = False
-        else:
-            vertex.is_pole = False
-        
-        if np.abs(vertex.z() - self.z()) < 0.01:
-            self.is_pole = False
-            vertex.is_pole = False
+    @property
+    def has_staged_changes(self):
+        '''
+        True if the problem solver has proposed changes to this vertex that have not been performed yet.
+        '''
+        return bool(self.facecol.mesh.displacement_count[self.index] > 0)
 
     def add_change_partial(self, vector):
-        self.change_set.append(vector)
+        self.facecol.mesh.stage_displacements(self.index, vector)
     
     def reset_change_set(self):
-        self.change_set = []
+        mesh = self.facecol.mesh
+        mesh.displacement_sum[self.index] = 0
+        mesh.displacement_count[self.index] = 0
 
     def perform_change(self):
-        if len(self.change_set) == 0:
+        indices, mean = self.facecol.mesh.apply_displacements(self.index)
+        if len(indices) == 0:
             return
-        net_vector = np.array([0,0,0])
-        for v in self.change_set:
-            net_vector = net_vector + v
-
-        net_vector_mean = net_vector/len(self.change_set)
-        
-        self.set_array(self.get_array() + net_vector_mean)
-        self.reset_change_set()
-        return net_vector_mean
\ No newline at end of file
+        return mean[0]
\ No newline at end of file
@@ -1,19 +1,69 @@
+import os
+import numpy as np
+
 from geoalt_geometry.faces import FaceCollection, Face
+import geoalt_exceptions.exceptions as geoexc
+
+# Packed layout of a single binary STL facet record (50 bytes): normal, three vertices and the attribute byte count.
+BINARY_FACET_DTYPE = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attribute', '<u2')
+])
+
+# The 80 byte header of binary files. It must not start with "solid", or readers may take the file for an ASCII STL.
+BINARY_HEADER = b"GeoAlt binary STL".ljust(80, b" ")
+
+# Supported output formats, and the formats implied by file extensions. Any other extension is written as ASCII.
+STL_FORMATS = ["ascii", "binary"]
+STL_FORMAT_EXTENSIONS = {".stla": "ascii", ".stlb": "binary"}
+
+# Amount of facets formatted at a time when writing ASCII files.
+ASCII_WRITE_CHUNK_SIZE = 2**16
+
+# Template of a single ASCII facet. The placeholder is replaced by the float format of the requested precision.
+ASCII_FACET_TEMPLATE = (
+    "\tfacet normal {0} {0} {0}\n"
+    "\t\touter loop\n"
+    "\t\t\tvertex {0} {0} {0}\n"
+    "\t\t\tvertex {0} {0} {0}\n"
+    "\t\t\tvertex {0} {0} {0}\n"
+    "\t\tendloop\n"
+    "\tendfacet\n"
+)
+
+def format_from_extension(file_destination):
+    '''
+    Returns the output format implied by the extension of file_destination: binary for .stlb, ascii otherwise.
+    '''
+    extension = os.path.splitext(file_destination)[1].lower()
+    return STL_FORMAT_EXTENSIONS.get(extension, "ascii")
 
 class STLCreator:
     '''
-    Class for creating STL files out of a FaceCollection
+    Class for creating STL files out of a FaceCollection.\n
+    file_format is either "ascii" or "binary". If it is None, the format follows the extension of file_destination.\n
+    precision is the amount of decimals written in ASCII files.
     '''
-    def __init__(self, file_destination, face_collection):
+    def __init__(self, file_destination, face_collection, file_format=None, precision=6):
         # Ensure that all arguments are of the correct type
         if isinstance(file_destination, str) is False:
             raise TypeError("Filename needs to be a String.")
         
         if isinstance(face_collection, FaceCollection) is False:
             raise TypeError("Face collection needs to be a FaceCollection.")
-        
+
+        if file_format is None:
+            file_format = format_from_extension(file_destination)
+        if file_format not in STL_FORMATS:
+            raise ValueError("File format needs to be either ascii or binary.")
+        if isinstance(precision, int) is False or precision < 0:
+            raise ValueError("Precision needs to be a non-negative integer.")
+
         self.file_destination = file_destination
         self.face_collection = face_collection
+        self.file_format = file_format
+        self.precision = precision
         self.stream = None
     
     def build_file(self):
@@ -23,16 +73,46 @@ class STLCreator:
         if self.stream is not None:
             raise IOError("File stream was already opened")
 
+        if self.file_format == "binary":
+            self.__build_binary_file__()
+            return
+
         self.__create_file__()
         self.__parse_face_collection__()
         self.__close_file__()
     
+    def __build_binary_file__(self):
+        '''
+        Write the whole mesh as a binary STL. All facet records are built as one array, and written in a single call.
+        '''
+        mesh = self.face_collection.mesh
+        triangles = mesh.triangles()
+
+        # Binary readers expect unit normals. Degenerate faces get a zero normal.
+        n = mesh.cross_products()
+        lengths = np.linalg.norm(n, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            n_hat = np.where(lengths[:, None] > 0, n / lengths[:, None], 0)
+
+        records = np.zeros(len(triangles), dtype=BINARY_FACET_DTYPE)
+        records['normal'] = n_hat
+        records['vertices'] = triangles
+
+        try:
+            self.stream = open(file=self.file_destination, mode="xb")
+        except FileExistsError:
+            raise geoexc.OutputFileExists("File already exists: %s" % self.file_destination)
+
+        self.stream.write(BINARY_HEADER + np.uint32(len(records)).tobytes() + records.tobytes())
+        self.stream.close()
+        self.stream = None
+    
     def __create_file__(self):
         try:
             self.stream = open(file=self.file_destination, mode="x", encoding="utf-8", newline=None)
-            self.stream.write("solid GeoAlt\n")
         except FileExistsError:
-            print("File aready exists.")
+            raise geoexc.OutputFileExists("File already exists: %s" % self.file_destination)
+        self.stream.write("solid GeoAlt\n")
 
     def __close_file__(self):
         if self.stream is None:
@@ -42,18 +122,26 @@ class STLCreator:
         self.stream.close()
         self.stream = None
     
-    def __parse_face_collection__(self):
+    def __parse_face_collection__(self, chunk_size=ASCII_WRITE_CHUNK_SIZE):
+        '''
+        Write the facets of the face collection. The facets are formatted in chunks of chunk_size facets at a time,
+        so that memory use does not grow with the size of the mesh.
+        '''
         if self.stream is None:
             print("No file is opened. Terminating parsing process.")
             return
 
-        for face in self.face_collection:
-            face.refresh_normal_vector()
-            self.stream.write("\tfacet normal %f %f %f\n" % (face.n[0], face.n[1], face.n[2]))            
-            self.stream.write("\t\touter loop\n")
-            self.stream.write("\t\t\tvertex %f %f %f\n" % (face.vertices[0].x(), face.vertices[0].y(), face.vertices[0].z()))
-            self.stream.write("\t\t\tvertex %f %f %f\n" % (face.vertices[1].x(), face.vertices[1].y(), face.vertices[1].z()))
-            self.stream.write("\t\t\tvertex %f %f %f\n" % (face.vertices[2].x(), face.vertices[2].y(), face.vertices[2].z()))
-            self.stream.write("\t\tendloop\n")
-            self.stream.write("\tendfacet\n")
-    
\ No newline at end of file
+        mesh = self.face_collection.mesh
+        template = ASCII_FACET_TEMPLATE.format("%%.%df" % self.precision)
+
+        for start in range(0, len(mesh.faces), chunk_size):
+            face_indices = np.arange(start, min(start + chunk_size, len(mesh.faces)))
+            triangles = mesh.triangles(face_indices)
+
+            # The unnormalized normal vectors are written, followed by the three corners of each face.
+            n = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+            values = np.concatenate([n, triangles.reshape(-1, 9)], axis=1)
+            self.stream.write((template*len(values)) % tuple(values.ravel().tolist()))
+
+        # The normal vectors of the mesh are refreshed, like they were when the facets were written one by one.
+        mesh.refresh_normals()
@@ -1,18 +1,75 @@
-import re
+import os
 from timeit import default_timer as timer
 import numpy as np
-from struct import unpack
 
-from geoalt_geometry.faces import Face, FaceCollection
-from geoalt_geometry.vertices import Vertex
-from geoalt_stl.stl_creator import STLCreator
+from geoalt_geometry.faces import FaceCollection
+from geoalt_geometry.mesh import mesh_from_triangles
+from geoalt_stl.stl_creator import STLCreator, BINARY_FACET_DTYPE
+import geoalt_exceptions.exceptions as geoexc
+
+# Amount of bytes read at a time when parsing ASCII files.
+ASCII_CHUNK_SIZE = 2**24
+
+# Amount of facets read at a time when streaming binary files.
+BINARY_CHUNK_SIZE = 2**18
+
+
+def rotation_matrix(theta, axis):
+    '''
+    Create the matrix of a rotation by theta around the X or Y axis.
+    '''
+    if axis.lower() == "x":
+        return np.array([
+            [1,0,0],
+            [0,np.cos(theta),-np.sin(theta)],
+            [0,np.sin(theta),np.cos(theta)]
+        ])
+    elif axis.lower() == "y":
+        return np.array([
+            [np.cos(theta),0,np.sin(theta)],
+            [0,1,0],
+            [-np.sin(theta),0,np.cos(theta)]
+        ])
+    elif axis.lower() == "z":
+        raise NotImplementedError("Rotation around the Z-axis is not yet implemented.")
+    else:
+        raise TypeError('Value of axis needs to be the string value of x, y, or z.')
+
+def strip_solid_lines(block):
+    '''
+    Remove the "solid <name>" and "endsolid <name>" keywords, up to the end of their lines, from a block of a lowercased ASCII file.
+    Solid names can hold keywords like "vertex" or "normal", which would otherwise be taken for facet data.
+    '''
+    pieces = []
+    start = 0
+    position = block.find(b"solid")
+    while position != -1:
+        keyword_start = position - 3 if block[max(0, position - 3):position] == b"end" else position
+        keyword_end = position + len(b"solid")
+        line_end = block.find(b"\n", keyword_end)
+        if line_end == -1:
+            line_end = len(block)
+
+        # Only whole tokens count. Anything else is part of a name.
+        if (keyword_start == 0 or block[keyword_start - 1:keyword_start].isspace()) and (keyword_end == len(block) or block[keyword_end:keyword_end + 1].isspace()):
+            pieces.append(block[start:keyword_start])
+            start = line_end
+            position = block.find(b"solid", line_end)
+        else:
+            position = block.find(b"solid", keyword_end)
+
+    if start == 0:
+        return block
+    pieces.append(block[start:])
+    return b"".join(pieces)
 
 class STLfile:
     def __init__(self, filename):
         self.filename = filename
         self.header = ""
-        self.vertices = []
-        self.normals = []
+        self.mesh = None            # The IndexedMesh holding the geometry of the model.
+        self.vertices = []          # (N x 3) vertex array of the mesh.
+        self.normals = []           # (F x 3) normals of the mesh, as stored in the file.
         self.ground_level = 0
         self.grounded = False       # This variable is set by the external "Face" class.
 
@@ -22,27 +79,11 @@ class STLfile:
         '''
         self.grounded = False # Rotating the model could cause the model to no longer be grounded.
 
-        b = np.array(self.vertices).T
-
-        if axis.lower() == "x":
-            T = np.array([
-                [1,0,0],
-                [0,np.cos(theta),-np.sin(theta)],
-                [0,np.sin(theta),np.cos(theta)]
-            ])
-        elif axis.lower() == "y":
-            T = np.array([
-                [np.cos(theta),0,np.sin(theta)],
-                [0,1,0],
-                [-np.sin(theta),0,np.cos(theta)]
-            ])
-        elif axis.lower() == "z":
-            raise NotImplementedError("Rotation around the Z-axis is not yet implemented.")
-        else:
-            raise TypeError('Value of axis needs to be the string value of x, y, or z.')
+        b = self.vertices.T
+        T = rotation_matrix(theta, axis)
 
         res = np.dot(T, b)
-        self.vertices = res.T.tolist()
+        self.vertices[:] = res.T    # In place, since the mesh shares this array.
         self.calculate_ground_level()
 
     def calculate_ground_level(self):
@@ -50,53 +91,77 @@ class STLfile:
         Fetches the lowest Z-element that can be found in the current orientation of the model.
         Notice that the ground level changes if the model is rotated, but is automatically recalculated and can be fetched through the stl.ground_level variable.
         '''
-        verts = np.array(self.vertices)
-        self.ground_level = verts.min(axis=0)[2]
+        self.ground_level = self.vertices[:, 2].min()
 
-    def __new_face__(self, facecol, n):
+    def build_face_collection(self, normals, corners):
         '''
-        Create and store a new face.
+        Create the mesh of the model from a (F x 3) normal array and a (F x 3 x 3) corner array, as returned by read_facets,
+        and return a FaceCollection for it. Equal corners are welded into shared vertices.
         '''
-        normal_index = len(self.normals)
-        vertex_index = len(self.vertices)
-        self.normals.append(n)
-
-        face = Face(facecol, normal_index, vertex_index)
-        return face
+        self.mesh = mesh_from_triangles(corners, normals)
+        self.vertices = self.mesh.vertices
+        self.normals = self.mesh.file_normals
+        self.calculate_ground_level()
+        return FaceCollection(self)
 
-    def __new_vertex__(self, face, array):
+    def detect_format(self):
         '''
-        Create and store a new vertex
+        Guess the format of the file from its first bytes: "ascii", "binary" or "color" (colored binary).
         '''
-        vertex_index = len(self.vertices)
-        self.vertices.append(array)
-        face.vertices.append(Vertex(face.face_collection, vertex_index))
+        f = open(self.filename, 'rb')
+        type_str = f.read(5).decode('utf-8', errors='replace')
+        f.seek(80)
+        face_count = int.from_bytes(f.read(4), byteorder='little', signed=False)
+        f.close()
+
+        if "SOLID" in type_str.upper():
+            # Some binary files also start with "solid". Their size gives them away.
+            if os.path.getsize(self.filename) == 84 + face_count*BINARY_FACET_DTYPE.itemsize:
+                return "binary"
+            return "ascii"
+        elif "COLOR" in type_str.upper():
+            return "color"
+
+        return "binary"
 
     def load(self):
         '''
         This generic load method is used to load any type of .stl-file. It will compensate automatically for ASCII, binary or colored binary STLs.
         '''
-        f = open(self.filename, 'rb')
-        type_str = f.read(5).decode('utf-8')
-        f.close()
+        return self.build_face_collection(*self.read_facets())
 
-        if "SOLID" in type_str.upper():
+    def read_facets(self):
+        '''
+        Read all facets of the file, whatever its format, without building a mesh.
+        Returns an (F x 3) normal array and an (F x 3 x 3) corner array.
+        '''
+        file_format = self.detect_format()
+
+        if file_format == "ascii":
             try:
-                return self.load_ascii()
-            except UnicodeDecodeError:
-                # If it fails to load as ascii, then it is probaby a binary file.
-                return self.load_binary()
-        elif "COLOR" in type_str.upper():
+                return self.__read_ascii__()
+            except geoexc.InvalidSTLFile:
+                # Binary files that start with "solid" and carry trailing bytes slip past the size check of detect_format.
+                # Only retry as binary if the header count fits in the file, so that a broken ASCII file reports its own error.
+                if self.__fits_binary__() is False:
+                    raise
+                return self.__read_binary__()
+        elif file_format == "color":
             print("COLOR LOAD")
-            return self.load_binary(color=True)
+            return self.__read_binary__(color=True)
 
-        return self.load_binary()
+        return self.__read_binary__()
 
     def load_binary(self, color=False):
         '''
         Load function specifically made for binary files. 
         '''
-        facecol = FaceCollection(self)
+        return self.build_face_collection(*self.__read_binary__(color))
+
+    def __read_binary__(self, color=False):
+        '''
+        Read the normals and corners of a binary file. A header that is not valid UTF-8 marks a colored binary file.
+        '''
         f = open(self.filename, 'rb')
 
         if color is True:
@@ -107,75 +172,148 @@ class STLfile:
                 self.header = f.read(80).decode('utf-8')
             except UnicodeDecodeError:
                 f.close()
-                return self.load_binary(color=True)
+                return self.__read_binary__(color=True)
         
-        face_count = int.from_bytes(f.read(4), byteorder='little', signed=False)
-
-        for i in range(0,face_count):
-            n = unpack('<fff', f.read(12))
-            face = self.__new_face__(facecol, [n[0], n[1], n[2]])
+        try:
+            face_count = self.__binary_face_count__(f)
 
-            v1 = unpack('<fff', f.read(12))
-            self.__new_vertex__(face, [v1[0], v1[1], v1[2]])
-            v2 = unpack('<fff', f.read(12))
-            self.__new_vertex__(face, [v2[0], v2[1], v2[2]])
-            v3 = unpack('<fff', f.read(12))
-            self.__new_vertex__(face, [v3[0], v3[1], v3[2]])
+            # Read the entire facet block in one go instead of unpacking it facet by facet.
+            records = np.fromfile(f, dtype=BINARY_FACET_DTYPE, count=face_count)
+        finally:
+            f.close()
 
-            face.n_hat_original = face.refresh_normal_vector()
-            facecol.append(face)
+        return records['normal'], records['vertices']
 
-            spacer = int.from_bytes(f.read(2), byteorder='little', signed=False)
+    def __binary_face_count__(self, f):
+        '''
+        Read the facet count from the header of a binary file, with f positioned right after the 80 byte header.
+        The count is checked against the size of the file before anything is allocated for it, since a corrupt or
+        non-binary file can hold any number there. Raises InvalidSTLFile if the file is too short or holds no facets.
+        '''
+        count_bytes = f.read(4)
+        if len(count_bytes) < 4:
+            raise geoexc.InvalidSTLFile("The file is too short to be a binary STL file.")
+        face_count = int.from_bytes(count_bytes, byteorder='little', signed=False)
 
-        f.close()
+        available = (os.path.getsize(self.filename) - 84) // BINARY_FACET_DTYPE.itemsize
+        if face_count > available:
+            raise geoexc.InvalidSTLFile("The header promises %d facets, but the file only holds %d. It is either truncated or not a binary STL file." % (face_count, available))
+        if face_count == 0:
+            raise geoexc.InvalidSTLFile("No facets could be found in the binary STL file.")
+        return face_count
 
-        self.calculate_ground_level()
-        return facecol
+    def __fits_binary__(self):
+        '''
+        Check whether the file could be read as a binary file: the facet count of its header is not zero and fits in the file.
+        '''
+        with open(self.filename, 'rb') as f:
+            f.seek(80)
+            try:
+                self.__binary_face_count__(f)
+            except geoexc.InvalidSTLFile:
+                return False
+        return True
 
-    def load_ascii(self):
+    def load_ascii(self, chunk_size=ASCII_CHUNK_SIZE):
         '''
         Load function specifically made for ASCII files.
         '''
-        facecol = FaceCollection(self)
+        return self.build_face_collection(*self.__read_ascii__(chunk_size))
 
-        f = open(self.filename, 'r')
-        ln = 1 # File line nr
-        fl = 1 # Face line nr
+    def __read_ascii__(self, chunk_size=ASCII_CHUNK_SIZE):
+        '''
+        Read the normals and corners of an ASCII file, chunk_size bytes at a time.
+        '''
+        normals = []
+        corners = []
+        for chunk_normals, chunk_corners in self.__iter_ascii_facets__(chunk_size):
+            normals.append(chunk_normals)
+            corners.append(chunk_corners)
+
+        if len(normals) == 0:
+            raise geoexc.InvalidSTLFile("No facets could be found in the ASCII STL file.")
 
-        current_face = None
+        return np.concatenate(normals), np.concatenate(corners)
 
-        for line in f:
-            if ln == 1:
-                self.header = line
+    def iter_facets(self, chunk_size=BINARY_CHUNK_SIZE):
+        '''
+        Stream the facets of the file without building a mesh. Yields (F x 3) normal arrays and (F x 3 x 3) corner arrays.\n
+        Binary files are read chunk_size facets at a time, and ASCII files ASCII_CHUNK_SIZE bytes at a time,
+        so memory use does not depend on the size of the file.
+        '''
+        if self.detect_format() == "ascii":
+            found = False
+            try:
+                for chunk in self.__iter_ascii_facets__():
+                    found = True
+                    yield chunk
+            except geoexc.InvalidSTLFile:
+                # As in load, a binary file with trailing bytes is retried as binary, but only before anything was yielded.
+                if found is True or self.__fits_binary__() is False:
+                    raise
             else:
-                if fl == 1:
-                    # Face normal
-                    # Create new face
-                    if "endsolid" in line:
-                        # End of the file.
-                        print("Reached end of solid.")
-                        break
-                    else:
-                        search = re.search(r"facet\snormal\s+(\S+)\s+(\S+)\s+(\S+)", line)
-                        current_face = self.__new_face__(facecol, np.array([float(search.group(1)),float(search.group(2)),float(search.group(3))]))
-                elif fl == 2 or fl == 6 :
-                    # Outer loop or End loop
-                    pass
-                elif fl in range(3,6):
-                    # Vertex
-                    vertexStr = line
-                    search = re.search(r"vertex\s+(\S+)\s+(\S+)\s+(\S+)", vertexStr)
-                    self.__new_vertex__(current_face, np.array([float(search.group(1)),float(search.group(2)),float(search.group(3))]))
-                elif fl == 7:
-                    # End facet
-                    current_face.n_hat_original = current_face.refresh_normal_vector() 
-                    facecol.append(current_face)
-                    current_face = None
-                    fl = 0
-                else:
-                    raise TypeError("Error encountered when parsing through face. Unhandled face line number.")
-                fl += 1 # Face line += 1
-            ln += 1 # File line += 1
-        f.close()
-        self.calculate_ground_level()
-        return facecol
+                if found is True or self.__fits_binary__() is False:
+                    return
+
+        f = open(self.filename, 'rb')
+        try:
+            self.header = f.read(80).decode('utf-8', errors='replace')
+            remaining = self.__binary_face_count__(f)
+            while remaining > 0:
+                records = np.fromfile(f, dtype=BINARY_FACET_DTYPE, count=min(chunk_size, remaining))
+                remaining -= len(records)
+                yield records['normal'], records['vertices']
+        finally:
+            f.close()
+
+    def __iter_ascii_facets__(self, chunk_size=ASCII_CHUNK_SIZE):
+        '''
+        Read an ASCII STL file in large chunks and yield (F x 3) normal arrays and (F x 3 x 3) corner arrays.
+        The file is tokenized by whitespace, so indentation and line breaks do not matter. The solid and endsolid lines
+        are skipped whole, so that files with multiple solids, and solid names that hold keywords, are read correctly.
+        '''
+        with open(self.filename, 'rb') as f:
+            self.header = f.readline().decode('utf-8', errors='replace')
+
+            carry = b""
+            while True:
+                data = f.read(chunk_size).lower()
+                at_end = len(data) == 0
+                block = carry + data
+
+                if at_end is False:
+                    # Only parse complete facets. Anything after the last "endfacet" is carried over to the next chunk.
+                    cut = block.rfind(b"endfacet")
+                    if cut == -1:
+                        carry = block
+                        continue
+                    cut += len(b"endfacet")
+                    carry = block[cut:]
+                    block = block[:cut]
+
+                tokens = np.array(strip_solid_lines(block).split())
+                if len(tokens) > 0:
+                    normals = self.__collect_numbers__(tokens, b"normal")
+                    corners = self.__collect_numbers__(tokens, b"vertex")
+
+                    if len(corners) != 3*len(normals):
+                        raise geoexc.InvalidSTLFile("Found %d vertices for %d facets. Every facet needs exactly three vertices." % (len(corners), len(normals)))
+
+                    if len(normals) > 0:
+                        yield normals, corners.reshape(-1, 3, 3)
+
+                if at_end is True:
+                    break
+
+    def __collect_numbers__(self, tokens, keyword):
+        '''
+        Gather the three numbers following every occurrence of keyword as an (n x 3) float array.
+        '''
+        indices = np.flatnonzero(tokens == keyword)
+        if len(indices) > 0 and indices[-1] + 3 >= len(tokens):
+            raise geoexc.InvalidSTLFile("Unexpected end of file after '%s'." % keyword.decode('utf-8'))
+
+        try:
+            return tokens[indices[:, None] + np.arange(1, 4)].astype(np.float64)
+        except ValueError:
+            raise geoexc.InvalidSTLFile("Could not parse the coordinates following '%s'." % keyword.decode('utf-8'))
@@ -3,7 +3,7 @@ import sys
 import threading
 
 from numpy import pi
-from os import getcwd, path
+from os import getcwd, path, cpu_count
 
 from geoalt_algorithms.zero_phi_strategy import ZeroPhiStrategy
 from geoalt_algorithms.initiator import search_and_solve
@@ -21,6 +21,8 @@ class GeoAltThread(threading.Thread):
         self.angle_tolerance = 0.017
         self.ground_tolerance = 0.01
         self.zero_phi_strategy = ZeroPhiStrategy.NONE
+        self.workers = 1
+        self.output_format = None
 
     def set_imax(self, imax):
         self.imax = imax
@@ -43,17 +45,25 @@ class GeoAltThread(threading.Thread):
     def set_zero_phi_strategy(self, zps):
         self.zero_phi_strategy = zps
 
+    def set_workers(self, workers):
+        self.workers = workers
+
+    def set_output_format(self, output_format):
+        self.output_format = output_format
+
     def run(self):
         search_and_solve(self._parent.input_file_f.GetValue(), self._parent.output_file_f.GetValue(), 
         max_iterations=self.imax,
         overwrite_output=True, 
+        output_format=self.output_format,
         phi_min=self.angle, 
         fixed_orientation=self.orientation,
         plot=False,
         grounded_only=self.grounded_only,
         ground_tolerance=self.ground_tolerance,
         angle_tolerance=self.angle_tolerance,
-        zero_phi_strategy=self.zero_phi_strategy)
+        zero_phi_strategy=self.zero_phi_strategy,
+        workers=self.workers)
 
 class StdoutRedirector(object):
     '''
@@ -178,13 +188,28 @@ class GeoAltGUI(wx.Frame):
         self.angle_tol_ctrl.SetValue(0.017)
         self.angle_tol_ctrl.SetIncrement(0.001)
         left_sizer.Add(self.angle_tol_ctrl, pos=(13,1), span = (1,2), border = 5, flag=wx.ALL)
+
+        # Worker processes
+        workers_lbl = wx.StaticText(panel, label='Workers')
+        left_sizer.Add(workers_lbl, pos=(14,0), border=5, flag=wx.ALL)
+        self.workers_ct = wx.SpinCtrl(panel)
+        self.workers_ct.SetRange(1, max(cpu_count() or 1, 1))
+        self.workers_ct.SetValue(1)
+        left_sizer.Add(self.workers_ct, pos=(14,1), span = (1,2), border = 5, flag=wx.ALL)
+
+        # Output format
+        output_format_lbl = wx.StaticText(panel, label='Output format')
+        left_sizer.Add(output_format_lbl, pos=(15,0), border=5, flag=wx.ALL)
+        self.output_format_choice = wx.Choice(panel, choices=['From extension', 'ASCII', 'Binary'])
+        self.output_format_choice.SetSelection(0)
+        left_sizer.Add(self.output_format_choice, pos=(15,1), span = (1,2), border = 5, flag=wx.ALL)
         
 
         # Bot buttons
         exec_btn = wx.Button(panel, label = "Run")
         self.Bind(wx.EVT_BUTTON, self.exec_geoalt, exec_btn) 
 
-        left_sizer.Add(exec_btn, pos = (14, 0),flag = wx.ALL, border = 5) 
+        left_sizer.Add(exec_btn, pos = (16, 0),flag = wx.ALL, border = 5) 
 
         # OUTPUT LAYOUT
         vlayout = wx.BoxSizer(orient=wx.VERTICAL)
@@ -223,6 +248,8 @@ class GeoAltGUI(wx.Frame):
         grounded_only = bool(self.grounded_only.GetValue())
         tol_ground = float(self.ground_ctrl.GetValue())
         tol_angle = float(self.angle_tol_ctrl.GetValue())
+        workers = int(self.workers_ct.GetValue())
+        output_format = [None, "ascii", "binary"][self.output_format_choice.GetSelection()]
         zps = None
 
         if self.zps_choice.GetSelection() == 0:
@@ -252,6 +279,8 @@ class GeoAltGUI(wx.Frame):
         worker.set_ground_tolerance(tol_ground)
         worker.set_angle_tolerance(tol_angle)
         worker.set_zero_phi_strategy(zps)
+        worker.set_workers(workers)
+        worker.set_output_format(output_format)
         worker.start()
 
     def on_open_file(self, event):
@@ -282,7 +311,7 @@ class GeoAltGUI(wx.Frame):
         "Output STL file location",
         ".",
         "",
-        "STL files (*.stl)|*.stl",
+        "STL files (*.stl)|*.stl|Binary STL files (*.stlb)|*.stlb",
         wx.FD_SAVE|wx.FD_OVERWRITE_PROMPT)
 
         if fd.ShowModal() == wx.ID_OK:
@@ -290,6 +319,8 @@ class GeoAltGUI(wx.Frame):
             self.output_file_f.SetValue(fd.GetPath())
         
 
-app = wx.App() 
-GeoAltGUI(None, title = 'GeoAlt') 
-app.MainLoop()
\ No newline at end of file
+if __name__ == "__main__":
+    # Pool workers import this module again when processes are spawned (Windows and macOS). They must not open a window of their own.
+    app = wx.App() 
+    GeoAltGUI(None, title = 'GeoAlt') 
+    app.MainLoop()
\ No newline at end of file
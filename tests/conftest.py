@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The packages live in the root of the repository, which is not installed.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from geoalt_algorithms.analysis import analyze_model
+from geoalt_benchmarks.meshes import generate, write_ascii, write_binary
+from geoalt_geometry.faces import evaluate_faces, FLAT_ANGLE
+from geoalt_stl.stl_parser import STLfile
+
+WRITERS = {"ascii": write_ascii, "binary": write_binary}
+
+@pytest.mark.parametrize("file_format", sorted(WRITERS))
+@pytest.mark.parametrize("shape", ["flat_bottom", "poles"])
+@pytest.mark.parametrize("orientation", [None, [0.3, -0.2]])
+def test_analysis_matches_loaded_model(tmp_path, file_format, shape, orientation):
+    path = str(tmp_path / "model.stl")
+    WRITERS[file_format](path, generate(shape, 2000, seed=4).astype(np.float32))
+
+    # A small chunk size, so that the totals are summed over many chunks.
+    report = analyze_model(path, orientation=orientation, chunk_size=97)
+
+    stl = STLfile(path)
+    faces = stl.load()
+    if orientation is not None:
+        stl.rotate(orientation[0], axis='x')
+        stl.rotate(orientation[1], axis='y')
+    triangles = faces.mesh.triangles()
+    _, angles, grounded, bad, weights = evaluate_faces(triangles, ground_level=stl.ground_level)
+
+    bad_triangles = triangles[bad]
+    overhang_area = np.sum(np.linalg.norm(np.cross(bad_triangles[:, 1] - bad_triangles[:, 0], bad_triangles[:, 2] - bad_triangles[:, 0]), axis=1))/2
+
+    assert report["facets"] == len(triangles)
+    assert report["ground_level"] == stl.ground_level
+    assert report["warnings"] == np.count_nonzero(bad)
+    assert report["warnings"] > 0
+    assert np.isclose(report["overhang_area"], overhang_area, rtol=1e-12)
+    assert np.isclose(report["total_weight"], np.sum(weights), rtol=1e-12)
+    assert report["grounded"] == bool(np.any(grounded & (angles < FLAT_ANGLE)))
@@ -0,0 +1,91 @@
+import json
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import geoalt_algorithms.batch as batch
+from geoalt_benchmarks.meshes import generate, write_binary
+import geoalt_exceptions.exceptions as geoexc
+
+# The workers replace search_and_solve through the forked memory of the test process.
+pytestmark = pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="Needs the fork start method")
+
+def fake_search_and_solve(model_path, altered_model_path, **options):
+    name = os.path.basename(model_path)
+    if name.startswith("crash"):
+        os._exit(3)
+    if name.startswith("slow"):
+        time.sleep(60)
+    if name.startswith("broken"):
+        raise ValueError("Broken model")
+    return {"warnings_before": 1, "warnings_after": 0}
+
+@pytest.fixture
+def fork_context(monkeypatch):
+    context = multiprocessing.get_context("fork")
+    monkeypatch.setattr(batch, "multiprocessing", context)
+    monkeypatch.setattr(batch, "search_and_solve", fake_search_and_solve)
+
+def make_jobs(tmp_path, names):
+    source, output = tmp_path / "source", tmp_path / "output"
+    source.mkdir()
+    output.mkdir()
+    for name in names:
+        (source / name).write_bytes(b"")
+    return batch.plan_jobs(batch.collect_inputs(str(source)), str(output))
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_crashing_worker_fails_only_its_job(tmp_path, fork_context, processes):
+    jobs = make_jobs(tmp_path, ["a.stl", "crash.stl", "b.stl", "broken.stl", "c.stl"])
+    results = batch.run_batch(jobs, {}, processes=processes, timeout=30, verbose=False)
+
+    statuses = {os.path.basename(r["input"]): r["status"] for r in results}
+    assert statuses == {"a.stl": "ok", "b.stl": "ok", "broken.stl": "failed", "c.stl": "ok", "crash.stl": "failed"}
+    assert "exited with code 3" in results[jobs.index(next(j for j in jobs if j["input"].endswith("crash.stl")))]["error"]
+    for job, result in zip(jobs, results):
+        with open(job["summary"], 'r') as f:
+            assert json.load(f)["status"] == result["status"]
+
+def test_every_worker_crashing(tmp_path, fork_context):
+    jobs = make_jobs(tmp_path, ["crash_%d.stl" % i for i in range(0, 4)])
+    results = batch.run_batch(jobs, {}, processes=2, timeout=30, verbose=False)
+    assert [r["status"] for r in results] == ["failed"]*4
+
+def test_workers_crashing_right_after_reporting(tmp_path, fork_context):
+    # A worker that dies right after sending a result must not keep the results of other workers from arriving.
+    names = ["%02d_%s.stl" % (i, "ok" if i % 2 == 0 else "crash") for i in range(0, 24)]
+    jobs = make_jobs(tmp_path, [name.split("_")[1].replace(".stl", "") + "_" + name for name in names])
+    results = batch.run_batch(jobs, {}, processes=3, timeout=20, verbose=False)
+    for result in results:
+        assert result["status"] == ("failed" if os.path.basename(result["input"]).startswith("crash") else "ok")
+
+def test_timeout(tmp_path, fork_context):
+    jobs = make_jobs(tmp_path, ["a.stl", "slow.stl"])
+    results = batch.run_batch(jobs, {}, processes=1, timeout=1, verbose=False)
+    assert [r["status"] for r in results] == ["ok", "timeout"]
+
+def test_plan_jobs_avoids_collisions(tmp_path):
+    jobs = batch.plan_jobs(["one/model.stl", "two/model.stl", "batch_summary.stl"], str(tmp_path))
+    names = [os.path.basename(job["summary"]) for job in jobs]
+    assert names == ["model.json", "model_2.json", "batch_summary_2.json"]
+
+    with pytest.raises(geoexc.InvalidInputArgument):
+        batch.plan_jobs([str(tmp_path / "model.stl")], str(tmp_path))
+    with pytest.raises(geoexc.InvalidInputArgument):
+        batch.plan_jobs(["one/model.json"], str(tmp_path))
+
+def test_batch_runs_the_pipeline(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    write_binary(str(source / "model.stl"), generate("flat_bottom", 300))
+    (source / "broken.stl").write_bytes(b"garbage")
+
+    exit_code = batch.batch_main([str(source), str(tmp_path / "output"), "-j", "2", "-i", "3", "-or", "0", "0", "--no_cache"])
+    assert exit_code == 1
+    with open(str(tmp_path / "output" / batch.BATCH_SUMMARY_NAME), 'r') as f:
+        summary = json.load(f)
+    statuses = {os.path.basename(r["input"]): r["status"] for r in summary["results"]}
+    assert statuses == {"broken.stl": "failed", "model.stl": "ok"}
+    assert os.path.exists(str(tmp_path / "output" / "model.stl"))
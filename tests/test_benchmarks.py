@@ -0,0 +1,14 @@
+import os
+
+from geoalt_benchmarks.meshes import mesh_file
+from geoalt_benchmarks.suite import PHASES, run_case
+
+def test_run_case_times_every_phase_of_the_pipeline(tmp_path):
+    path = mesh_file(str(tmp_path), "multi_body", 1000, "binary")
+    case = run_case(path, "binary", str(tmp_path), iterations=3)
+
+    assert sorted(case["timings"]) == sorted(PHASES)
+    assert all(case["timings"][phase] >= 0 for phase in PHASES)
+    assert len(case["iterations"]) == 3
+    assert case["warnings_before"] > case["warnings_after"]
+    assert sorted(os.listdir(str(tmp_path))) == [os.path.basename(path)]
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from geoalt_geometry.edges import check_manifold
+from geoalt_geometry.mesh import IndexedMesh
+
+TETRAHEDRON_VERTICES = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1]], dtype=np.float64)
+TETRAHEDRON_FACES = np.array([[0, 2, 1], [0, 1, 3], [0, 3, 2], [1, 2, 3]])
+
+# Three fins sharing the edge between vertex 0 and 1. Only that edge is non-manifold.
+FINS_VERTICES = np.array([[0, 0, 0], [0, 0, 2], [1, 0, 1], [0, 1, 1], [-1, 0, 1]], dtype=np.float64)
+FINS_FACES = np.array([[0, 1, 2], [1, 0, 3], [0, 1, 4]])
+
+@pytest.mark.parametrize("vertices, faces, boundary, manifold, non_manifold", [
+    (TETRAHEDRON_VERTICES, TETRAHEDRON_FACES, 0, 6, 0),          # Closed
+    (TETRAHEDRON_VERTICES, TETRAHEDRON_FACES[:3], 3, 3, 0),      # Open at the bottom face
+    (TETRAHEDRON_VERTICES, TETRAHEDRON_FACES[:1], 3, 0, 0),      # A single triangle
+    (FINS_VERTICES, FINS_FACES, 6, 0, 1),
+    (FINS_VERTICES, FINS_FACES[:2], 4, 1, 0)
+])
+def test_edge_counts(vertices, faces, boundary, manifold, non_manifold):
+    report = check_manifold(IndexedMesh(vertices, faces))
+    assert report["boundary"] == boundary
+    assert report["manifold"] == manifold
+    assert report["non_manifold"] == non_manifold
+    assert report["edges"] == boundary + manifold + non_manifold
+    assert len(report["boundary_samples"]) == min(boundary, 5)
+    assert len(report["non_manifold_samples"]) == min(non_manifold, 5)
+
+def test_samples_are_edge_midpoints():
+    report = check_manifold(IndexedMesh(FINS_VERTICES, FINS_FACES), sample_count=10)
+    assert report["non_manifold_samples"] == [[0, 0, 1]]
+    assert sorted(report["boundary_samples"]) == sorted([[0.5, 0, 0.5], [0.5, 0, 1.5], [0, 0.5, 0.5], [0, 0.5, 1.5], [-0.5, 0, 0.5], [-0.5, 0, 1.5]])
+
+    # Only the first sample_count edges are sampled.
+    assert len(check_manifold(IndexedMesh(FINS_VERTICES, FINS_FACES), sample_count=2)["boundary_samples"]) == 2
+
+def test_duplicate_faces_are_non_manifold():
+    # A closed model with one face listed twice. The three edges of that face are shared by three faces.
+    report = check_manifold(IndexedMesh(TETRAHEDRON_VERTICES, np.concatenate([TETRAHEDRON_FACES, TETRAHEDRON_FACES[:1]])))
+    assert report["non_manifold"] == 3
+    assert report["manifold"] == 3
+    assert report["boundary"] == 0
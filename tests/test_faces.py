@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from geoalt_benchmarks.meshes import generate
+from geoalt_geometry.faces import evaluate_faces, overhang_weights, projected_areas
+
+def reference_check(triangle, phi_min, ignore_grounded, ground_level, ground_tolerance, angle_tolerance):
+    '''
+    The per-face problem check and weight of Face.check_for_problems and Face.calculate_weight, as they were before
+    the faces were evaluated as arrays. Returns the angle, grounded flag, bad angle flag and weight of the face.
+    '''
+    vector1 = triangle[1] - triangle[0]
+    vector2 = triangle[2] - triangle[0]
+    n = np.cross(vector1, vector2)
+    n_hat = n/np.linalg.norm(n)
+    angle = np.arccos(np.clip(np.dot(n_hat, [0, 0, -1]), -1.0, 1.0))
+
+    grounded = False
+    if angle >= 0 and angle < phi_min:
+        grounded = bool(np.all(np.abs(triangle[:, 2] - ground_level) <= ground_tolerance))
+        if grounded is True and ignore_grounded is False:
+            bad = False
+        elif (angle - phi_min)**2 < angle_tolerance**2:
+            bad = False
+        else:
+            bad = True
+    else:
+        bad = False
+
+    area = np.linalg.norm(np.cross([vector1[0], vector1[1], 0], [vector2[0], vector2[1], 0]))/2
+    weight_per_area = 0
+    if angle < 0.087:
+        weight_per_area = -80 if grounded else 100
+    elif angle < phi_min:
+        weight_per_area = 63.74 - angle * 42.96
+    elif phi_min < angle and angle < (np.pi/2 - 0.087):
+        weight_per_area = 21.23 - angle * 14.3
+    return angle, grounded, bad, weight_per_area * area
+
+def sample_triangles():
+    # Faces of every kind: flat and grounded, flat and floating, steep, near phi_min, upward facing.
+    rng = np.random.default_rng(3)
+    triangles = [generate(shape, 400, seed=1) for shape in ["overhang", "flat_bottom", "poles"]]
+    triangles.append(np.array([
+        [[0, 0, 0], [0, 1, 0], [1, 0, 0]],                      # Flat, on the ground
+        [[0, 0, 0.005], [0, 1, 0], [1, 0, 0.002]],              # Nearly flat, within the ground tolerance
+        [[0, 0, 1], [0, 1, 1], [1, 0, 1]],                      # Flat, floating
+        [[0, 0, 1], [0, 1, 1], [1, 0, 2]],                      # 45 degrees
+        [[0, 0, 1], [0, 1, 1], [1, 0, 1 + np.tan(np.pi/4 + 0.01)]],   # Within the angle tolerance of phi_min
+        [[0, 0, 1], [1, 0, 1], [0, 1, 1]],                      # Facing up
+    ], dtype=np.float64))
+    triangles.append(rng.normal(size=(300, 3, 3)))
+    return np.concatenate(triangles)
+
+@pytest.mark.parametrize("phi_min", [np.pi/4, np.pi/6])
+@pytest.mark.parametrize("ignore_grounded", [False, True])
+def test_evaluate_faces_matches_per_face_check(phi_min, ignore_grounded):
+    triangles = sample_triangles()
+    ground_level = triangles[:, :, 2].min()
+    parameters = dict(phi_min=phi_min, ignore_grounded=ignore_grounded, ground_level=0, ground_tolerance=0.01, angle_tolerance=0.017)
+    for level in [0, ground_level]:
+        parameters["ground_level"] = level
+        _, angles, grounded, bad, weights = evaluate_faces(triangles, **parameters)
+        expected = [reference_check(t, **parameters) for t in triangles]
+        assert np.any(bad) and np.any(~bad)
+        assert np.any(grounded) or level != 0
+
+        assert np.allclose(angles, [e[0] for e in expected])
+        assert np.array_equal(grounded, [e[1] for e in expected])
+        assert np.array_equal(bad, [e[2] for e in expected])
+        assert np.allclose(weights, [e[3] for e in expected])
+
+def test_overhang_weights_matches_per_face_weight():
+    triangles = sample_triangles()
+    n_hat, angles, grounded, _, _ = evaluate_faces(triangles)
+    weights = overhang_weights(angles, grounded, projected_areas(triangles))
+    assert np.allclose(weights, [reference_check(t, np.pi/4, False, 0, 0.01, 0.017)[3] for t in triangles])
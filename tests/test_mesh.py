@@ -0,0 +1,95 @@
+import numpy as np
+
+from geoalt_benchmarks.meshes import generate
+from geoalt_geometry.mesh import IndexedMesh, mesh_from_triangles
+
+# A square pyramid standing on its apex (vertex 4), closed by two faces on top.
+PYRAMID_VERTICES = np.array([[0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1], [0.5, 0.5, 0]], dtype=np.float64)
+PYRAMID_FACES = np.array([[0, 1, 4], [1, 2, 4], [2, 3, 4], [3, 0, 4], [0, 2, 1], [0, 3, 2]])
+
+def pyramid():
+    return IndexedMesh(PYRAMID_VERTICES, PYRAMID_FACES)
+
+def reference_poles(mesh, threshold=0.01):
+    '''
+    Pole flags from a plain loop over the faces: A vertex is a pole if every vertex it shares a face with is at least threshold above it.
+    '''
+    neighbours = [set() for i in range(0, len(mesh.vertices))]
+    for face in mesh.faces:
+        for a in face:
+            neighbours[a].update(int(b) for b in face if b != a)
+    z = mesh.vertices[:, 2]
+    return np.array([len(n) > 0 and all(z[b] - z[a] >= threshold for b in n) for a, n in enumerate(neighbours)])
+
+def test_vertex_adjacency():
+    mesh = pyramid()
+    mesh.build_vertex_adjacency()
+    assert mesh.neighbours(4).tolist() == [0, 1, 2, 3]
+    assert mesh.neighbours(0).tolist() == [1, 2, 3, 4]
+    assert mesh.neighbours(1).tolist() == [0, 2, 4]
+    assert np.diff(mesh.vertex_neighbour_pointers).tolist() == [4, 3, 4, 3, 4]
+
+    # A degenerate face does not make a vertex its own neighbour, and unused vertices have none.
+    mesh = IndexedMesh(np.zeros([4, 3]), [[0, 0, 1], [1, 2, 0]])
+    assert mesh.neighbours(0).tolist() == [1, 2]
+    assert mesh.neighbours(3).tolist() == []
+
+def test_poles_follow_moved_vertices():
+    mesh = pyramid()
+    assert mesh.is_pole.tolist() == [False, False, False, False, True]
+
+    # Flags are only refreshed by detect_poles.
+    mesh.move_vertex(4, [0.5, 0.5, 2])
+    assert mesh.is_pole[4]
+    mesh.detect_poles()
+    assert mesh.is_pole.tolist() == [False, False, False, False, False]
+
+    # Moved by the problem solver: The corner dips below the others.
+    mesh.stage_displacements([1], [[0, 0, -0.5]])
+    mesh.apply_displacements()
+    mesh.detect_poles()
+    assert mesh.is_pole.tolist() == [False, True, False, False, False]
+
+    # Neighbours closer than the threshold keep a vertex from being a pole.
+    mesh.move_vertex(1, [1, 0, 0.995])
+    assert mesh.detect_poles().tolist() == [False, False, False, False, False]
+    assert mesh.detect_poles(threshold=0.001).tolist() == [False, True, False, False, False]
+
+def test_poles_match_per_vertex_check():
+    rng = np.random.default_rng(5)
+    mesh = mesh_from_triangles(generate("poles", 2000, seed=5))
+    assert np.array_equal(mesh.is_pole, reference_poles(mesh))
+    assert np.any(mesh.is_pole)
+
+    for i in range(0, 3):
+        moved = rng.choice(len(mesh.vertices), size=len(mesh.vertices)//10, replace=False)
+        mesh.move_vertices(moved, mesh.vertices[moved] + rng.normal(scale=0.5, size=[len(moved), 3]))
+        mesh.detect_poles()
+        assert np.array_equal(mesh.is_pole, reference_poles(mesh))
+
+def test_face_adjacency():
+    mesh = pyramid()
+    mesh.build_face_adjacency()
+
+    # Listed edge by edge, in the order (v0, v1), (v1, v2), (v2, v0) of each face.
+    assert np.diff(mesh.face_neighbour_pointers).tolist() == [3]*6
+    expected = [[4, 1, 3], [4, 2, 0], [5, 3, 1], [5, 0, 2], [5, 1, 0], [3, 2, 4]]
+    for face, neighbours in enumerate(expected):
+        found, edges = mesh.adjacent_faces(face)
+        assert found.tolist() == neighbours
+        for neighbour, edge in zip(found, edges):
+            shared = set(mesh.faces[face].tolist()) & set(mesh.faces[neighbour].tolist())
+            assert set(mesh.edge_vertices[edge].tolist()) == shared
+
+def test_face_adjacency_of_open_and_non_manifold_edges():
+    # Three fins on one edge, and a fourth face hanging from the open side of the first fin.
+    vertices = np.array([[0, 0, 0], [0, 0, 2], [1, 0, 1], [0, 1, 1], [-1, 0, 1], [1, 0, 3]], dtype=np.float64)
+    mesh = IndexedMesh(vertices, [[0, 1, 2], [1, 0, 3], [0, 1, 4], [2, 1, 5]])
+    mesh.build_face_adjacency()
+
+    assert mesh.face_neighbour_pointers.tolist() == [0, 3, 5, 7, 8]
+    assert mesh.adjacent_faces(0)[0].tolist() == [1, 2, 3]
+    assert mesh.adjacent_faces(1)[0].tolist() == [0, 2]
+    assert mesh.adjacent_faces(2)[0].tolist() == [0, 1]
+    assert mesh.adjacent_faces(3)[0].tolist() == [0]
+    assert mesh.edge_vertices[mesh.adjacent_faces(3)[1]].tolist() == [[1, 2]]
@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+from geoalt_algorithms.orientation import BinnedOrientationEvaluator, OrientationEvaluator, adaptive_search, direction_to_rotation, grid_orientations, pruned_search, rank_orientations, rotation_matrices, sphere_direction_count, sphere_directions, sphere_orientations
+from geoalt_benchmarks.meshes import SHAPES, generate, slab
+from geoalt_geometry.mesh import mesh_from_triangles
+
+def random_directions(count, seed=0):
+    directions = np.random.default_rng(seed).normal(size=[count, 3])
+    return directions/np.linalg.norm(directions, axis=1)[:, None]
+
+def widest_gap(samples, directions):
+    '''
+    Returns the largest angle between any of the directions and the sample closest to it.
+    '''
+    closest = np.concatenate([(directions[i:i + 10000] @ samples.T).max(axis=1) for i in range(0, len(directions), 10000)])
+    return np.arccos(np.clip(closest, -1.0, 1.0)).max()
+
+@pytest.mark.parametrize("resolution", [np.pi/36, np.pi/18])
+def test_sphere_covers_the_grid_hemisphere_with_fewer_directions(resolution):
+    grid = rotation_matrices(*grid_orientations(resolution))[:, 2, :]
+    sphere = rotation_matrices(*sphere_orientations(resolution))[:, 2, :]
+    assert len(sphere) == sphere_direction_count(resolution)
+    assert len(sphere) < 0.7*len(grid)
+    assert np.allclose(sphere, sphere_directions(resolution))
+
+    # Both cover the same hemisphere, with gaps of about the same width.
+    assert grid[:, 0].max() <= 1e-12 and sphere[:, 0].max() <= 1e-12
+    directions = random_directions(100000)
+    directions = directions[directions[:, 0] <= 0]
+    assert widest_gap(sphere, directions) <= 1.02*widest_gap(grid, directions)
+
+def test_sphere_holds_the_axes():
+    directions = sphere_directions(np.pi/36)
+    for axis in [[0, 0, 1], [0, 0, -1], [0, 1, 0], [0, -1, 0], [-1, 0, 0]]:
+        assert np.any(np.all(np.isclose(directions, axis), axis=1))
+
+def test_direction_to_rotation_turns_directions_up():
+    directions = np.concatenate([random_directions(200), sphere_directions(np.pi/18)])
+    up = rotation_matrices(*direction_to_rotation(directions)) @ directions[:, :, None]
+    assert np.allclose(up[:, :, 0], [0, 0, 1])
+
+class RecordingEvaluator:
+    '''
+    Scores directions by their angle to a target direction, and remembers every batch it was asked for.
+    '''
+    def __init__(self, target):
+        self.target = np.asarray(target, dtype=np.float64)/np.linalg.norm(target)
+        self.batches = []
+
+    def evaluate_directions(self, directions, verbose=False):
+        self.batches.append(np.array(directions))
+        return np.arccos(np.clip(directions @ self.target, -1.0, 1.0)), np.zeros(len(directions), dtype=bool)
+
+@pytest.mark.parametrize("budget", [3, 40, 300, 1000])
+def test_adaptive_search_fits_the_budget_and_covers_the_hemisphere(budget):
+    evaluator = RecordingEvaluator([-0.3, 0.5, -0.8])
+    directions, weights, _ = adaptive_search(evaluator, resolution=np.pi/36, precision=np.pi/720, max_evaluations=budget)
+    assert len(directions) <= budget
+    assert len(directions) == len(weights) == sum(len(batch) for batch in evaluator.batches)
+
+    # The first pass is coarsened rather than cut short, so its lattice still runs from -X all the way to the rim.
+    coarse = evaluator.batches[0]
+    if budget >= 40:
+        assert len(coarse) > budget/2
+        lattice_count = len(coarse) - 1 - np.count_nonzero(coarse[:, 0] == 0)
+        assert np.isclose(coarse[-1, 0], -0.5/lattice_count)
+        hemisphere = random_directions(20000)
+        hemisphere = hemisphere[hemisphere[:, 0] <= 0]
+        assert widest_gap(coarse, hemisphere) < 2.5*np.sqrt(2*np.pi/len(coarse))
+
+def test_adaptive_search_refines_towards_the_best_direction():
+    target = np.array([-0.3, 0.5, -0.8])
+    evaluator = RecordingEvaluator(target)
+    directions, weights, _ = adaptive_search(evaluator, resolution=np.pi/18, precision=np.pi/720)
+    assert np.min(weights) < np.pi/720
+    assert len(evaluator.batches[0]) == sphere_direction_count(np.pi/18)
+
+@pytest.mark.parametrize("shape", sorted(SHAPES))
+@pytest.mark.parametrize("facets", [1000, 10000])
+def test_binned_and_exact_evaluators_pick_the_same_orientation(shape, facets):
+    mesh = mesh_from_triangles(generate(shape, facets))
+    directions = rotation_matrices(*grid_orientations(np.pi/36))[:, 2, :]
+    weights, grounded = OrientationEvaluator(mesh).evaluate_directions(directions)
+    binned_weights, binned_grounded = BinnedOrientationEvaluator(mesh, bin_size=np.pi/36).evaluate_directions(directions)
+
+    best, binned_best = np.argmin(weights), np.argmin(binned_weights)
+    assert binned_grounded[best] == grounded[best]
+    if grounded[best]:
+        # Models that are best printed on a flat side are scored exactly enough to find the very same orientation.
+        assert binned_best == best
+    else:
+        # The round ellipsoid has many orientations that are nearly as good. The binned choice needs to be one of them.
+        assert weights[binned_best] <= weights[best] + 0.01*abs(weights[best])
+
+def box():
+    # Flat sides only: few distinct normals, so the grounding pre-check of pruned_search is used.
+    return slab(np.full([12, 12], 4.0), np.zeros([12, 12]), size=10)
+
+MODELS = {
+    "overhang": lambda: generate("overhang", 600),
+    "multi_body": lambda: generate("multi_body", 800),
+    "box": box
+}
+
+@pytest.mark.parametrize("model", sorted(MODELS))
+@pytest.mark.parametrize("grounded_only", [False, True])
+def test_pruned_search_finds_the_same_best_orientations(model, grounded_only):
+    evaluator = OrientationEvaluator(mesh_from_triangles(MODELS[model]()))
+    x_angles, y_angles = grid_orientations(np.pi/18)
+    directions = rotation_matrices(x_angles, y_angles)[:, 2, :]
+
+    weights, grounded = evaluator.evaluate_directions(directions)
+    expected = rank_orientations(weights, grounded, grounded_only)[:10]
+
+    indices, pruned_weights, pruned_grounded = pruned_search(evaluator, directions, keep=10, grounded_only=grounded_only)
+    assert np.all(np.diff(indices) > 0)
+    assert np.array_equal(pruned_weights, weights[indices])
+    assert np.array_equal(pruned_grounded, grounded[indices])
+    assert np.array_equal(indices[rank_orientations(pruned_weights, pruned_grounded, grounded_only)[:10]], expected)
+
+def test_grounding_pre_check():
+    directions = rotation_matrices(*grid_orientations(np.pi/18))[:, 2, :]
+
+    # A box can only be grounded on one of its six sides.
+    possible = OrientationEvaluator(mesh_from_triangles(box())).may_be_grounded(directions)
+    assert 0 < np.count_nonzero(possible) < len(directions)/4
+    assert np.any(np.all(np.isclose(directions[possible], [0, 0, 1]), axis=1))
+
+    # Finely tessellated models are not checked at all.
+    assert OrientationEvaluator(mesh_from_triangles(generate("overhang", 600))).may_be_grounded(directions) is None
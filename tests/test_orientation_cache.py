@@ -0,0 +1,62 @@
+import os
+import time
+
+from geoalt_algorithms.orientation_cache import OrientationCache
+from geoalt_benchmarks.meshes import generate
+from geoalt_geometry.mesh import mesh_from_triangles
+
+ENTRY = {"x": 0.5, "y": 1.0, "weight": 12.5, "grounded": True}
+
+def test_miss_then_hit(tmp_path):
+    cache = OrientationCache(str(tmp_path))
+    mesh = mesh_from_triangles(generate("overhang", 200))
+    key = cache.key(mesh, phi_min=0.78, mode="grid")
+
+    assert cache.get(key) is None
+    cache.put(key, ENTRY)
+    assert cache.get(key) == ENTRY
+
+def test_key_follows_geometry_and_parameters(tmp_path):
+    cache = OrientationCache(str(tmp_path))
+    mesh = mesh_from_triangles(generate("overhang", 200))
+    key = cache.key(mesh, phi_min=0.78, mode="grid")
+
+    assert cache.key(mesh_from_triangles(generate("overhang", 200)), mode="grid", phi_min=0.78) == key
+    assert cache.key(mesh, phi_min=0.5, mode="grid") != key
+    assert cache.key(mesh, phi_min=0.78, mode="sphere") != key
+
+    mesh.vertices[0, 2] += 1e-6
+    assert cache.key(mesh, phi_min=0.78, mode="grid") != key
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = OrientationCache(str(tmp_path))
+    keys = ["a"*64, "b"*64, "c"*64]
+    for i, key in enumerate(keys):
+        cache.put(key, ENTRY)
+        past = time.time() - 100 + i
+        os.utime(os.path.join(str(tmp_path), key + ".json"), (past, past))
+
+    # Using the oldest entry makes it the most recent one.
+    assert cache.get(keys[0]) == ENTRY
+
+    entry_size = os.path.getsize(os.path.join(str(tmp_path), keys[0] + ".json"))
+    cache.max_size = 2*entry_size
+    cache.evict()
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == ENTRY
+    assert cache.get(keys[2]) == ENTRY
+
+def test_corrupt_entries_are_misses(tmp_path):
+    cache = OrientationCache(str(tmp_path))
+    key = "d"*64
+    cache.put(key, ENTRY)
+    with open(os.path.join(str(tmp_path), key + ".json"), 'w') as f:
+        f.write("{not json")
+    assert cache.get(key) is None
+    assert os.listdir(str(tmp_path)) == []
+
+def test_clear(tmp_path):
+    cache = OrientationCache(str(tmp_path))
+    cache.put("e"*64, ENTRY)
+    cache.clear()
+    assert cache.get("e"*64) is None
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from geoalt_algorithms.problemsolver import batch_single_face_algorithm, single_face_algorithm
+from geoalt_algorithms.zero_phi_strategy import ZeroPhiStrategy
+from geoalt_benchmarks.meshes import generate, write_binary
+from geoalt_stl.stl_parser import STLfile
+
+def load(tmp_path, triangles, orientation, name):
+    path = tmp_path / name
+    write_binary(str(path), triangles)
+    stl = STLfile(str(path))
+    faces = stl.load()
+    stl.rotate(orientation[0], axis='x')
+    stl.rotate(orientation[1], axis='y')
+    return stl, faces
+
+def flat_strip(segments, rng):
+    '''
+    A floating strip of flat overhang faces along X, with sloped skirts hanging from a random choice of its outer edges.
+    Every flat face shares vertices with the next ones, so injecting one leaves its neighbours alone.
+    '''
+    def top(i): return [i, 1, 1]
+    def bottom(i): return [i, 0, 1]
+    def top_skirt(i): return [i, 1.5, 0.2]
+    def bottom_skirt(i): return [i, -0.5, 0.2]
+
+    triangles = []
+    for i in range(0, segments):
+        triangles.append([bottom(i), top(i), bottom(i + 1)])
+        triangles.append([top(i), top(i + 1), bottom(i + 1)])
+        if rng.random() < 0.6:
+            triangles.append([bottom(i), bottom_skirt(i), bottom(i + 1)])
+            triangles.append([bottom_skirt(i), bottom_skirt(i + 1), bottom(i + 1)])
+        if rng.random() < 0.6:
+            triangles.append([top(i + 1), top(i), top_skirt(i)])
+            triangles.append([top_skirt(i + 1), top(i + 1), top_skirt(i)])
+    return np.array(triangles, dtype=np.float64)
+
+def per_face_step(faces, face_indices, phi_min, zero_phi_strategy):
+    for index in face_indices:
+        single_face_algorithm(faces.get_face(int(index)), atype="additive", phi_min=phi_min, zero_phi_strategy=zero_phi_strategy)
+
+def correct(stl, faces, step, phi_min, zero_phi_strategy, iterations):
+    '''
+    Run the correction loop of search_and_solve with the given step, and return the vertex array after every iteration.
+    '''
+    parameters = dict(phi_min=phi_min, ignore_grounded=False, ground_level=stl.ground_level, ground_tolerance=0.01, angle_tolerance=0.017)
+    faces.check_for_problems(**parameters)
+    history = []
+    for i in range(0, iterations):
+        faces.mesh.detect_poles()
+        step(faces, np.flatnonzero(faces.mesh.bad), phi_min=phi_min, zero_phi_strategy=zero_phi_strategy)
+        faces.mesh.apply_displacements()
+        faces.check_for_problems(only_moved=True, **parameters)
+        history.append(faces.mesh.vertices.copy())
+    return history
+
+@pytest.mark.parametrize("shape", ["overhang", "flat_bottom", "poles", "multi_body"])
+@pytest.mark.parametrize("orientation", [[0, 0], [0.3, -0.2]])
+@pytest.mark.parametrize("phi_min", [np.pi/4, np.pi/6])
+@pytest.mark.parametrize("zero_phi_strategy", [ZeroPhiStrategy.NONE, ZeroPhiStrategy.INJECT])
+def test_batch_matches_single_face_algorithm(tmp_path, shape, orientation, phi_min, zero_phi_strategy):
+    triangles = generate(shape, 800, seed=2)
+    expected = correct(*load(tmp_path, triangles, orientation, "per_face.stl"), per_face_step, phi_min, zero_phi_strategy, 10)
+    actual = correct(*load(tmp_path, triangles, orientation, "batch.stl"), batch_single_face_algorithm, phi_min, zero_phi_strategy, 10)
+
+    for iteration, (vertices, batch_vertices) in enumerate(zip(expected, actual)):
+        assert np.array_equal(batch_vertices, vertices), "The vertices differ after iteration %d" % (iteration + 1)
+
+@pytest.mark.parametrize("seed", range(0, 8))
+def test_batch_inject_matches_sequential_inject(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    stl, faces = load(tmp_path, flat_strip(30, rng), [0, 0], "strip.stl")
+    batch_stl, batch_faces = load(tmp_path, flat_strip(30, np.random.default_rng(seed)), [0, 0], "batch_strip.stl")
+
+    parameters = dict(ground_level=0, ground_tolerance=0.01, phi_min=np.pi/4, angle_tolerance=0.017)
+    faces.check_for_problems(**parameters)
+    batch_faces.check_for_problems(**parameters)
+
+    # The flat faces are visited in a random order, so that they block each other in chains.
+    face_indices = rng.permutation(np.flatnonzero(faces.mesh.bad))
+    assert np.count_nonzero(faces.mesh.angles[face_indices] == 0) >= 60
+
+    per_face_step(faces, face_indices, phi_min=np.pi/4, zero_phi_strategy=ZeroPhiStrategy.INJECT)
+    batch_single_face_algorithm(batch_faces, face_indices, phi_min=np.pi/4, zero_phi_strategy=ZeroPhiStrategy.INJECT)
+
+    assert np.array_equal(batch_faces.mesh.displacement_count, faces.mesh.displacement_count)
+    assert np.array_equal(batch_faces.mesh.displacement_sum, faces.mesh.displacement_sum)
+
+    # Some faces were injected, and some were left alone because an earlier face already moved one of their vertices.
+    injected = np.count_nonzero(faces.mesh.displacement_count)
+    assert 0 < injected < len(faces.mesh.vertices)//2
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from geoalt_benchmarks.meshes import generate, write_binary
+from geoalt_stl.stl_creator import STLCreator
+from geoalt_stl.stl_parser import STLfile
+import geoalt_exceptions.exceptions as geoexc
+
+
+@pytest.fixture
+def triangles():
+    # float32 values, so that binary files hold them exactly
+    return generate("overhang", 500).astype(np.float32).astype(np.float64)
+
+def reference_ascii(triangles):
+    '''
+    The ASCII file as the per-facet writer wrote it, before the facets were formatted in chunks.
+    '''
+    lines = ["solid GeoAlt\n"]
+    for t in triangles:
+        n = np.cross(t[1] - t[0], t[2] - t[0])
+        lines.append("\tfacet normal %f %f %f\n" % (n[0], n[1], n[2]))
+        lines.append("\t\touter loop\n")
+        for vertex in t:
+            lines.append("\t\t\tvertex %f %f %f\n" % (vertex[0], vertex[1], vertex[2]))
+        lines.append("\t\tendloop\n")
+        lines.append("\tendfacet\n")
+    lines.append("endsolid GeoAlt\n")
+    return "".join(lines).encode("utf-8")
+
+def load(path):
+    stl = STLfile(str(path))
+    return stl, stl.load()
+
+@pytest.fixture
+def faces(tmp_path, triangles):
+    write_binary(str(tmp_path / "source.stl"), triangles)
+    return load(tmp_path / "source.stl")[1]
+
+def test_binary_round_trip(tmp_path, triangles, faces):
+    path = tmp_path / "written.stl"
+    STLCreator(str(path), faces, file_format="binary").build_file()
+    assert STLfile(str(path)).detect_format() == "binary"
+    assert path.stat().st_size == 84 + 50*len(triangles)
+
+    stl, written = load(path)
+    assert np.array_equal(written.mesh.triangles(), faces.mesh.triangles())
+    n = faces.mesh.cross_products()
+    assert np.allclose(stl.normals, n/np.linalg.norm(n, axis=1)[:, None], atol=1e-6)
+
+@pytest.mark.parametrize("file_format", ["ascii", "binary"])
+def test_existing_file_is_not_overwritten(tmp_path, faces, file_format):
+    path = tmp_path / "written.stl"
+    path.write_bytes(b"keep")
+    with pytest.raises(geoexc.OutputFileExists):
+        STLCreator(str(path), faces, file_format=file_format).build_file()
+    assert path.read_bytes() == b"keep"
+
+def rotated(tmp_path, triangles):
+    # Rotated coordinates are no longer float32 values, and carry more decimals than any precision.
+    write_binary(str(tmp_path / "rotated.stl"), triangles)
+    stl, faces = load(tmp_path / "rotated.stl")
+    stl.rotate(0.3, axis='x')
+    stl.rotate(-0.7, axis='y')
+    return faces
+
+def test_ascii_at_default_precision_matches_per_facet_writer(tmp_path, triangles):
+    faces = rotated(tmp_path, triangles)
+    path = tmp_path / "written.stl"
+    STLCreator(str(path), faces, file_format="ascii").build_file()
+    assert path.read_bytes() == reference_ascii(faces.mesh.triangles())
+
+    _, written = load(path)
+    assert STLfile(str(path)).detect_format() == "ascii"
+    assert np.allclose(written.mesh.triangles(), faces.mesh.triangles(), rtol=0, atol=5e-7)
+
+@pytest.mark.parametrize("precision", [0, 3, 10])
+def test_ascii_round_trip_at_other_precisions(tmp_path, triangles, precision):
+    faces = rotated(tmp_path, triangles)
+    path = tmp_path / "written.stl"
+    STLCreator(str(path), faces, file_format="ascii", precision=precision).build_file()
+
+    # Every number is written with the requested amount of decimals.
+    numbers = [token for line in path.read_text().splitlines() if "vertex" in line or "normal" in line for token in line.split()[-3:]]
+    assert len(numbers) == 12*len(faces.mesh.faces)
+    assert all(len(number.partition(".")[2]) == precision for number in numbers)
+
+    _, written = load(path)
+    assert np.allclose(written.mesh.triangles(), faces.mesh.triangles(), rtol=0, atol=0.5*10.0**-precision + 1e-12)
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+
+from geoalt_benchmarks.meshes import generate, write_ascii, write_binary
+import geoalt_stl.stl_parser as stl_parser
+from geoalt_stl.stl_parser import STLfile
+import geoalt_exceptions.exceptions as geoexc
+
+
+@pytest.fixture
+def triangles():
+    # float32 values, so that binary files hold them exactly
+    return generate("flat_bottom", 500).astype(np.float32).astype(np.float64)
+
+def load_triangles(path):
+    stl = STLfile(str(path))
+    faces = stl.load()
+    return stl, faces.mesh.triangles()
+
+def test_binary_file(tmp_path, triangles):
+    path = tmp_path / "model.stl"
+    write_binary(str(path), triangles)
+    stl, loaded = load_triangles(path)
+    assert np.array_equal(loaded, triangles)
+    assert stl.ground_level == triangles[:, :, 2].min()
+
+def test_garbage_file(tmp_path):
+    path = tmp_path / "garbage.stl"
+    path.write_bytes(b"garbage")
+    with pytest.raises(geoexc.InvalidSTLFile):
+        STLfile(str(path)).load()
+
+def test_empty_binary_file(tmp_path):
+    path = tmp_path / "empty.stl"
+    path.write_bytes(b"\0"*84)
+    with pytest.raises(geoexc.InvalidSTLFile):
+        STLfile(str(path)).load()
+
+def test_truncated_binary_file(tmp_path, triangles):
+    path = tmp_path / "truncated.stl"
+    write_binary(str(path), triangles)
+    data = path.read_bytes()
+    path.write_bytes(data[:-30])
+    with pytest.raises(geoexc.InvalidSTLFile):
+        STLfile(str(path)).load()
+    with pytest.raises(geoexc.InvalidSTLFile):
+        list(STLfile(str(path)).iter_facets())
+
+def test_binary_header_with_huge_facet_count(tmp_path, triangles):
+    path = tmp_path / "huge.stl"
+    write_binary(str(path), triangles[:10])
+    data = bytearray(path.read_bytes())
+    data[80:84] = (2**32 - 1).to_bytes(4, byteorder='little')
+    path.write_bytes(bytes(data))
+    with pytest.raises(geoexc.InvalidSTLFile):
+        STLfile(str(path)).load()
+
+def test_ascii_and_binary_load_alike(tmp_path, triangles):
+    write_ascii(str(tmp_path / "model_ascii.stl"), triangles)
+    write_binary(str(tmp_path / "model_binary.stl"), triangles)
+    _, ascii_triangles = load_triangles(tmp_path / "model_ascii.stl")
+    _, binary_triangles = load_triangles(tmp_path / "model_binary.stl")
+    assert np.allclose(ascii_triangles, binary_triangles, atol=1e-6)
+
+def test_streamed_facets_match_loaded_ones(tmp_path, triangles):
+    for name, write in [("ascii.stl", write_ascii), ("binary.stl", write_binary)]:
+        write(str(tmp_path / name), triangles)
+        corners = np.concatenate([c for _, c in STLfile(str(tmp_path / name)).iter_facets(chunk_size=100)])
+        assert np.allclose(corners, triangles, atol=1e-6)
+
+def test_solid_names_holding_keywords(tmp_path):
+    path = tmp_path / "multi.stl"
+    path.write_text(
+        "solid vertex normal\n"
+        "  facet normal 0 0 -1\n    outer loop\n      vertex 0 0 0\n      vertex 0 1 0\n      vertex 1 0 0\n    endloop\n  endfacet\n"
+        "endsolid vertex normal\n"
+        "solid normal 2\n"
+        "  facet normal 0 0 1\n    outer loop\n      vertex 0 0 1\n      vertex 1 0 1\n      vertex 0 1 1\n    endloop\n  endfacet\n"
+        "endsolid normal 2\n")
+    _, loaded = load_triangles(path)
+    assert loaded.shape == (2, 3, 3)
+    assert np.array_equal(loaded[1], [[0, 0, 1], [1, 0, 1], [0, 1, 1]])
+
+def test_broken_ascii_file_is_not_read_as_binary(tmp_path):
+    path = tmp_path / "broken.stl"
+    path.write_text("solid broken\n  facet normal 0 0 1\n    outer loop\n      vertex 0 0 0\n      vertex 1 0 0\n    endloop\n  endfacet\nendsolid broken\n")
+    with pytest.raises(geoexc.InvalidSTLFile, match="three vertices"):
+        STLfile(str(path)).load()
+
+@pytest.mark.parametrize("padding", [0, 3, 50, 1000])
+def test_binary_file_starting_with_solid(tmp_path, triangles, padding):
+    # Some exporters start the header of binary files with "solid", and some write bytes after the last facet.
+    path = tmp_path / "solid_header.stl"
+    write_binary(str(path), triangles)
+    data = bytearray(path.read_bytes())
+    data[0:11] = b"solid model"
+    path.write_bytes(bytes(data) + b"\0"*padding)
+
+    _, loaded = load_triangles(path)
+    assert np.array_equal(loaded, triangles)
+    corners = np.concatenate([c for _, c in STLfile(str(path)).iter_facets()])
+    assert np.array_equal(corners, triangles)
+
+def test_ascii_file_is_closed(tmp_path, triangles, monkeypatch):
+    opened = []
+    def tracking_open(*args, **kwargs):
+        opened.append(open(*args, **kwargs))
+        return opened[-1]
+    monkeypatch.setattr(stl_parser, "open", tracking_open, raising=False)
+
+    path = tmp_path / "model.stl"
+    write_ascii(str(path), triangles)
+    facets = STLfile(str(path)).__iter_ascii_facets__(chunk_size=1000)
+    next(facets)
+    facets.close()
+
+    broken = tmp_path / "broken.stl"
+    broken.write_bytes(path.read_bytes().replace(b"vertex", b"vertex x", 1))
+    with pytest.raises(geoexc.InvalidSTLFile):
+        STLfile(str(broken)).load_ascii(chunk_size=1000)
+
+    assert len(opened) > 0
+    assert all(f.closed for f in opened)
@@ -0,0 +1,52 @@
+import numpy as np
+
+from geoalt_geometry.vertices import Vertex, weld_vertices, weld_vertices_incrementally
+
+def test_points_across_cell_boundaries_are_welded():
+    tolerance = Vertex.tolerance
+    points = np.array([
+        [0, 0, 0],
+        [-0.4*tolerance, -0.4*tolerance, -0.4*tolerance],     # Neighbouring cell in every axis
+        [5*tolerance - 1e-9, 1, 1],
+        [5*tolerance + 1e-9, 1, 1],                            # Next cell in x only
+        [1, 1, 1],
+        [1 + 1.5*tolerance, 1, 1],                             # Neighbouring cell, but too far away
+    ])
+    index, vertices = weld_vertices(points)
+    assert index.tolist() == [0, 0, 1, 1, 2, 3]
+    assert np.array_equal(vertices, points[[0, 2, 4, 5]])
+
+def test_points_with_equal_coordinate_sums_stay_apart():
+    # The sum hash put all of these in the same bucket.
+    points = np.array([[1, 2, 3], [3, 2, 1], [2, 2, 2], [6, 0, 0], [0, 0, 6], [1, 2, 3]], dtype=np.float64)
+    index, vertices = weld_vertices(points)
+    assert index.tolist() == [0, 1, 2, 3, 4, 0]
+    assert len(vertices) == 5
+
+def test_near_points_with_different_coordinate_sums_are_welded():
+    # The sum hash kept these apart, since their sums differ by more than the tolerance.
+    tolerance = Vertex.tolerance
+    points = np.array([[0, 0, 0], [0.9*tolerance, 0.9*tolerance, 0.9*tolerance], [-0.9*tolerance, 0.9*tolerance, -0.9*tolerance]])
+    index, _ = weld_vertices(points)
+    assert index.tolist() == [0, 0, 0]
+
+def test_vertices_are_ordered_by_first_occurrence():
+    points = np.array([[5, 5, 5], [-1, 0, 0], [5, 5, 5.0002], [-1, 0, 0], [0, 0, 0]])
+    index, vertices = weld_vertices(points)
+    assert index.tolist() == [0, 1, 0, 1, 2]
+    assert np.array_equal(vertices, points[[0, 1, 4]])
+
+def test_bulk_and_incremental_welding_agree():
+    rng = np.random.default_rng(7)
+    tolerance = Vertex.tolerance
+    # Points on a grid much coarser than the tolerance, jittered well within it, so that the result does not depend on order.
+    base = rng.integers(-20, 20, size=[400, 3]) * 0.01
+    points = np.concatenate([base, base + rng.uniform(-0.4, 0.4, size=base.shape)*tolerance])
+    points = points[rng.permutation(len(points))]
+
+    index, vertices = weld_vertices(points)
+    expected_index, expected_vertices = weld_vertices_incrementally(points)
+    assert np.array_equal(index, expected_index)
+    assert np.array_equal(vertices, expected_vertices)
+    assert len(vertices) == len(np.unique(base, axis=0))
+    assert np.all(np.abs(vertices[index] - points) <= tolerance)
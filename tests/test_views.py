@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from geoalt_benchmarks.meshes import write_binary
+from geoalt_geometry.faces import Face
+from geoalt_geometry.edges import Edge
+from geoalt_stl.stl_parser import STLfile
+
+TETRAHEDRON = np.array([
+    [[0, 0, 0], [0, 1, 0], [1, 0, 0]],
+    [[0, 0, 0], [1, 0, 0], [0, 0, 1]],
+    [[0, 0, 0], [0, 0, 1], [0, 1, 0]],
+    [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+], dtype=np.float64)
+
+def load(tmp_path, triangles, name="model.stl"):
+    path = tmp_path / name
+    write_binary(str(path), triangles)
+    stl = STLfile(str(path))
+    return stl, stl.load()
+
+def test_views_are_cached(tmp_path):
+    _, faces = load(tmp_path, TETRAHEDRON)
+    assert faces.get_face(2) is faces.get_face(2)
+    assert faces.faces[2] is faces.get_face(2)
+    assert list(faces)[3] is faces.get_face(3)
+    assert faces.get_vertex(1) is faces.get_vertex(1)
+    assert faces.edge_collection.get_edge(4) is faces.edge_collection.get_edge(4)
+
+    # Views reached through other views are the same objects.
+    face = faces.get_face(0)
+    assert [v is faces.get_vertex(int(i)) for v, i in zip(face.vertices, faces.mesh.faces[0])] == [True]*3
+    assert face.edge1.vertex1 is faces.get_vertex(int(faces.mesh.edge_vertices[face.edge1.index, 0]))
+    assert all(any(f is face for f in edge.faces) for edge in face.get_edges())
+    assert len(faces.edge_collection) == 6
+    assert all(len(edge.faces) == 2 for edge in faces.edge_collection)
+
+def test_views_read_and_write_the_mesh(tmp_path):
+    stl, faces = load(tmp_path, TETRAHEDRON)
+    mesh = faces.mesh
+    face = faces.get_face(1)
+
+    face.grounded = True
+    face.weight = 12.5
+    assert mesh.grounded[1] and mesh.weights[1] == 12.5
+
+    vertex = face.vertices[2]
+    vertex.set_array([0, 0, 2])
+    assert np.array_equal(mesh.vertices[vertex.index], [0, 0, 2])
+    assert np.array_equal(face.get_vertices_as_arrays()[2], [0, 0, 2])
+    assert mesh.take_moved_vertices().tolist() == [vertex.index]
+
+    # The loader shares its arrays with the mesh, so rotating the model moves the views along.
+    assert stl.vertices is mesh.vertices
+    stl.rotate(np.pi/2, "x")
+    assert np.allclose(vertex.get_array(), [0, -2, 0])
+
+def test_vertex_views_stay_in_sets_while_moving(tmp_path):
+    _, faces = load(tmp_path, TETRAHEDRON)
+    vertices = set(faces.get_vertex_collection())
+    vertex = faces.get_vertex(0)
+    vertex.set_array([0.5, 0.5, -3])
+    assert vertex in vertices
+    assert len(vertices) == 4
+
+def test_append_welds_the_face_to_the_model(tmp_path):
+    stl, faces = load(tmp_path, TETRAHEDRON[:3])
+    other_stl, other = load(tmp_path, TETRAHEDRON[3:], name="other.stl")
+    other.check_for_problems()
+    source = other.get_face(0)
+    edge_count = len(faces.edge_collection)
+    before = faces.mesh.vertices.copy(), faces.mesh.faces.copy()
+    kept = faces.get_face(0)
+
+    face = faces.append(source)
+    assert isinstance(face, Face)
+    assert face is faces.get_face(3)
+    assert faces.get_face(0) is kept
+
+    # All corners already exist, so the face reuses the vertices of the model without changing any indices.
+    assert np.array_equal(faces.mesh.vertices, before[0])
+    assert np.array_equal(faces.mesh.faces[:3], before[1])
+    assert np.array_equal(face.get_vertices_as_arrays(), TETRAHEDRON[3])
+    assert stl.vertices is faces.mesh.vertices and stl.normals is faces.mesh.file_normals
+
+    # The classification and file normal are copied along, and the new face closes the model.
+    assert face.angle == source.angle and face.weight == source.weight
+    assert face.grounded == source.grounded and face.has_bad_angle == source.has_bad_angle
+    assert np.array_equal(faces.mesh.file_normals[3], other.mesh.file_normals[0])
+    assert len(faces.edge_collection) == edge_count
+    assert all(len(edge.faces) == 2 for edge in faces.edge_collection)
+
+    with pytest.raises(TypeError):
+        faces.append(TETRAHEDRON[3])
+
+def test_append_adds_new_vertices_after_the_existing_ones(tmp_path):
+    _, faces = load(tmp_path, TETRAHEDRON[:1])
+    _, other = load(tmp_path, np.array([[[0, 0, 0], [1, 0, 0], [0, 0, 5]]]), name="other.stl")
+    face = faces.append(other.get_face(0))
+    assert faces.mesh.faces[face.index].tolist() == [0, 2, 3]
+    assert np.array_equal(faces.mesh.vertices[3], [0, 0, 5])
+    assert len(faces.mesh.displacement_count) == 4
+
+def test_add_edge(tmp_path):
+    _, faces = load(tmp_path, TETRAHEDRON[:2])
+    edges = faces.edge_collection
+    edge = edges.get_edge(1)
+    assert edges.add(edge) is edge
+    assert edges.add(Edge(faces, 1)) is edge
+
+    # Vertices 1 and 3 only share an edge once the last face is added.
+    _, other = load(tmp_path, TETRAHEDRON, name="other.stl")
+    missing = next(edge for edge in other.edge_collection if edge.key() == (1, 3))
+    with pytest.raises(ValueError):
+        edges.add(missing)
+    with pytest.raises(TypeError):
+        edges.add((1, 3))